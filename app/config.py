@@ -7,8 +7,100 @@ class Settings(BaseSettings):
 
     secret_key: str
     access_token_expire_minutes: int = 720
+    # 可访问运维接口（全局指标）的用户 DID，环境变量为 JSON 数组
+    operator_dids: list[str] = []
 
     database_url: str
+    # SQLite 写锁被占用时的最长等待时间；写事务持锁约 20 ms，突发数百个并发写请求时
+    # 排在后面的需要等待数秒，超时即返回 500
+    sqlite_busy_timeout_seconds: float = 30.0
+
+    # 计量（write-behind）：内存累计访问次数/传输字节，定期批量落库
+    metering_flush_interval_seconds: float = 5.0
+    # 未落库的访问次数达到该值时立即触发刷盘，限制崩溃时最多丢失的用量
+    metering_max_pending_accesses: int = 1000
+
+    # 事件推送（SSE）：每个用户的事件在内存中保留最近 N 条，断线重连时按 Last-Event-ID 补发
+    event_replay_buffer_size: int = 1000
+    # 单个连接积压的未发送事件上限，超出后断开该连接，由客户端重连补发
+    event_queue_size: int = 100
+    event_heartbeat_seconds: float = 15.0
+
+    # 自动审批：新请求进入有界队列，按批在一个事务中处理；队列满时由定期扫描补偿
+    auto_approval_batch_size: int = 100
+    auto_approval_queue_size: int = 1000
+    auto_approval_sweep_interval_seconds: float = 30.0
+
+    # 合约上链：任务持久化在 deployment_jobs 表，后台按批提交到链后端
+    chain_backend: str = "simulated"
+    # 模拟链每出一个块 / 每笔交易的耗时（秒），用于模拟真实链的延迟
+    chain_block_time_seconds: float = 0.0
+    chain_tx_time_seconds: float = 0.0
+    deployment_batch_size: int = 50
+    deployment_poll_interval_seconds: float = 2.0
+    deployment_max_attempts: int = 3
+
+    # Merkle 锚定：定期把尚未锚定的 active 合约摘要构建为一棵树，只把树根写入链上
+    anchor_interval_seconds: float = 300.0
+    anchor_max_leaves: int = 100000
+
+    # 合约过期扫描：按 (status, expires_at) 索引分批把到期的 active 合约置为 expired，
+    # 每批一个短事务，避免长时间持有 SQLite 写锁
+    expiry_sweep_interval_seconds: float = 60.0
+    expiry_batch_size: int = 500
+
+    # 事务性 outbox：生命周期事件与状态变更在同一事务写入，后台按批投递到各 sink
+    # 启用的 sink，逗号分隔：bus（进程内订阅，需有代码订阅 outbox_bus）、log（JSON Lines 文件）、
+    # webhook（HTTP POST）
+    outbox_sinks: str = "log"
+    outbox_batch_size: int = 200
+    outbox_poll_interval_seconds: float = 1.0
+    # 所有 sink 都已投递的事件定期删除（每个聚合保留最后一条）
+    outbox_prune_interval_seconds: float = 60.0
+    outbox_prune_batch_size: int = 1000
+    outbox_log_path: str = "outbox_events.jsonl"
+    outbox_webhook_url: str | None = None
+    outbox_webhook_timeout_seconds: float = 5.0
+
+    # Idempotency-Key：创建接口第一次成功执行的响应在内存中保留的时间及键数上限
+    idempotency_ttl_seconds: float = 86400.0
+    idempotency_max_keys: int = 100000
+    idempotency_sweep_interval_seconds: float = 60.0
+
+    # restful 数据资源代理：每个上游一个连接池，连接数按上游限制
+    proxy_max_connections_per_upstream: int = 50
+    proxy_max_keepalive_per_upstream: int = 20
+    proxy_keepalive_expiry_seconds: float = 30.0
+    proxy_connect_timeout_seconds: float = 5.0
+    # 读 / 写超时针对单次读写之间的间隔，不限制整个传输的时长
+    proxy_read_timeout_seconds: float = 30.0
+    proxy_write_timeout_seconds: float = 30.0
+    # 上游连接池已满时等待空闲连接的时间，超时返回 503
+    proxy_pool_timeout_seconds: float = 5.0
+
+    # s3 数据资源传输：连接器用这组凭证访问对象存储（SigV4），未配置时 s3 传输接口返回 503
+    # s3_endpoint_url 为空时访问 AWS（https://s3.<region>.amazonaws.com），MinIO 等填写其地址
+    s3_endpoint_url: str | None = None
+    s3_access_key_id: str | None = None
+    s3_secret_access_key: str | None = None
+    s3_default_region: str = "us-east-1"
+    # 凭证由所有连接器共享：对象只能位于这些桶中、键以 "<连接器 ID>/" 开头；环境变量为 JSON 数组，
+    # 为空时所有 s3 数据资源的传输都被拒绝
+    s3_allowed_buckets: list[str] = []
+    # 分片大小与同时在途的分片数；内存中最多保留 (concurrency + 1) 个分片
+    # S3 要求除最后一个分片外每个分片不小于 5 MiB
+    s3_part_size_bytes: int = 8 * 1024 * 1024
+    s3_transfer_concurrency: int = 8
+    # 整个连接器共享的对象存储连接池大小，应不小于 并发传输数 × s3_transfer_concurrency
+    s3_max_connections: int = 64
+    s3_timeout_seconds: float = 60.0
+
+    # 传输加密：合约带 encryption 规则时下载流按分块 AES-256-GCM 加密
+    # 主密钥（base64），为空时由 secret_key 派生；每个合约的密钥再由主密钥按合约 ID 派生
+    transfer_encryption_master_key: str | None = None
+    transfer_encryption_chunk_size: int = 1024 * 1024
+    # 加密线程数，0 表示 CPU 核数
+    transfer_encryption_workers: int = 0
 
     class Config:
         env_file = ".env"
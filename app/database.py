@@ -1,3 +1,4 @@
+from sqlalchemy import event, inspect, literal
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from .config import settings
@@ -7,6 +8,49 @@ SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSe
 
 Base = declarative_base()
 
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """WAL：读不阻塞写；busy_timeout：写锁被占用时等待而不是立即返回 database is locked"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_seconds * 1000)}")
+        cursor.close()
+
+
 async def get_session():
     async with SessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def _add_missing_columns(connection) -> None:
+    """已有表缺少的列用 ALTER TABLE ADD COLUMN 补齐，缺少的表和索引直接创建（可重复执行）"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    dialect = connection.dialect
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, (bool, int, float, str)):
+                ddl += " DEFAULT " + str(literal(default).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            # 没有常量默认值的 NOT NULL 列无法加到已有行上，按可空添加，由应用写入
+            connection.exec_driver_sql(ddl)
+    Base.metadata.create_all(connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+async def upgrade_schema() -> None:
+    """启动时把旧数据库升级到当前模型：新增的表、列和索引（仓库没有迁移工具）"""
+    async with engine.begin() as connection:
+        await connection.run_sync(_add_missing_columns)
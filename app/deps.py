@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import jwt
 
+from .config import settings
 from .database import get_session
 from .models import User
 from .security import decode_access_token
@@ -16,7 +17,24 @@ async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     session: AsyncSession = Depends(get_session),
 ) -> User:
-    token = credentials.credentials
+    return await authenticate_token(session, credentials.credentials)
+
+
+async def get_operator(current_user: User = Depends(get_current_user)) -> User:
+    """运维接口（全局指标等）：仅 settings.operator_dids 中的用户可访问"""
+    if current_user.did not in settings.operator_dids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operator access required")
+    return current_user
+
+
+async def get_token_subject(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> str:
+    """只校验 JWT 签名与有效期并返回用户 ID，不查询数据库；用于热路径接口"""
+    return decode_token_subject(credentials.credentials)
+
+
+def decode_token_subject(token: str) -> str:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -37,6 +55,12 @@ async def get_current_user(
     user_id: str | None = payload.get("sub")
     if not user_id:
         raise credentials_exception
+    return user_id
+
+
+async def authenticate_token(session: AsyncSession, token: str) -> User:
+    """校验 JWT 并加载用户；供不经过依赖注入的场景（如长连接）使用"""
+    user_id = decode_token_subject(token)
 
     result = await session.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
@@ -1,9 +1,88 @@
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from .config import settings
-from .routers import auth, identity, offerings, contracts,policy_templates, contract_templates, data_requests
+from .database import SessionLocal, upgrade_schema
+from .routers import auth, identity, offerings, contracts,policy_templates, contract_templates, data_requests, events, auto_approval, dashboard, outbox, data_plane
+from .services.access_index import active_contract_index
+from .services.anchoring import merkle_anchorer
+from .services.auto_approval import auto_approval_worker
+from .services.deployments import deployment_worker
+from .services.expiry import expiry_sweeper
+from .services.idempotency import IdempotencyMiddleware, idempotency_store
+from .services.interval_index import contract_validity_index
+from .services.ip_index import ip_restriction_index
+from .services.metering import usage_meter
+from .services.odrl import backfill_odrl_artifacts
+from .services.outbox import outbox_relay
+from .services.proxy import upstream_pool
+from .services.reference_counts import rebuild_reference_counts
+from .services.s3_transfer import s3_transfer
+from .services.status_counters import rebuild_status_counters
+from .services.template_versions import backfill_versions
+from .services.transfer_encryption import transfer_encryption
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 旧数据库补齐新增的表和列，之后的回填依赖这些列
+    await upgrade_schema()
+
+    # 加载内存索引
+    async with SessionLocal() as session:
+        await backfill_versions(session)
+        await backfill_odrl_artifacts(session)
+        await rebuild_reference_counts(session)
+        await rebuild_status_counters(session)
+        await ip_restriction_index.load(session)
+        await contract_validity_index.load(session)
+        await active_contract_index.load(session)
+
+    # 启动后台任务
+    tasks = [
+        asyncio.create_task(usage_meter.run()),
+        asyncio.create_task(auto_approval_worker.run()),
+        asyncio.create_task(deployment_worker.run()),
+        asyncio.create_task(merkle_anchorer.run()),
+        asyncio.create_task(expiry_sweeper.run()),
+        asyncio.create_task(outbox_relay.run()),
+        asyncio.create_task(idempotency_store.run(settings.idempotency_sweep_interval_seconds)),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    # 关闭前把未落库的用量刷盘
+    await usage_meter.flush()
+    await upstream_pool.aclose()
+    await s3_transfer.aclose()
+    transfer_encryption.shutdown()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
-app = FastAPI(title=settings.app_name)
+# 创建接口支持 Idempotency-Key（客户端超时重试不会重复创建）
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    paths={
+        settings.api_prefix + path
+        for path in (
+            "/contracts",
+            "/data-requests",
+            "/offerings",
+            "/policy-templates",
+            "/contract-templates",
+            "/identity/did/register",
+            "/auto-approval/rules",
+        )
+    },
+)
 
 app.include_router(auth.router)
 app.include_router(identity.router)
@@ -12,6 +91,11 @@ app.include_router(contracts.router)
 app.include_router(policy_templates.router)
 app.include_router(contract_templates.router)
 app.include_router(data_requests.router)
+app.include_router(events.router)
+app.include_router(auto_approval.router)
+app.include_router(dashboard.router)
+app.include_router(outbox.router)
+app.include_router(data_plane.router)
 
 @app.get("/")
 async def root():
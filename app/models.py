@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, ForeignKey, String, Text, JSON
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String, Text, JSON, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from .database import Base
@@ -50,7 +50,9 @@ class Connector(Base):
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
 
-      owner_user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False)
+      owner_user_id: Mapped[str] = mapped_column(
+          String, ForeignKey("users.id"), nullable=False, index=True
+      )
       data_space_id: Mapped[str] = mapped_column(String, ForeignKey("data_spaces.id"), nullable=False)
 
       owner: Mapped["User"] = relationship("User", back_populates="connectors")
@@ -89,7 +91,9 @@ class DataOffering(Base):
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
 
-      connector_id: Mapped[str] = mapped_column(String, ForeignKey("connectors.id"), nullable=False)
+      connector_id: Mapped[str] = mapped_column(
+          String, ForeignKey("connectors.id"), nullable=False, index=True
+      )
       connector: Mapped["Connector"] = relationship("Connector", back_populates="offerings")
       data_requests: Mapped[list["DataRequest"]] = relationship(
           "DataRequest", back_populates="data_offering"
@@ -135,6 +139,12 @@ class PolicyTemplate(Base):
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
       updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+      # 当前内容对应的不可变版本
+      version_hash: Mapped[str | None] = mapped_column(
+          String(64), ForeignKey("policy_template_versions.content_hash")
+      )
+      # 引用该策略模板的合约模板数
+      reference_count: Mapped[int] = mapped_column(default=0, nullable=False)
 
       connector_id: Mapped[str] = mapped_column(
           String, ForeignKey("connectors.id"), nullable=False
@@ -157,11 +167,16 @@ class ContractTemplate(Base):
       description: Mapped[str] = mapped_column(Text, nullable=False)
       contract_type: Mapped[str] = mapped_column(String(20), nullable=False)
       status: Mapped[str] = mapped_column(String(20), default="draft")
+      # 基于该合约模板创建的合约数（合约不会被删除，即引用该模板的合约数）
       usage_count: Mapped[int] = mapped_column(default=0)
       created_at: Mapped[datetime] = mapped_column(
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
       updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+      # 当前内容对应的不可变版本
+      version_hash: Mapped[str | None] = mapped_column(
+          String(64), ForeignKey("contract_template_versions.content_hash")
+      )
 
       connector_id: Mapped[str] = mapped_column(
           String, ForeignKey("connectors.id"), nullable=False
@@ -174,6 +189,49 @@ class ContractTemplate(Base):
       contracts: Mapped[list["Contract"]] = relationship(
           "Contract", back_populates="contract_template"
       )
+      artifacts: Mapped[list["ContractTemplateArtifact"]] = relationship(
+          "ContractTemplateArtifact", cascade="all, delete-orphan"
+      )
+
+
+class PolicyTemplateVersion(Base):
+      """策略模板的不可变版本，以规范化内容的 SHA-256 标识，相同内容只存一份"""
+      __tablename__ = "policy_template_versions"
+
+      content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+      document: Mapped[dict] = mapped_column(JSON, nullable=False)
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+
+
+class ContractTemplateVersion(Base):
+      """合约模板的不可变版本，文档中引用策略模板版本的 hash"""
+      __tablename__ = "contract_template_versions"
+
+      content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+      document: Mapped[dict] = mapped_column(JSON, nullable=False)
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+
+
+class ContractTemplateArtifact(Base):
+      """合约模板某一版本的预编译制品（如 ODRL JSON-LD），digest 用作 ETag"""
+      __tablename__ = "contract_template_artifacts"
+
+      contract_template_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contract_templates.id"), primary_key=True
+      )
+      version_hash: Mapped[str] = mapped_column(
+          String(64), ForeignKey("contract_template_versions.content_hash"), primary_key=True
+      )
+      format: Mapped[str] = mapped_column(String(20), primary_key=True)
+      body: Mapped[str] = mapped_column(Text, nullable=False)
+      digest: Mapped[str] = mapped_column(String(64), nullable=False)
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
 
 
 class ContractTemplatePolicy(Base):
@@ -189,6 +247,16 @@ class ContractTemplatePolicy(Base):
 
 class DataRequest(Base):
       __tablename__ = "data_requests"
+      __table_args__ = (
+          # 同一消费者连接器对同一数据资源最多只有一个 pending 请求（重复提交时返回已有请求）
+          Index(
+              "uq_data_requests_pending_consumer_offering",
+              "consumer_connector_id",
+              "data_offering_id",
+              unique=True,
+              sqlite_where=text("status = 'pending'"),
+          ),
+      )
 
       id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
       purpose: Mapped[str] = mapped_column(Text, nullable=False)
@@ -198,12 +266,16 @@ class DataRequest(Base):
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
       updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+      # 自动审批评估后未命中任何规则（或单独重试仍失败）的时间；提供者新增规则时清空，重新评估
+      auto_approval_evaluated_at: Mapped[datetime | None] = mapped_column(DateTime)
+      # 自动审批单独重试仍失败时的错误
+      auto_approval_error: Mapped[str | None] = mapped_column(Text)
 
       data_offering_id: Mapped[str] = mapped_column(
-          String, ForeignKey("data_offerings.id"), nullable=False
+          String, ForeignKey("data_offerings.id"), nullable=False, index=True
       )
       consumer_connector_id: Mapped[str] = mapped_column(
-          String, ForeignKey("connectors.id"), nullable=False
+          String, ForeignKey("connectors.id"), nullable=False, index=True
       )
 
       data_offering: Mapped["DataOffering"] = relationship("DataOffering", back_populates="data_requests")
@@ -213,6 +285,12 @@ class DataRequest(Base):
 
 class Contract(Base):
       __tablename__ = "contracts"
+      __table_args__ = (
+          # 按消费者查询有效合约（有效期区间索引的持久化支撑）
+          Index("ix_contracts_consumer_status_expires", "consumer_connector_id", "status", "expires_at"),
+          # 过期扫描：按到期时间顺序读取 active 合约
+          Index("ix_contracts_status_expires", "status", "expires_at"),
+      )
 
       id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
       name: Mapped[str] = mapped_column(String(150), nullable=False)
@@ -225,6 +303,8 @@ class Contract(Base):
           DateTime, default=lambda: datetime.now(timezone.utc)
       )
       updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+      # 生效时间：确认为 active 时写入一次，之后不再修改（有效期窗口的起点）
+      activated_at: Mapped[datetime | None] = mapped_column(DateTime)
 
       provider_connector_id: Mapped[str] = mapped_column(
           String, ForeignKey("connectors.id"), nullable=False
@@ -241,6 +321,10 @@ class Contract(Base):
       data_request_id: Mapped[str | None] = mapped_column(
           String, ForeignKey("data_requests.id")
       )
+      # 创建合约时固定的合约模板版本，之后模板修改不影响本合约
+      contract_template_version_hash: Mapped[str | None] = mapped_column(
+          String(64), ForeignKey("contract_template_versions.content_hash")
+      )
 
       provider_connector: Mapped["Connector"] = relationship(
           "Connector", foreign_keys=[provider_connector_id], back_populates="provided_contracts"
@@ -256,4 +340,170 @@ class Contract(Base):
       )
       data_request: Mapped["DataRequest | None"] = relationship(
           "DataRequest", back_populates="contract"
-      )
\ No newline at end of file
+      )
+
+
+class ContractUsage(Base):
+      """合约用量（由计量模块批量刷入，不在每次访问时更新）"""
+      __tablename__ = "contract_usage"
+
+      contract_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contracts.id"), primary_key=True
+      )
+      access_count: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+      bytes_transferred: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+      updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+
+class AutoApprovalRule(Base):
+      """提供者配置的自动审批规则：命中的 Open 数据资源请求由后台任务自动批准"""
+      __tablename__ = "auto_approval_rules"
+
+      id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+      # 为空时适用于该连接器的全部 Open 数据资源
+      data_offering_id: Mapped[str | None] = mapped_column(
+          String, ForeignKey("data_offerings.id")
+      )
+      # 为空时不限访问方式
+      access_mode: Mapped[str | None] = mapped_column(String(20))
+      # 为空时不限消费者连接器
+      allowed_consumer_connector_ids: Mapped[list | None] = mapped_column(JSON)
+      # 非空时批准后按该合约模板自动创建合约（等待消费者确认）
+      contract_template_id: Mapped[str | None] = mapped_column(
+          String, ForeignKey("contract_templates.id")
+      )
+      contract_validity_days: Mapped[int | None] = mapped_column()
+      is_active: Mapped[bool] = mapped_column(default=True)
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+
+      connector_id: Mapped[str] = mapped_column(
+          String, ForeignKey("connectors.id"), nullable=False, index=True
+      )
+
+
+class StatusCounter(Base):
+      """按 (对象类型, 连接器, 角色, 状态) 增量维护的计数，与状态变更在同一事务中更新"""
+      __tablename__ = "status_counters"
+
+      # "data_request" | "contract"
+      entity: Mapped[str] = mapped_column(String(20), primary_key=True)
+      connector_id: Mapped[str] = mapped_column(
+          String, ForeignKey("connectors.id"), primary_key=True
+      )
+      # "consumer" | "provider"
+      role: Mapped[str] = mapped_column(String(20), primary_key=True)
+      status: Mapped[str] = mapped_column(String(50), primary_key=True)
+      count: Mapped[int] = mapped_column(default=0, nullable=False)
+
+
+class DeploymentJob(Base):
+      """合约上链任务（持久化队列，由后台任务按批提交到链后端）"""
+      __tablename__ = "deployment_jobs"
+      __table_args__ = (
+          # 工作进程按状态、创建时间领取任务
+          Index("ix_deployment_jobs_status_created", "status", "created_at"),
+          # 同一合约最多只有一个未完成的任务（重复提交时返回已有任务）
+          Index(
+              "uq_deployment_jobs_open_contract",
+              "contract_id",
+              unique=True,
+              sqlite_where=text("status IN ('queued', 'running')"),
+          ),
+      )
+
+      id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+      # queued / running / succeeded / failed
+      status: Mapped[str] = mapped_column(String(20), default="queued", nullable=False)
+      attempts: Mapped[int] = mapped_column(default=0, nullable=False)
+      error: Mapped[str | None] = mapped_column(Text)
+      network: Mapped[str | None] = mapped_column(String(50))
+      block_number: Mapped[int | None] = mapped_column(BigInteger)
+      tx_id: Mapped[str | None] = mapped_column(String(200))
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+      updated_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+      contract_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contracts.id"), nullable=False
+      )
+
+
+class ContractAnchor(Base):
+      """一批合约摘要构成的 Merkle 树，只有树根写入链上"""
+      __tablename__ = "contract_anchors"
+
+      id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+      root: Mapped[str] = mapped_column(String(64), nullable=False)
+      leaf_count: Mapped[int] = mapped_column(nullable=False)
+      network: Mapped[str | None] = mapped_column(String(50))
+      block_number: Mapped[int | None] = mapped_column(BigInteger)
+      tx_id: Mapped[str | None] = mapped_column(String(200))
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+
+
+class MerkleNode(Base):
+      """Merkle 树的全部节点（level 0 为叶子），生成包含证明时按位置直接读取兄弟节点"""
+      __tablename__ = "merkle_nodes"
+
+      anchor_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contract_anchors.id"), primary_key=True
+      )
+      level: Mapped[int] = mapped_column(primary_key=True)
+      position: Mapped[int] = mapped_column(primary_key=True)
+      hash: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+class AnchoredContract(Base):
+      """合约在某次锚定中的叶子位置及当时的合约摘要"""
+      __tablename__ = "anchored_contracts"
+
+      contract_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contracts.id"), primary_key=True
+      )
+      anchor_id: Mapped[str] = mapped_column(
+          String, ForeignKey("contract_anchors.id"), nullable=False, index=True
+      )
+      position: Mapped[int] = mapped_column(nullable=False)
+      digest: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+class OutboxEvent(Base):
+      """事务性 outbox：与状态变更在同一事务中写入的生命周期事件，由后台按 id 顺序投递"""
+      __tablename__ = "outbox_events"
+      __table_args__ = (
+          # 每个聚合（合约 / 数据请求）的事件序号唯一，也用于查询聚合的当前最大序号
+          Index(
+              "uq_outbox_events_aggregate_sequence",
+              "aggregate_type",
+              "aggregate_id",
+              "sequence",
+              unique=True,
+          ),
+      )
+
+      # 自增 ID 即全局投递顺序（SQLite 单写者，分配顺序与提交顺序一致）
+      id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+      # "data_request" | "contract"
+      aggregate_type: Mapped[str] = mapped_column(String(20), nullable=False)
+      aggregate_id: Mapped[str] = mapped_column(String, nullable=False)
+      # 聚合内从 1 开始连续递增，消费方据此去重并保证顺序
+      sequence: Mapped[int] = mapped_column(nullable=False)
+      event_type: Mapped[str] = mapped_column(String(50), nullable=False)
+      payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+      created_at: Mapped[datetime] = mapped_column(
+          DateTime, default=lambda: datetime.now(timezone.utc)
+      )
+
+
+class OutboxSinkOffset(Base):
+      """每个 sink 已投递到的 outbox 事件 ID，各 sink 独立推进"""
+      __tablename__ = "outbox_sink_offsets"
+
+      sink: Mapped[str] = mapped_column(String(50), primary_key=True)
+      last_event_id: Mapped[int] = mapped_column(default=0, nullable=False)
+      updated_at: Mapped[datetime | None] = mapped_column(DateTime)
@@ -0,0 +1,15 @@
+from fastapi.responses import StreamingResponse
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """响应结束时一定调用 on_close：包括客户端在第一次输出前断开、响应体从未被迭代的情况"""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
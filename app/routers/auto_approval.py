@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import get_session
+from ..deps import get_current_user, get_operator
+from ..models import AutoApprovalRule, Connector, ContractTemplate, DataOffering
+from ..schemas import AutoApprovalMetricsOut, AutoApprovalRuleCreate, AutoApprovalRuleOut
+from ..services.auto_approval import auto_approval_worker, reset_evaluations
+from ..services.ownership import ensure_access, resolve_owned
+
+router = APIRouter(prefix=settings.api_prefix + "/auto-approval", tags=["auto-approval"])
+
+
+@router.post("/rules", response_model=AutoApprovalRuleOut)
+async def create_auto_approval_rule(
+    payload: AutoApprovalRuleCreate,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """创建自动审批规则（提供者）"""
+    resolved = await resolve_owned(session, Connector, [payload.connector_id], current_user.id)
+    ensure_access(
+        resolved[payload.connector_id], "Connector not found", "Connector does not belong to you"
+    )
+
+    # 指定的数据资源必须是该连接器的 Open 数据资源
+    if payload.data_offering_id:
+        result = await session.execute(
+            select(DataOffering).where(DataOffering.id == payload.data_offering_id)
+        )
+        data_offering = result.scalar_one_or_none()
+        if not data_offering:
+            raise HTTPException(status_code=404, detail="Data offering not found")
+        if data_offering.connector_id != payload.connector_id:
+            raise HTTPException(
+                status_code=403,
+                detail="Data offering does not belong to the connector"
+            )
+        if data_offering.access_policy != "Open":
+            raise HTTPException(
+                status_code=400,
+                detail="Auto approval only applies to Open data offerings"
+            )
+
+    # 指定的合约模板必须属于该连接器
+    if payload.contract_template_id:
+        result = await session.execute(
+            select(ContractTemplate).where(ContractTemplate.id == payload.contract_template_id)
+        )
+        contract_template = result.scalar_one_or_none()
+        if not contract_template:
+            raise HTTPException(status_code=404, detail="Contract template not found")
+        if contract_template.connector_id != payload.connector_id:
+            raise HTTPException(
+                status_code=403,
+                detail="Contract template does not belong to the connector"
+            )
+
+    rule = AutoApprovalRule(**payload.model_dump())
+    session.add(rule)
+    await session.commit()
+    await session.refresh(rule)
+
+    # 规则变化后，该连接器上此前未命中的 pending 请求需要重新评估
+    await reset_evaluations(session, payload.connector_id)
+    await auto_approval_worker.sweep()
+    return rule
+
+
+@router.get("/rules", response_model=list[AutoApprovalRuleOut])
+async def list_auto_approval_rules(
+    connector_id: str | None = None,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """查询当前用户连接器的自动审批规则"""
+    query = (
+        select(AutoApprovalRule)
+        .join(Connector, Connector.id == AutoApprovalRule.connector_id)
+        .where(Connector.owner_user_id == current_user.id)
+    )
+    if connector_id:
+        query = query.where(AutoApprovalRule.connector_id == connector_id)
+    result = await session.execute(query.order_by(AutoApprovalRule.created_at))
+    return result.scalars().all()
+
+
+@router.delete("/rules/{rule_id}")
+async def delete_auto_approval_rule(
+    rule_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """删除自动审批规则"""
+    resolved = await resolve_owned(session, AutoApprovalRule, [rule_id], current_user.id)
+    rule = ensure_access(resolved[rule_id], "Auto approval rule not found")
+
+    await session.delete(rule)
+    await session.commit()
+    return {"message": "Auto approval rule deleted successfully"}
+
+
+@router.get("/metrics", response_model=AutoApprovalMetricsOut)
+async def get_auto_approval_metrics(operator=Depends(get_operator)):
+    """自动审批队列深度、处理量及审批耗时（全局指标，仅运维用户）"""
+    return auto_approval_worker.metrics()
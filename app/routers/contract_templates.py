@@ -1,18 +1,59 @@
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from ..config import settings
 from ..database import get_session
 from ..deps import get_current_user
-from ..models import Connector, ContractTemplate, PolicyTemplate, ContractTemplatePolicy
+from ..models import (
+    Connector,
+    ContractTemplate,
+    ContractTemplateArtifact,
+    ContractTemplatePolicy,
+    PolicyTemplate,
+)
 from ..schemas import ContractTemplateCreate, ContractTemplateOut
+from ..services.odrl import ensure_odrl_artifact, load_odrl_artifact
+from ..services.ownership import Access, ensure_access, resolve_owned
+from ..services.reference_counts import adjust_policy_references
+from ..services.template_versions import snapshot_contract_template
 
 router = APIRouter(prefix=settings.api_prefix + "/contract-templates", tags=["contract-templates"])
 
 
+async def _resolve_policy_templates(
+    session: AsyncSession, policy_template_ids: list[str], user_id: str
+) -> list[PolicyTemplate]:
+    """批量验证策略模板存在且属于当前用户，按请求顺序返回（重复 ID 只保留一次）"""
+    resolved = await resolve_owned(session, PolicyTemplate, policy_template_ids, user_id)
+    for policy_id, resolution in resolved.items():
+        if resolution.access is Access.NOT_FOUND:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Policy template {policy_id} not found"
+            )
+        if resolution.access is Access.FORBIDDEN:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Policy template {policy_id} does not belong to you"
+            )
+    return [resolution.row for resolution in resolved.values()]
+
+
+async def _load_contract_template(session: AsyncSession, template_id: str) -> ContractTemplate:
+    result = await session.execute(
+        select(ContractTemplate)
+        .options(
+            selectinload(ContractTemplate.policy_templates).selectinload(PolicyTemplate.rules)
+        )
+        .where(ContractTemplate.id == template_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
 @router.post("", response_model=ContractTemplateOut)
 async def create_contract_template(
     payload: ContractTemplateCreate,
@@ -21,15 +62,13 @@ async def create_contract_template(
 ):
     """创建合约模板"""
     # 验证连接器属于当前用户
-    result = await session.execute(
-        select(Connector).where(Connector.id == payload.connector_id)
+    resolved = await resolve_owned(session, Connector, [payload.connector_id], current_user.id)
+    ensure_access(
+        resolved[payload.connector_id],
+        "Connector not found or not owned by you",
+        "Connector not found or not owned by you",
+        forbidden_status=404,
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(
-            status_code=404,
-            detail="Connector not found or not owned by you"
-        )
 
     # 验证策略模板
     if not payload.policy_template_ids:
@@ -45,32 +84,10 @@ async def create_contract_template(
             detail="Single policy contract can only have one policy template"
         )
 
-    # 验证所有策略模板存在且属于当前用户
-    policy_templates = []
-    for policy_id in payload.policy_template_ids:
-        result = await session.execute(
-            select(PolicyTemplate).where(PolicyTemplate.id == policy_id)
-        )
-        policy_template = result.scalar_one_or_none()
-
-        if not policy_template:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Policy template {policy_id} not found"
-            )
-
-        # 验证策略模板的连接器属于当前用户
-        result = await session.execute(
-            select(Connector).where(Connector.id == policy_template.connector_id)
-        )
-        policy_connector = result.scalar_one_or_none()
-        if not policy_connector or policy_connector.owner_user_id != current_user.id:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Policy template {policy_id} does not belong to you"
-            )
-
-        policy_templates.append(policy_template)
+    # 验证所有策略模板存在且属于当前用户（一次联表查询）
+    policy_templates = await _resolve_policy_templates(
+        session, payload.policy_template_ids, current_user.id
+    )
 
     # 创建合约模板
     contract_template = ContractTemplate(
@@ -92,9 +109,17 @@ async def create_contract_template(
         )
         session.add(association)
 
+    # 维护策略模板的反向引用计数
+    await adjust_policy_references(session, [pt.id for pt in policy_templates], 1)
+
+    # 生成不可变版本并编译 ODRL 制品
+    await snapshot_contract_template(session, contract_template.id)
+    await ensure_odrl_artifact(session, contract_template)
+
     await session.commit()
-    await session.refresh(contract_template)
-    return contract_template
+
+    # 重新加载合约模板及其策略模板，以便正确序列化
+    return await _load_contract_template(session, contract_template.id)
 
 
 @router.get("", response_model=list[ContractTemplateOut])
@@ -149,27 +174,37 @@ async def get_contract_template(
     current_user=Depends(get_current_user),
 ):
     """获取合约模板详情"""
-    result = await session.execute(
-        select(ContractTemplate)
-        .options(
-            selectinload(ContractTemplate.policy_templates).selectinload(PolicyTemplate.rules)
-        )
-        .where(ContractTemplate.id == template_id)
+    resolved = await resolve_owned(
+        session, ContractTemplate, [template_id], current_user.id,
+        options=[selectinload(ContractTemplate.policy_templates).selectinload(PolicyTemplate.rules)],
     )
-    template = result.scalar_one_or_none()
+    return ensure_access(resolved[template_id], "Contract template not found")
 
-    if not template:
-        raise HTTPException(status_code=404, detail="Contract template not found")
 
-    # 验证权限
-    result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
+@router.get("/{template_id}/odrl")
+async def get_contract_template_odrl(
+    template_id: str,
+    if_none_match: str | None = Header(default=None),
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """获取合约模板当前版本的 ODRL（JSON-LD）策略文档，ETag 为文档摘要"""
+    resolved = await resolve_owned(session, ContractTemplate, [template_id], current_user.id)
+    template = ensure_access(resolved[template_id], "Contract template not found")
+
+    # 制品在创建 / 更新模板时生成，读取不写库
+    artifact = await load_odrl_artifact(session, template)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Contract template version not found")
+
+    etag = f'"{artifact.digest}"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        content=artifact.body,
+        media_type="application/ld+json",
+        headers={"ETag": etag},
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    return template
 
 
 @router.put("/{template_id}", response_model=ContractTemplateOut)
@@ -180,22 +215,9 @@ async def update_contract_template(
     current_user=Depends(get_current_user),
 ):
     """更新合约模板"""
-    # 查找模板
-    result = await session.execute(
-        select(ContractTemplate).where(ContractTemplate.id == template_id)
-    )
-    template = result.scalar_one_or_none()
-
-    if not template:
-        raise HTTPException(status_code=404, detail="Contract template not found")
-
-    # 验证权限
-    result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
-    )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
+    # 查找模板并验证权限
+    resolved = await resolve_owned(session, ContractTemplate, [template_id], current_user.id)
+    template = ensure_access(resolved[template_id], "Contract template not found")
 
     # 验证策略模板
     if not payload.policy_template_ids:
@@ -211,32 +233,10 @@ async def update_contract_template(
             detail="Single policy contract can only have one policy template"
         )
 
-    # 验证所有策略模板存在且属于当前用户
-    policy_templates = []
-    for policy_id in payload.policy_template_ids:
-        result = await session.execute(
-            select(PolicyTemplate).where(PolicyTemplate.id == policy_id)
-        )
-        policy_template = result.scalar_one_or_none()
-
-        if not policy_template:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Policy template {policy_id} not found"
-            )
-
-        # 验证策略模板的连接器属于当前用户
-        result = await session.execute(
-            select(Connector).where(Connector.id == policy_template.connector_id)
-        )
-        policy_connector = result.scalar_one_or_none()
-        if not policy_connector or policy_connector.owner_user_id != current_user.id:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Policy template {policy_id} does not belong to you"
-            )
-
-        policy_templates.append(policy_template)
+    # 验证所有策略模板存在且属于当前用户（一次联表查询）
+    policy_templates = await _resolve_policy_templates(
+        session, payload.policy_template_ids, current_user.id
+    )
 
     # 更新基本信息
     template.name = payload.name
@@ -254,6 +254,12 @@ async def update_contract_template(
     for assoc in old_associations:
         await session.delete(assoc)
 
+    # 只调整增减的策略模板的引用计数
+    old_policy_ids = {assoc.policy_template_id for assoc in old_associations}
+    new_policy_ids = {pt.id for pt in policy_templates}
+    await adjust_policy_references(session, old_policy_ids - new_policy_ids, -1)
+    await adjust_policy_references(session, new_policy_ids - old_policy_ids, 1)
+
     # 添加新关联
     for policy_template in policy_templates:
         association = ContractTemplatePolicy(
@@ -262,9 +268,14 @@ async def update_contract_template(
         )
         session.add(association)
 
+    # 生成新版本（已有合约仍固定在旧版本）并编译 ODRL 制品
+    await snapshot_contract_template(session, template.id)
+    await ensure_odrl_artifact(session, template)
+
     await session.commit()
-    await session.refresh(template)
-    return template
+
+    # 重新加载合约模板及其策略模板，以便正确序列化
+    return await _load_contract_template(session, template.id)
 
 
 @router.delete("/{template_id}")
@@ -274,27 +285,42 @@ async def delete_contract_template(
     current_user=Depends(get_current_user),
 ):
     """删除合约模板"""
-    # 查找模板
-    result = await session.execute(
-        select(ContractTemplate).where(ContractTemplate.id == template_id)
-    )
-    template = result.scalar_one_or_none()
-
-    if not template:
-        raise HTTPException(status_code=404, detail="Contract template not found")
+    # 查找模板并验证权限
+    resolved = await resolve_owned(session, ContractTemplate, [template_id], current_user.id)
+    ensure_access(resolved[template_id], "Contract template not found")
 
-    # 验证权限
+    # 条件删除：usage_count 即基于该模板创建的合约数，检查与删除在同一条语句中完成，
+    # 并发创建的合约不会被漏掉
     result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
+        delete(ContractTemplate)
+        .where(ContractTemplate.id == template_id, ContractTemplate.usage_count == 0)
+        .execution_options(synchronize_session=False)
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    # 检查是否被合约使用
-    # TODO: 添加检查逻辑，如果被使用则不允许删除
+    if result.rowcount == 0:
+        usage_count = (await session.execute(
+            select(ContractTemplate.usage_count).where(ContractTemplate.id == template_id)
+        )).scalar_one_or_none()
+        await session.rollback()
+        if usage_count is None:
+            # 已被并发删除
+            raise HTTPException(status_code=404, detail="Contract template not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Contract template is used by {usage_count} contract(s)"
+        )
 
-    await session.delete(template)
+    policy_ids = (await session.execute(
+        select(ContractTemplatePolicy.policy_template_id).where(
+            ContractTemplatePolicy.contract_template_id == template_id
+        )
+    )).scalars().all()
+    await session.execute(
+        delete(ContractTemplatePolicy).where(ContractTemplatePolicy.contract_template_id == template_id)
+    )
+    await session.execute(
+        delete(ContractTemplateArtifact).where(ContractTemplateArtifact.contract_template_id == template_id)
+    )
+    await adjust_policy_references(session, policy_ids, -1)
     await session.commit()
 
     return {"message": "Contract template deleted successfully"}
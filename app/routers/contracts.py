@@ -1,17 +1,49 @@
+import math
+import time
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, or_
+from sqlalchemy import select, or_, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
 from ..database import get_session
-from ..deps import get_current_user
-from ..models import Connector, Contract, ContractTemplate, DataOffering, DataRequest
-from ..schemas import ContractCreate, ContractOut, ContractConfirm
+from ..deps import get_current_user, get_token_subject
+from ..models import Connector, Contract, ContractTemplate, DataOffering, DataRequest, DeploymentJob
+from ..schemas import (
+    AccessCheckBatch,
+    AccessCheckBatchOut,
+    AccessCheckOut,
+    ContractAnchorProofOut,
+    ContractCreate,
+    ContractOut,
+    ContractConfirm,
+    ContractTermsOut,
+    ContractUsageOut,
+    ContractUsageRecord,
+    DataRequestOut,
+    DeploymentJobOut,
+)
+from ..services.access_index import active_contract_index
+from ..services.interval_index import contract_validity_index, load_access_periods, to_timestamp
+from ..services.metering import UsageLimitExceeded, usage_meter
+from ..services.anchoring import load_proof
+from ..services.deployments import deployment_worker
+from ..services.events import event_bus
+from ..services.outbox import contract_record, data_request_record, outbox_relay, record
+from ..services.ownership import ensure_access, resolve_contract_parties, resolve_owned
+from ..services.status_counters import CONTRACT, DATA_REQUEST, Transition, apply_transitions
+from ..services.template_versions import load_contract_terms, snapshot_contract_template
+from ..services.transitions import compare_and_set_status
 
 router = APIRouter(prefix=settings.api_prefix + "/contracts", tags=["contracts"])
 
 
+def _publish(user_ids, event_type: str, contract: Contract) -> None:
+    """事务提交后推送合约事件给双方"""
+    event_bus.publish(user_ids, event_type, ContractOut.model_validate(contract).model_dump(mode="json"))
+
+
 @router.post("", response_model=ContractOut)
 async def create_contract(
       payload: ContractCreate,
@@ -24,28 +56,20 @@ async def create_contract(
       - provider_connector_id 必须属于当前用户
       - consumer_connector_id 可以是任何用户的连接器（只需要存在）
       """
-      # 验证提供者连接器属于当前用户
-      result = await session.execute(
-          select(Connector).where(Connector.id == payload.provider_connector_id)
+      # 验证提供者连接器属于当前用户，消费者连接器存在（可以是任何用户的），一次查询
+      resolved = await resolve_owned(
+          session,
+          Connector,
+          [payload.provider_connector_id, payload.consumer_connector_id],
+          current_user.id,
       )
-      provider = result.scalar_one_or_none()
-      if not provider:
-          raise HTTPException(
-              status_code=404,
-              detail="Provider connector not found"
-          )
-      if provider.owner_user_id != current_user.id:
-          raise HTTPException(
-              status_code=403,
-              detail=f"Provider connector does not belong to you. Only the provider can create contracts."
-          )
-
-      # 验证消费者连接器存在（可以是任何用户的）
-      result = await session.execute(
-          select(Connector).where(Connector.id == payload.consumer_connector_id)
+      provider = ensure_access(
+          resolved[payload.provider_connector_id],
+          "Provider connector not found",
+          "Provider connector does not belong to you. Only the provider can create contracts.",
       )
-      consumer = result.scalar_one_or_none()
-      if not consumer:
+      consumer = resolved[payload.consumer_connector_id].row
+      if consumer is None:
           raise HTTPException(
               status_code=404, 
               detail="Consumer connector not found"
@@ -117,9 +141,33 @@ async def create_contract(
                   detail="Data request does not match consumer connector"
               )
 
-          # 更新请求状态为已完成
-          data_request.status = "completed"
-          data_request.updated_at = datetime.now(timezone.utc)
+      # 校验读取完毕，先结束读事务再写（SQLite 读事务升级为写事务时不会等待其他写者，直接报 locked）
+      await session.commit()
+
+      if data_request is not None:
+          # 更新请求状态为已完成（条件更新：同一请求并发创建合约时只有一个成功，其余返回 409）
+          await compare_and_set_status(
+              session, DataRequest, data_request.id, "approved", "completed", datetime.now(timezone.utc)
+          )
+
+      # 更新合约模板使用次数（即引用该模板的合约数）：原子自增，避免并发创建合约时的读-改-写丢失；
+      # 模板已在校验之后被删除时不更新任何行
+      result = await session.execute(
+          update(ContractTemplate)
+          .where(ContractTemplate.id == contract_template.id)
+          .values(
+              usage_count=ContractTemplate.usage_count + 1,
+          )
+          .execution_options(synchronize_session=False)
+      )
+      if result.rowcount == 0:
+          await session.rollback()
+          raise HTTPException(status_code=404, detail="Contract template not found")
+
+      # 固定合约模板的当前版本
+      version_hash = contract_template.version_hash
+      if version_hash is None:
+          version_hash = await snapshot_contract_template(session, contract_template.id)
 
       # 创建合约
       contract = Contract(
@@ -130,15 +178,39 @@ async def create_contract(
           contract_template_id=contract_template.id,
           data_offering_id=data_offering.id,
           data_request_id=payload.data_request_id,
+          contract_template_version_hash=version_hash,
           expires_at=payload.expires_at,
       )
       session.add(contract)
 
-      # 更新合约模板使用次数
-      contract_template.usage_count += 1
+      # 状态计数与状态变更在同一事务中更新
+      await apply_transitions(session, CONTRACT, [
+          Transition(consumer.id, provider.id, None, "pending_consumer")
+      ])
+      if data_request is not None:
+          await apply_transitions(session, DATA_REQUEST, [
+              Transition(consumer.id, provider.id, "approved", "completed")
+          ])
+
+      # 生命周期事件与状态变更在同一事务中写入 outbox（合约 ID 在 flush 时生成）
+      await session.flush()
+      records = [contract_record(contract, "contract.created")]
+      if data_request is not None:
+          records.append(data_request_record(data_request, "data_request.completed"))
+      await record(session, records)
 
       await session.commit()
+      outbox_relay.notify()
       await session.refresh(contract)
+
+      parties = {provider.owner_user_id, consumer.owner_user_id}
+      _publish(parties, "contract.created", contract)
+      if data_request is not None:
+          event_bus.publish(
+              parties,
+              "data_request.updated",
+              DataRequestOut.model_validate(data_request).model_dump(mode="json"),
+          )
       return contract
 
 
@@ -190,30 +262,126 @@ async def list_contracts(
       return contracts
 
 
-@router.put("/{contract_id}/confirm", response_model=ContractOut)
-async def confirm_contract(
-    contract_id: str,
-    payload: ContractConfirm,
+@router.get("/valid", response_model=list[ContractOut])
+async def list_valid_contracts(
+    consumer_connector_id: str,
+    at: datetime | None = None,
+    until: datetime | None = None,
     session: AsyncSession = Depends(get_session),
     current_user=Depends(get_current_user),
 ):
-    """消费者确认或拒绝合约"""
-    # 查找合约
-    result = await session.execute(
-        select(Contract).where(Contract.id == contract_id)
+    """查询消费者在某时刻（或 [at, until) 时间段内）有效的合约，基于内存区间索引"""
+    resolved = await resolve_owned(session, Connector, [consumer_connector_id], current_user.id)
+    ensure_access(
+        resolved[consumer_connector_id],
+        "Connector does not belong to you",
+        "Connector does not belong to you",
     )
-    contract = result.scalar_one_or_none()
 
-    if not contract:
-        raise HTTPException(status_code=404, detail="Contract not found")
+    start = to_timestamp(at or datetime.now(timezone.utc))
+    end = to_timestamp(until) if until else start
+    if end < start:
+        raise HTTPException(status_code=400, detail="until must not be earlier than at")
+
+    contract_ids = contract_validity_index.valid_between(consumer_connector_id, start, end)
+    if not contract_ids:
+        return []
 
-    # 验证是消费者
     result = await session.execute(
-        select(Connector).where(Connector.id == contract.consumer_connector_id)
+        select(Contract).where(Contract.id.in_(contract_ids)).order_by(Contract.created_at)
+    )
+    return result.scalars().all()
+
+
+def _check_access(consumer_connector_id: str, data_offering_id: str, user_id: str, now: float) -> AccessCheckOut:
+    # 热路径：字段均来自请求参数与内存索引，跳过逐个模型校验（响应序列化时统一校验）
+    contract = active_contract_index.check(consumer_connector_id, data_offering_id, user_id, now)
+    if contract is None:
+        return AccessCheckOut.model_construct(
+            consumer_connector_id=consumer_connector_id,
+            data_offering_id=data_offering_id,
+            allowed=False,
+            contract_id=None,
+            expires_at=None,
+        )
+    return AccessCheckOut.model_construct(
+        consumer_connector_id=consumer_connector_id,
+        data_offering_id=data_offering_id,
+        allowed=True,
+        contract_id=contract.contract_id,
+        expires_at=(
+            datetime.fromtimestamp(contract.valid_until, timezone.utc)
+            if contract.valid_until != math.inf else None
+        ),
     )
-    consumer_connector = result.scalar_one_or_none()
 
-    if not consumer_connector or consumer_connector.owner_user_id != current_user.id:
+
+@router.get("/access-check", response_model=AccessCheckOut)
+async def check_contract_access(
+    consumer_connector_id: str,
+    data_offering_id: str,
+    user_id: str = Depends(get_token_subject),
+):
+    """数据平面热路径：消费者连接器对数据资源是否持有有效合约
+
+    基于内存中的有效合约索引，只校验 JWT、不访问数据库；调用方须是合约一方连接器的所有者。
+    """
+    return _check_access(consumer_connector_id, data_offering_id, user_id, time.time())
+
+
+@router.post("/access-check", response_model=AccessCheckBatchOut)
+async def check_contract_access_batch(
+    payload: AccessCheckBatch,
+    user_id: str = Depends(get_token_subject),
+):
+    """批量访问检查（一次最多 1000 个），按输入顺序返回"""
+    now = time.time()
+    return AccessCheckBatchOut.model_construct(results=[
+        _check_access(item.consumer_connector_id, item.data_offering_id, user_id, now)
+        for item in payload.checks
+    ])
+
+
+@router.get("/{contract_id}/terms", response_model=ContractTermsOut)
+async def get_contract_terms(
+    contract_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """获取合约创建时固定的合约模板版本（含策略规则）"""
+    # 验证权限（提供者或消费者）
+    resolved = await resolve_contract_parties(session, [contract_id], current_user.id)
+    contract = ensure_access(resolved[contract_id], "Contract not found")
+
+    document = None
+    if contract.contract_template_version_hash:
+        document = await load_contract_terms(session, contract.contract_template_version_hash)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Contract terms not found")
+
+    return ContractTermsOut(
+        contract_id=contract.id,
+        contract_template_version_hash=contract.contract_template_version_hash,
+        document=document,
+    )
+
+
+@router.put("/{contract_id}/confirm", response_model=ContractOut)
+async def confirm_contract(
+    contract_id: str,
+    payload: ContractConfirm,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """消费者确认或拒绝合约"""
+    # 查找合约并验证是消费者
+    resolution = (await resolve_contract_parties(session, [contract_id], current_user.id))[contract_id]
+    contract = ensure_access(
+        resolution,
+        "Contract not found",
+        "Only the consumer can confirm or reject this contract",
+    )
+    if not resolution.is_consumer:
         raise HTTPException(
             status_code=403,
             detail="Only the consumer can confirm or reject this contract"
@@ -228,49 +396,53 @@ async def confirm_contract(
 
     # 更新状态
     if payload.action == "confirm":
-        contract.status = "active"
+        new_status = "active"
     elif payload.action == "reject":
-        contract.status = "rejected"
+        new_status = "rejected"
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
 
-    contract.updated_at = datetime.now(timezone.utc)
+    # 条件更新：并发请求已改变状态时返回 409
+    now = datetime.now(timezone.utc)
+    await compare_and_set_status(
+        session, Contract, contract.id, "pending_consumer", new_status, now,
+        **({"activated_at": now} if new_status == "active" else {}),
+    )
+    await apply_transitions(session, CONTRACT, [
+        Transition(
+            contract.consumer_connector_id,
+            contract.provider_connector_id,
+            "pending_consumer",
+            contract.status,
+        )
+    ])
+    await record(session, [
+        contract_record(contract, "contract.confirmed" if contract.status == "active" else "contract.rejected")
+    ])
 
     await session.commit()
+    outbox_relay.notify()
     await session.refresh(contract)
+
+    # 增量更新有效期区间索引（仅 active 合约会被索引）
+    version_hash = contract.contract_template_version_hash
+    periods = await load_access_periods(session, {version_hash} if version_hash else set())
+    contract_validity_index.upsert(contract, periods.get(version_hash))
+    active_contract_index.upsert(contract, resolution.party_user_ids, periods.get(version_hash))
+    _publish(resolution.party_user_ids, "contract.updated", contract)
     return contract
 
 
-@router.post("/{contract_id}/deploy")
+@router.post("/{contract_id}/deploy", response_model=DeploymentJobOut, status_code=202)
 async def deploy_contract_to_blockchain(
     contract_id: str,
     session: AsyncSession = Depends(get_session),
     current_user=Depends(get_current_user),
 ):
-    """部署合约到区块链（模拟）"""
-    # 查找合约
-    result = await session.execute(
-        select(Contract).where(Contract.id == contract_id)
-    )
-    contract = result.scalar_one_or_none()
-
-    if not contract:
-        raise HTTPException(status_code=404, detail="Contract not found")
-
-    # 验证权限（提供者或消费者）
-    result = await session.execute(
-        select(Connector).where(
-            or_(
-                Connector.id == contract.provider_connector_id,
-                Connector.id == contract.consumer_connector_id
-            )
-        )
-    )
-    connectors = result.scalars().all()
-    user_connector_ids = [c.id for c in connectors if c.owner_user_id == current_user.id]
-
-    if not user_connector_ids:
-        raise HTTPException(status_code=403, detail="Access denied")
+    """提交合约上链任务，立即返回任务（由后台按批提交到链后端）"""
+    # 查找合约并验证权限（提供者或消费者）
+    resolution = (await resolve_contract_parties(session, [contract_id], current_user.id))[contract_id]
+    contract = ensure_access(resolution, "Contract not found")
 
     # 检查状态
     if contract.status != "active":
@@ -286,32 +458,103 @@ async def deploy_contract_to_blockchain(
             detail="Contract already deployed to blockchain"
         )
 
-    # 模拟部署到区块链
-    # 在实际实现中，这里会调用区块链API
-    import hashlib
-    import time
+    # 入队：同一合约已有未完成任务时返回该任务
+    result = await session.execute(
+        insert(DeploymentJob)
+        .values(contract_id=contract.id, status="queued")
+        .on_conflict_do_nothing(
+            index_elements=[DeploymentJob.contract_id],
+            index_where=DeploymentJob.status.in_(["queued", "running"]),
+        )
+        .returning(DeploymentJob)
+    )
+    job = result.scalar_one_or_none()
+    await session.commit()
+    if job is None:
+        result = await session.execute(
+            select(DeploymentJob).where(
+                DeploymentJob.contract_id == contract.id,
+                DeploymentJob.status.in_(["queued", "running"]),
+            )
+        )
+        job = result.scalar_one()
+    deployment_worker.notify()
+    return job
 
-    # 生成模拟的合约地址和交易哈希
-    timestamp = str(time.time())
-    contract_address = "0x" + hashlib.sha256(
-        f"{contract.id}{timestamp}".encode()
-    ).hexdigest()[:40]
 
-    blockchain_tx_id = "0x" + hashlib.sha256(
-        f"tx{contract.id}{timestamp}".encode()
-    ).hexdigest()
+@router.get("/deployments/{job_id}", response_model=DeploymentJobOut)
+async def get_deployment_job(
+    job_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """查询合约上链任务状态"""
+    job = await session.get(DeploymentJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deployment job not found")
+    resolution = (await resolve_contract_parties(session, [job.contract_id], current_user.id))[job.contract_id]
+    ensure_access(resolution, "Deployment job not found")
+    return job
 
-    # 更新合约
-    contract.contract_address = contract_address
-    contract.blockchain_tx_id = blockchain_tx_id
-    contract.updated_at = datetime.now(timezone.utc)
 
-    await session.commit()
-    await session.refresh(contract)
+@router.get("/{contract_id}/anchor-proof", response_model=ContractAnchorProofOut)
+async def get_contract_anchor_proof(
+    contract_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """获取合约的 Merkle 包含证明（合约摘要 → 链上锚定的树根）"""
+    resolved = await resolve_contract_parties(session, [contract_id], current_user.id)
+    ensure_access(resolved[contract_id], "Contract not found")
+
+    proof = await load_proof(session, contract_id)
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Contract has not been anchored yet")
+    return proof
+
+
+@router.get("/{contract_id}/usage", response_model=ContractUsageOut)
+async def get_contract_usage(
+    contract_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """查询合约当前用量（已落库 + 未落库增量）及规则上限"""
+    # 验证权限（提供者或消费者）
+    resolved = await resolve_contract_parties(session, [contract_id], current_user.id)
+    contract = ensure_access(resolved[contract_id], "Contract not found")
+
+    return await usage_meter.get_usage(session, contract.id)
+
+
+@router.post("/{contract_id}/usage", response_model=ContractUsageOut)
+async def record_contract_usage(
+    contract_id: str,
+    payload: ContractUsageRecord,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """数据平面上报一次访问（提供者），超出 access_count / transfer_limit 时拒绝"""
+    resolution = (await resolve_contract_parties(session, [contract_id], current_user.id))[contract_id]
+    contract = ensure_access(
+        resolution,
+        "Contract not found",
+        "Only the provider can record usage for this contract",
+    )
+    if not resolution.is_provider:
+        raise HTTPException(
+            status_code=403,
+            detail="Only the provider can record usage for this contract"
+        )
+
+    if contract.status != "active":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot record usage for contract with status: {contract.status}"
+        )
 
-    return {
-        "message": "Contract deployed to blockchain successfully",
-        "contract_address": contract_address,
-        "blockchain_tx_id": blockchain_tx_id,
-        "blockchain_network": contract.blockchain_network,
-    }
\ No newline at end of file
+    # 与规则上限对账：检查与计入在计量器中原子完成
+    try:
+        return await usage_meter.reserve(session, contract.id, payload.bytes_transferred)
+    except UsageLimitExceeded as exc:
+        raise HTTPException(status_code=429, detail=exc.detail)
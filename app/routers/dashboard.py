@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import get_session
+from ..deps import get_current_user
+from ..models import Connector
+from ..schemas import DashboardSummaryOut
+from ..services.ownership import Access, resolve_owned
+from ..services.status_counters import CONTRACT, DATA_REQUEST, load_status_counts
+
+router = APIRouter(prefix=settings.api_prefix + "/dashboard", tags=["dashboard"])
+
+
+@router.get("/summary", response_model=DashboardSummaryOut)
+async def get_dashboard_summary(
+    connector_id: str | None = None,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """按连接器、角色、状态分组的数据请求 / 合约数量（读取增量维护的计数表）"""
+    if connector_id:
+        resolved = await resolve_owned(session, Connector, [connector_id], current_user.id)
+        if resolved[connector_id].access is not Access.OK:
+            raise HTTPException(
+                status_code=403,
+                detail="Connector does not belong to you"
+            )
+        scope = [connector_id]
+    else:
+        scope = select(Connector.id).where(Connector.owner_user_id == current_user.id)
+
+    counters = await load_status_counts(session, scope)
+    return DashboardSummaryOut(
+        data_requests=[counter for counter in counters if counter.entity == DATA_REQUEST],
+        contracts=[counter for counter in counters if counter.entity == CONTRACT],
+    )
@@ -0,0 +1,252 @@
+import base64
+import time
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import get_session
+from ..deps import get_token_subject
+from ..models import Connector, Contract, DataOffering
+from ..responses import ClosingStreamingResponse
+from ..schemas import ObjectUploadOut, TransferKeyOut
+from ..services.interval_index import load_window
+from ..services.metering import UsageLimitExceeded, usage_meter
+from ..services.ownership import ensure_access, resolve_owned
+from ..services.proxy import ByteCounter, request_headers, response_headers, upstream_pool, upstream_url
+from ..services.s3_transfer import ChecksumError, S3Error, location_for, s3_transfer
+from ..services.transfer_encryption import (
+    ALGORITHM,
+    contract_key,
+    encrypted_headers,
+    requires_encryption,
+    transfer_encryption,
+)
+
+router = APIRouter(prefix=settings.api_prefix + "/data-plane", tags=["data-plane"])
+
+PROXY_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+
+def _raw_headers(headers: list[tuple[str, str]]) -> list[tuple[bytes, bytes]]:
+    return [(key.encode("latin-1"), value.encode("latin-1")) for key, value in headers]
+
+
+async def _load_consumer_contract(
+    session: AsyncSession, contract_id: str, user_id: str, data_type: str | None = None
+) -> tuple[Contract, dict | None]:
+    """数据平面访问的前置检查，返回 (合约, 数据资源的 storage_meta)
+
+    调用方须是消费者连接器的所有者，合约为 active 且在有效窗口内、数据资源类型为 data_type
+    （指定时）。合约、消费者连接器的所有者与数据资源一次查询取回。
+    """
+    row = (await session.execute(
+        select(Contract, Connector.owner_user_id, DataOffering.data_type, DataOffering.storage_meta)
+        .join(Connector, Connector.id == Contract.consumer_connector_id)
+        .join(DataOffering, DataOffering.id == Contract.data_offering_id)
+        .where(Contract.id == contract_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    contract, consumer_user_id, offering_data_type, storage_meta = row
+    if consumer_user_id != user_id:
+        raise HTTPException(status_code=403, detail="Only the consumer can access the data offering")
+    if contract.status != "active":
+        raise HTTPException(status_code=403, detail="Contract is not active")
+    # 与 /contracts/valid 相同的有效窗口：到期时间与 access_period 取先到者
+    _, valid_until = await load_window(session, contract)
+    if valid_until <= time.time():
+        raise HTTPException(status_code=403, detail="Contract is not active")
+    if data_type is not None and offering_data_type != data_type:
+        raise HTTPException(status_code=400, detail=f"Data offering is not of type {data_type}")
+    return contract, storage_meta
+
+
+async def _reserve_access(session: AsyncSession, contract_id: str, bytes_transferred: int = 0) -> None:
+    """检查上限并预占一次访问（及已知的传输字节数）；其余字节在结束时计入，未发生的部分调用 release 退还"""
+    try:
+        await usage_meter.reserve(session, contract_id, bytes_transferred)
+    except UsageLimitExceeded as exc:
+        raise HTTPException(status_code=429, detail=exc.detail)
+
+
+def _encrypt(contract_id: str, plaintext):
+    return transfer_encryption.encryptor.encrypt(contract_key(contract_id), plaintext)
+
+
+@router.get("/contracts/{contract_id}/transfer-key", response_model=TransferKeyOut)
+async def get_transfer_key(
+    contract_id: str,
+    session: AsyncSession = Depends(get_session),
+    user_id: str = Depends(get_token_subject),
+):
+    """合约带 encryption 规则时，消费者获取解密下载流所需的合约密钥"""
+    contract, _ = await _load_consumer_contract(session, contract_id, user_id)
+    if not await requires_encryption(session, contract):
+        raise HTTPException(status_code=400, detail="Contract does not require transfer encryption")
+    return TransferKeyOut(
+        contract_id=contract.id,
+        algorithm=ALGORITHM,
+        key=base64.b64encode(contract_key(contract.id)).decode("ascii"),
+    )
+
+
+@router.api_route("/contracts/{contract_id}/proxy/{path:path}", methods=PROXY_METHODS)
+async def proxy_restful_offering(
+    contract_id: str,
+    path: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    user_id: str = Depends(get_token_subject),
+):
+    """按合约把请求转发到 restful 数据资源的 api_endpoint，请求体与响应体流式转发
+
+    请求与响应的字节数在转发结束时记入合约用量。合约带 encryption 规则时响应体加密后输出。
+    """
+    contract, storage_meta = await _load_consumer_contract(session, contract_id, user_id, "restful")
+    api_endpoint = (storage_meta or {}).get("api_endpoint")
+    if not api_endpoint:
+        raise HTTPException(status_code=400, detail="Data offering has no api_endpoint")
+    encrypt = await requires_encryption(session, contract)
+
+    try:
+        url = upstream_url(api_endpoint, path, request.url.query)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    await _reserve_access(session, contract.id)
+
+    # 没有请求体时不传 content，避免 GET 等请求被改为分块传输
+    sent = None
+    if "content-length" in request.headers or "transfer-encoding" in request.headers:
+        sent = ByteCounter(request.stream())
+    try:
+        upstream = await upstream_pool.send(
+            request.method, url, request_headers(request.headers.items()), sent
+        )
+    except httpx.TransportError as exc:
+        # 没有拿到上游响应，退还预占的访问
+        usage_meter.release(contract.id)
+        if isinstance(exc, httpx.PoolTimeout):
+            raise HTTPException(status_code=503, detail="Upstream connection pool exhausted")
+        if isinstance(exc, httpx.TimeoutException):
+            raise HTTPException(status_code=504, detail="Upstream timed out")
+        raise HTTPException(status_code=502, detail="Upstream unavailable")
+
+    received = ByteCounter(upstream.aiter_raw())
+    headers = response_headers(upstream.headers)
+    body = received.__aiter__()
+    # 没有响应体的响应（HEAD、204、304）不加密
+    if encrypt and request.method != "HEAD" and upstream.status_code not in (204, 304):
+        body = _encrypt(contract.id, body)
+        headers = encrypted_headers(headers, settings.transfer_encryption_chunk_size)
+
+    async def close() -> None:
+        # 先计量再关闭：客户端断开导致取消时也不丢用量
+        usage_meter.record(
+            contract.id, accesses=0, bytes_transferred=(sent.bytes if sent else 0) + received.bytes
+        )
+        try:
+            await body.aclose()
+        finally:
+            await upstream.aclose()
+
+    response = ClosingStreamingResponse(body, close, status_code=upstream.status_code)
+    # 原样保留上游的多值头部（如多个 Link）
+    response.raw_headers = _raw_headers(headers)
+    return response
+
+
+def _s3_location(storage_meta: dict | None, connector_id: str):
+    if not s3_transfer.configured:
+        raise HTTPException(status_code=503, detail="S3 credentials are not configured")
+    try:
+        return location_for(storage_meta, connector_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _s3_http_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, S3Error) and exc.status == 404:
+        return HTTPException(status_code=404, detail="Object not found")
+    if isinstance(exc, S3Error):
+        return HTTPException(status_code=502, detail=f"Object storage error: {exc.code}")
+    if isinstance(exc, ChecksumError):
+        return HTTPException(status_code=502, detail=str(exc))
+    if isinstance(exc, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="Object storage timed out")
+    return HTTPException(status_code=502, detail="Object storage unavailable")
+
+
+@router.get("/contracts/{contract_id}/object")
+async def download_s3_offering(
+    contract_id: str,
+    session: AsyncSession = Depends(get_session),
+    user_id: str = Depends(get_token_subject),
+):
+    """按合约下载 s3 数据资源的对象：并行 Range GET，按顺序流式输出
+
+    内容与 ETag 校验不一致时中断响应（客户端收到的长度小于 Content-Length）。
+    合约带 encryption 规则时加密后输出。对象的字节数在传输结束时记入合约用量。
+    """
+    contract, storage_meta = await _load_consumer_contract(session, contract_id, user_id, "s3")
+    # 合约创建时已校验数据资源属于提供者连接器
+    location = _s3_location(storage_meta, contract.provider_connector_id)
+    encrypt = await requires_encryption(session, contract)
+    try:
+        info, parts = await s3_transfer.engine.download(location)
+    except (S3Error, httpx.HTTPError) as exc:
+        raise _s3_http_error(exc)
+    # 对象大小已知：开始传输前按整个对象预占，超出剩余额度时不发出任何 Range GET
+    try:
+        await _reserve_access(session, contract.id, info.size)
+    except HTTPException:
+        await parts.aclose()
+        raise
+
+    sent = ByteCounter(parts)
+    headers = [
+        ("content-type", "application/octet-stream"),
+        ("content-length", str(info.size)),
+        ("etag", f'"{info.etag}"'),
+    ]
+    body = sent.__aiter__()
+    if encrypt:
+        body = _encrypt(contract.id, body)
+        headers = encrypted_headers(headers, settings.transfer_encryption_chunk_size)
+
+    async def close() -> None:
+        # 预占的是整个对象，中断时退还未传输的明文字节；关闭迭代器以取消在途的 Range GET
+        usage_meter.release(contract.id, accesses=0, bytes_transferred=info.size - sent.bytes)
+        try:
+            await body.aclose()
+        finally:
+            await parts.aclose()
+
+    response = ClosingStreamingResponse(body, close)
+    response.raw_headers = _raw_headers(headers)
+    return response
+
+
+@router.put("/offerings/{offering_id}/object", response_model=ObjectUploadOut)
+async def upload_s3_offering(
+    offering_id: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    user_id: str = Depends(get_token_subject),
+):
+    """提供者把请求体上传为 s3 数据资源的对象：按分片并行上传，不在内存中缓冲完整内容"""
+    resolved = await resolve_owned(session, DataOffering, [offering_id], user_id)
+    offering = ensure_access(resolved[offering_id], "Data offering not found")
+    if offering.data_type != "s3":
+        raise HTTPException(status_code=400, detail="Data offering is not of type s3")
+    location = _s3_location(offering.storage_meta, offering.connector_id)
+    # 上传时间可能很长，不占用数据库连接
+    await session.close()
+
+    try:
+        result = await s3_transfer.engine.upload(location, request.stream())
+    except (S3Error, ChecksumError, httpx.HTTPError) as exc:
+        raise _s3_http_error(exc)
+    return ObjectUploadOut(etag=result.etag, size=result.size, parts=result.parts, sha256=result.sha256)
@@ -1,18 +1,91 @@
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, or_
+from sqlalchemy import exists, select, or_, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from ..config import settings
 from ..database import get_session
 from ..deps import get_current_user
 from ..models import Connector, DataOffering, DataRequest
-from ..schemas import DataRequestCreate, DataRequestUpdate, DataRequestOut
+from ..schemas import (
+    DataRequestBulkDecision,
+    DataRequestBulkDecisionOut,
+    DataRequestCreate,
+    DataRequestDecisionOutcome,
+    DataRequestOut,
+    DataRequestUpdate,
+)
+from ..services.auto_approval import auto_approval_worker
+from ..services.events import event_bus
+from ..services.outbox import data_request_record, outbox_relay, record
+from ..services.ownership import (
+    Access,
+    connector_owner_ids,
+    ensure_access,
+    resolve_data_request_parties,
+    resolve_owned,
+)
+from ..services.status_counters import DATA_REQUEST, Transition, apply_transitions
+from ..services.transitions import compare_and_set_status
 
 router = APIRouter(prefix=settings.api_prefix + "/data-requests", tags=["data-requests"])
 
 
+def _publish(user_ids, event_type: str, data_request: DataRequest, **changes) -> None:
+    """事务提交后推送数据请求事件给双方"""
+    data = DataRequestOut.model_validate(data_request).model_dump(mode="json")
+    data.update(changes)
+    event_bus.publish(user_ids, event_type, data)
+
+
+async def _create_or_get_pending(
+    session: AsyncSession, payload: DataRequestCreate, provider_connector_id: str
+) -> tuple[DataRequest, bool]:
+    """插入 pending 请求，已存在时返回已有请求；返回 (请求, 是否新建)"""
+    while True:
+        # 先结束此前校验时开启的读事务：SQLite 不会为读事务升级为写事务等待写锁，
+        # 其他请求正在写入时会立即失败（database is locked）；新开的写事务则按 busy_timeout 等待
+        await session.commit()
+        result = await session.execute(
+            insert(DataRequest)
+            .values(
+                data_offering_id=payload.data_offering_id,
+                consumer_connector_id=payload.consumer_connector_id,
+                purpose=payload.purpose,
+                access_mode=payload.access_mode,
+                status="pending",
+            )
+            .on_conflict_do_nothing(
+                index_elements=[DataRequest.consumer_connector_id, DataRequest.data_offering_id],
+                index_where=DataRequest.status == "pending",
+            )
+            .returning(DataRequest)
+        )
+        data_request = result.scalar_one_or_none()
+        if data_request is not None:
+            await apply_transitions(session, DATA_REQUEST, [
+                Transition(payload.consumer_connector_id, provider_connector_id, None, "pending")
+            ])
+            await record(session, [data_request_record(data_request, "data_request.created")])
+            await session.commit()
+            outbox_relay.notify()
+            return data_request, True
+        await session.commit()
+
+        result = await session.execute(
+            select(DataRequest).where(
+                DataRequest.consumer_connector_id == payload.consumer_connector_id,
+                DataRequest.data_offering_id == payload.data_offering_id,
+                DataRequest.status == "pending",
+            )
+        )
+        existing = result.scalar_one_or_none()
+        if existing is not None:
+            return existing, False
+        # 冲突的请求刚好已被处理（不再是 pending），重新插入
+
+
 @router.post("", response_model=DataRequestOut)
 async def create_data_request(
     payload: DataRequestCreate,
@@ -21,15 +94,15 @@ async def create_data_request(
 ):
     """创建数据访问请求（消费者发起）"""
     # 验证消费者连接器属于当前用户
-    result = await session.execute(
-        select(Connector).where(Connector.id == payload.consumer_connector_id)
+    resolved = await resolve_owned(
+        session, Connector, [payload.consumer_connector_id], current_user.id
+    )
+    ensure_access(
+        resolved[payload.consumer_connector_id],
+        "Consumer connector not found or not owned by you",
+        "Consumer connector not found or not owned by you",
+        forbidden_status=404,
     )
-    consumer_connector = result.scalar_one_or_none()
-    if not consumer_connector or consumer_connector.owner_user_id != current_user.id:
-        raise HTTPException(
-            status_code=404,
-            detail="Consumer connector not found or not owned by you"
-        )
 
     # 验证数据资源存在
     result = await session.execute(
@@ -49,17 +122,18 @@ async def create_data_request(
             detail="Cannot request your own data offering"
         )
 
-    # 创建请求
-    data_request = DataRequest(
-        data_offering_id=payload.data_offering_id,
-        consumer_connector_id=payload.consumer_connector_id,
-        purpose=payload.purpose,
-        access_mode=payload.access_mode,
-        status="pending",
-    )
-    session.add(data_request)
-    await session.commit()
-    await session.refresh(data_request)
+    # 创建请求：pending 请求上的部分唯一索引保证并发重复提交只插入一行，
+    # 冲突时幂等地返回已有的 pending 请求
+    data_request, created = await _create_or_get_pending(session, payload, data_offering.connector_id)
+    if not created:
+        return data_request
+
+    provider_user_ids = await connector_owner_ids(session, [data_offering.connector_id])
+    _publish({current_user.id, *provider_user_ids}, "data_request.created", data_request)
+
+    # Open 数据资源的请求交给自动审批任务评估
+    if data_offering.access_policy == "Open":
+        auto_approval_worker.enqueue(data_request.id)
     return data_request
 
 
@@ -77,84 +151,44 @@ async def list_data_requests(
     - role=provider: 作为提供者收到的请求
     - 不指定role: 所有相关请求
     """
-    # 获取当前用户的所有连接器ID
-    user_connectors_result = await session.execute(
-        select(Connector.id).where(Connector.owner_user_id == current_user.id)
-    )
-    user_connector_ids = [row[0] for row in user_connectors_result.fetchall()]
-
-    if not user_connector_ids:
-        return []
+    # 当前用户的连接器以子查询形式参与过滤，避免把 ID 列表物化后再作为 IN 参数回传
+    user_connector_ids = select(Connector.id).where(Connector.owner_user_id == current_user.id)
 
     # 如果指定了connector_id，验证权限
-    if connector_id and connector_id not in user_connector_ids:
-        raise HTTPException(
-            status_code=403,
-            detail="Connector does not belong to you"
-        )
+    if connector_id:
+        resolved = await resolve_owned(session, Connector, [connector_id], current_user.id)
+        if resolved[connector_id].access is not Access.OK:
+            raise HTTPException(
+                status_code=403,
+                detail="Connector does not belong to you"
+            )
+    scope = [connector_id] if connector_id else user_connector_ids
 
     # 构建查询
     if role == "consumer":
         # 作为消费者：查看自己发起的请求
-        if connector_id:
-            query = select(DataRequest).where(
-                DataRequest.consumer_connector_id == connector_id
-            )
-        else:
-            query = select(DataRequest).where(
-                DataRequest.consumer_connector_id.in_(user_connector_ids)
-            )
-    elif role == "provider":
-        # 作为提供者：查看针对自己数据资源的请求
-        # 先获取当前用户的所有数据资源
-        offerings_result = await session.execute(
-            select(DataOffering.id).where(
-                DataOffering.connector_id.in_(user_connector_ids)
-            )
-        )
-        offering_ids = [row[0] for row in offerings_result.fetchall()]
-
-        if not offering_ids:
-            return []
-
-        if connector_id:
-            # 过滤该连接器的数据资源
-            offerings_result = await session.execute(
-                select(DataOffering.id).where(
-                    DataOffering.connector_id == connector_id
-                )
-            )
-            offering_ids = [row[0] for row in offerings_result.fetchall()]
-
         query = select(DataRequest).where(
-            DataRequest.data_offering_id.in_(offering_ids)
+            DataRequest.consumer_connector_id.in_(scope)
+        )
+    elif role == "provider":
+        # 作为提供者：查看针对自己数据资源的请求（联表数据资源）
+        query = (
+            select(DataRequest)
+            .join(DataOffering, DataOffering.id == DataRequest.data_offering_id)
+            .where(DataOffering.connector_id.in_(scope))
         )
     else:
-        # 所有相关请求
-        # 获取作为消费者的请求
-        consumer_requests_ids = []
-        # 获取作为提供者的请求（通过数据资源）
-        offerings_result = await session.execute(
-            select(DataOffering.id).where(
-                DataOffering.connector_id.in_(user_connector_ids)
-            )
+        # 所有相关请求：作为消费者发起的，或针对自己数据资源的
+        provided = exists().where(
+            DataOffering.id == DataRequest.data_offering_id,
+            DataOffering.connector_id.in_(user_connector_ids),
         )
-        offering_ids = [row[0] for row in offerings_result.fetchall()]
-
-        if connector_id:
-            query = select(DataRequest).where(
-                or_(
-                    DataRequest.consumer_connector_id == connector_id,
-                    DataRequest.data_offering_id.in_(offering_ids)
-                )
-            )
-        else:
-            query = select(DataRequest).where(
-                or_(
-                    DataRequest.consumer_connector_id.in_(user_connector_ids),
-                    DataRequest.data_offering_id.in_(offering_ids)
-                )
+        query = select(DataRequest).where(
+            or_(
+                DataRequest.consumer_connector_id.in_(scope),
+                provided,
             )
+        )
 
     # 状态过滤
     if status:
@@ -172,31 +206,9 @@ async def get_data_request(
     current_user=Depends(get_current_user),
 ):
     """获取数据请求详情"""
-    result = await session.execute(
-        select(DataRequest)
-        .options(
-            selectinload(DataRequest.data_offering).selectinload(DataOffering.connector)
-        )
-        .where(DataRequest.id == request_id)
-    )
-    data_request = result.scalar_one_or_none()
-
-    if not data_request:
-        raise HTTPException(status_code=404, detail="Data request not found")
-
     # 验证权限：是消费者或是提供者
-    result = await session.execute(
-        select(Connector).where(Connector.id == data_request.consumer_connector_id)
-    )
-    consumer_connector = result.scalar_one_or_none()
-
-    is_consumer = consumer_connector and consumer_connector.owner_user_id == current_user.id
-    is_provider = data_request.data_offering.connector.owner_user_id == current_user.id
-
-    if not (is_consumer or is_provider):
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    return data_request
+    resolved = await resolve_data_request_parties(session, [request_id], current_user.id)
+    return ensure_access(resolved[request_id], "Data request not found")
 
 
 @router.put("/{request_id}/approve", response_model=DataRequestOut)
@@ -206,29 +218,14 @@ async def approve_data_request(
     current_user=Depends(get_current_user),
 ):
     """同意数据请求（提供者）"""
-    result = await session.execute(
-        select(DataRequest).where(DataRequest.id == request_id)
-    )
-    data_request = result.scalar_one_or_none()
-
-    if not data_request:
-        raise HTTPException(status_code=404, detail="Data request not found")
-
     # 验证是提供者
-    result = await session.execute(
-        select(DataOffering).where(DataOffering.id == data_request.data_offering_id)
+    resolution = (await resolve_data_request_parties(session, [request_id], current_user.id))[request_id]
+    data_request = ensure_access(
+        resolution,
+        "Data request not found",
+        "Only the data provider can approve this request",
     )
-    data_offering = result.scalar_one_or_none()
-
-    if not data_offering:
-        raise HTTPException(status_code=404, detail="Data offering not found")
-
-    result = await session.execute(
-        select(Connector).where(Connector.id == data_offering.connector_id)
-    )
-    provider_connector = result.scalar_one_or_none()
-
-    if not provider_connector or provider_connector.owner_user_id != current_user.id:
+    if not resolution.is_provider:
         raise HTTPException(
             status_code=403,
             detail="Only the data provider can approve this request"
@@ -241,12 +238,19 @@ async def approve_data_request(
             detail=f"Cannot approve request with status: {data_request.status}"
         )
 
-    # 更新状态
-    data_request.status = "approved"
-    data_request.updated_at = datetime.now(timezone.utc)
+    # 条件更新：并发请求已改变状态时返回 409
+    await compare_and_set_status(
+        session, DataRequest, data_request.id, "pending", "approved", datetime.now(timezone.utc)
+    )
+    await apply_transitions(session, DATA_REQUEST, [
+        Transition(data_request.consumer_connector_id, resolution.provider_connector_id, "pending", "approved")
+    ])
+    await record(session, [data_request_record(data_request, "data_request.approved")])
 
     await session.commit()
+    outbox_relay.notify()
     await session.refresh(data_request)
+    _publish(resolution.party_user_ids, "data_request.updated", data_request)
     return data_request
 
 
@@ -257,29 +261,14 @@ async def reject_data_request(
     current_user=Depends(get_current_user),
 ):
     """拒绝数据请求（提供者）"""
-    result = await session.execute(
-        select(DataRequest).where(DataRequest.id == request_id)
-    )
-    data_request = result.scalar_one_or_none()
-
-    if not data_request:
-        raise HTTPException(status_code=404, detail="Data request not found")
-
     # 验证是提供者
-    result = await session.execute(
-        select(DataOffering).where(DataOffering.id == data_request.data_offering_id)
+    resolution = (await resolve_data_request_parties(session, [request_id], current_user.id))[request_id]
+    data_request = ensure_access(
+        resolution,
+        "Data request not found",
+        "Only the data provider can reject this request",
     )
-    data_offering = result.scalar_one_or_none()
-
-    if not data_offering:
-        raise HTTPException(status_code=404, detail="Data offering not found")
-
-    result = await session.execute(
-        select(Connector).where(Connector.id == data_offering.connector_id)
-    )
-    provider_connector = result.scalar_one_or_none()
-
-    if not provider_connector or provider_connector.owner_user_id != current_user.id:
+    if not resolution.is_provider:
         raise HTTPException(
             status_code=403,
             detail="Only the data provider can reject this request"
@@ -292,10 +281,96 @@ async def reject_data_request(
             detail=f"Cannot reject request with status: {data_request.status}"
         )
 
-    # 更新状态
-    data_request.status = "rejected"
-    data_request.updated_at = datetime.now(timezone.utc)
+    # 条件更新：并发请求已改变状态时返回 409
+    await compare_and_set_status(
+        session, DataRequest, data_request.id, "pending", "rejected", datetime.now(timezone.utc)
+    )
+    await apply_transitions(session, DATA_REQUEST, [
+        Transition(data_request.consumer_connector_id, resolution.provider_connector_id, "pending", "rejected")
+    ])
+    await record(session, [data_request_record(data_request, "data_request.rejected")])
 
     await session.commit()
+    outbox_relay.notify()
     await session.refresh(data_request)
+    _publish(resolution.party_user_ids, "data_request.updated", data_request)
     return data_request
+
+
+@router.post("/bulk-decision", response_model=DataRequestBulkDecisionOut)
+async def bulk_decide_data_requests(
+    payload: DataRequestBulkDecision,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """批量同意 / 拒绝数据请求（提供者），逐个返回处理结果"""
+    request_ids = list(dict.fromkeys(payload.request_ids))
+    new_status = "approved" if payload.action == "approve" else "rejected"
+
+    # 一次联表查询完成全部请求的授权
+    resolutions = await resolve_data_request_parties(session, request_ids, current_user.id)
+    authorized = [
+        request_id
+        for request_id, resolution in resolutions.items()
+        if resolution.access is Access.OK and resolution.is_provider
+    ]
+
+    # 一条条件 UPDATE 完成状态迁移，只有仍处于 pending 的请求会被更新
+    updated: set[str] = set()
+    if authorized:
+        now = datetime.now(timezone.utc)
+        result = await session.execute(
+            update(DataRequest)
+            .where(DataRequest.id.in_(authorized), DataRequest.status == "pending")
+            .values(status=new_status, updated_at=now)
+            .returning(DataRequest.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = set(result.scalars().all())
+        await apply_transitions(session, DATA_REQUEST, [
+            Transition(
+                resolutions[request_id].row.consumer_connector_id,
+                resolutions[request_id].provider_connector_id,
+                "pending",
+                new_status,
+            )
+            for request_id in updated
+        ])
+        await record(session, [
+            data_request_record(
+                resolutions[request_id].row,
+                f"data_request.{new_status}",
+                status=new_status,
+                updated_at=now.isoformat(),
+            )
+            for request_id in request_ids
+            if request_id in updated
+        ])
+        await session.commit()
+        outbox_relay.notify()
+
+        for request_id in updated:
+            resolution = resolutions[request_id]
+            _publish(
+                resolution.party_user_ids,
+                "data_request.updated",
+                resolution.row,
+                status=new_status,
+                updated_at=now.isoformat(),
+            )
+
+    results = []
+    for request_id in request_ids:
+        resolution = resolutions[request_id]
+        if resolution.access is Access.NOT_FOUND:
+            results.append(DataRequestDecisionOutcome(id=request_id, outcome="not_found"))
+        elif not resolution.is_provider:
+            results.append(DataRequestDecisionOutcome(id=request_id, outcome="forbidden"))
+        elif request_id in updated:
+            results.append(DataRequestDecisionOutcome(id=request_id, outcome=new_status, status=new_status))
+        else:
+            results.append(DataRequestDecisionOutcome(
+                id=request_id, outcome="not_pending", status=resolution.row.status
+            ))
+
+    return DataRequestBulkDecisionOut(action=payload.action, updated=len(updated), results=results)
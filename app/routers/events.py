@@ -0,0 +1,73 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from ..config import settings
+from ..database import SessionLocal
+from ..deps import authenticate_token
+from ..responses import ClosingStreamingResponse
+from ..services.events import Event, Subscription, event_bus
+
+router = APIRouter(prefix=settings.api_prefix + "/events", tags=["events"])
+
+optional_security = HTTPBearer(auto_error=False)
+
+# 客户端断线后的重连间隔（毫秒）
+RETRY_MS = 3000
+
+
+async def _stream(subscription: Subscription, replay: list[Event], gap: bool):
+    yield f"retry: {RETRY_MS}\n\n"
+    if gap:
+        # 缺口超出缓冲区：通知客户端重新拉取列表（不带 id，不影响 Last-Event-ID）
+        yield "event: reset\ndata: {}\n\n"
+    for event in replay:
+        yield event.encode()
+
+    while not subscription.closed:
+        try:
+            event = await asyncio.wait_for(
+                subscription.queue.get(), timeout=settings.event_heartbeat_seconds
+            )
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
+            continue
+        yield event.encode()
+
+
+@router.get("")
+async def stream_events(
+    token: str | None = Query(default=None, description="浏览器 EventSource 无法设置请求头时通过查询参数传 token"),
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+    last_event_id: str | None = Header(default=None),
+):
+    """订阅当前用户的数据请求 / 合约状态变化事件（Server-Sent Events）"""
+    raw_token = credentials.credentials if credentials else token
+    if not raw_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # 只在建立连接时短暂使用数据库会话，长连接期间不占用连接池
+    async with SessionLocal() as session:
+        user = await authenticate_token(session, raw_token)
+
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        resume_from = None
+
+    subscription, replay, gap = event_bus.subscribe(user.id, resume_from)
+
+    async def close() -> None:
+        # 在响应结束时退订：客户端在响应体开始迭代前断开时生成器的 finally 不会执行
+        event_bus.unsubscribe(subscription)
+
+    return ClosingStreamingResponse(
+        _stream(subscription, replay, gap),
+        close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -17,6 +17,7 @@ from ..schemas import (
     PolicyTemplateOut, 
     ContractTemplateOut
 )
+from ..services.ownership import ensure_access, resolve_owned
 
 router = APIRouter(prefix=settings.api_prefix + "/offerings", tags=["offerings"])
 
@@ -33,10 +34,10 @@ async def create_offering(
       session: AsyncSession = Depends(get_session),
       current_user=Depends(get_current_user),
   ):
-      result = await session.execute(select(Connector).where(Connector.id == connector_id))
-      connector = result.scalar_one_or_none()
-      if not connector or connector.owner_user_id != current_user.id:
-          raise HTTPException(status_code=404, detail="Connector not found")
+      resolved = await resolve_owned(session, Connector, [connector_id], current_user.id)
+      connector = ensure_access(
+          resolved[connector_id], "Connector not found", "Connector not found", forbidden_status=404
+      )
 
       # 如果上传了文件，可以在这里处理
       # if file:
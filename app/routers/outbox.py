@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import get_session
+from ..deps import get_operator
+from ..schemas import OutboxMetricsOut
+from ..services.outbox import outbox_relay
+
+router = APIRouter(prefix=settings.api_prefix + "/outbox", tags=["outbox"])
+
+
+@router.get("/metrics", response_model=OutboxMetricsOut)
+async def get_outbox_metrics(
+    session: AsyncSession = Depends(get_session),
+    operator=Depends(get_operator),
+):
+    """outbox 积压及各 sink 的投递位置、延迟（全局指标，仅运维用户）"""
+    return await outbox_relay.metrics(session)
@@ -1,17 +1,58 @@
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from ..config import settings
 from ..database import get_session
 from ..deps import get_current_user
-from ..models import Connector, PolicyTemplate, PolicyRule
-from ..schemas import PolicyTemplateCreate, PolicyTemplateOut
+from ..models import Connector, ContractTemplate, PolicyTemplate, PolicyRule
+from ..schemas import IpRestrictionMatchOut, PolicyRuleCreate, PolicyTemplateCreate, PolicyTemplateOut
+from ..services.ip_index import ip_restriction_index
+from ..services.odrl import ensure_odrl_artifact
+from ..services.ownership import ensure_access, resolve_owned
+from ..services.template_versions import (
+    snapshot_dependent_contract_templates,
+    snapshot_policy_template,
+)
 
 router = APIRouter(prefix=settings.api_prefix + "/policy-templates", tags=["policy-templates"])
 
+_RULE_FIELDS = ("description", "value", "unit", "is_active")
+
+
+def _diff_rules(
+    existing_rules: list[PolicyRule], new_rules: list[PolicyRuleCreate]
+) -> tuple[list[dict], list[dict], list[str]]:
+    """
+    按稳定键 (type, name, 同名序号) 匹配新旧规则，返回
+    (需要更新的规则, 需要新增的规则, 需要删除的规则 ID)。未变化的规则保持原 ID 不动。
+    """
+    remaining: dict[tuple[str, str], list[PolicyRule]] = {}
+    for rule in existing_rules:
+        remaining.setdefault((rule.type, rule.name), []).append(rule)
+
+    to_update: list[dict] = []
+    to_insert: list[dict] = []
+    for rule_data in new_rules:
+        values = rule_data.model_dump()
+        candidates = remaining.get((rule_data.type, rule_data.name))
+        if candidates:
+            rule = candidates.pop(0)
+            changed = {
+                field: values[field]
+                for field in _RULE_FIELDS
+                if getattr(rule, field) != values[field]
+            }
+            if changed:
+                to_update.append({"id": rule.id, **changed})
+        else:
+            to_insert.append(values)
+
+    to_delete = [rule.id for rules in remaining.values() for rule in rules]
+    return to_update, to_insert, to_delete
+
 
 @router.post("", response_model=PolicyTemplateOut)
 async def create_policy_template(
@@ -21,15 +62,13 @@ async def create_policy_template(
 ):
     """创建策略模板"""
     # 验证连接器属于当前用户
-    result = await session.execute(
-        select(Connector).where(Connector.id == payload.connector_id)
+    resolved = await resolve_owned(session, Connector, [payload.connector_id], current_user.id)
+    ensure_access(
+        resolved[payload.connector_id],
+        "Connector not found or not owned by you",
+        "Connector not found or not owned by you",
+        forbidden_status=404,
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(
-            status_code=404,
-            detail="Connector not found or not owned by you"
-        )
 
     # 创建策略模板
     policy_template = PolicyTemplate(
@@ -56,6 +95,9 @@ async def create_policy_template(
         )
         session.add(rule)
 
+    # 生成不可变版本
+    await snapshot_policy_template(session, policy_template.id)
+
     await session.commit()
     
     # 重新加载策略模板及其规则，以便正确序列化
@@ -65,7 +107,12 @@ async def create_policy_template(
         .where(PolicyTemplate.id == policy_template.id)
     )
     policy_template = result.scalar_one_or_none()
-    
+
+    # 增量更新 ip_restriction 索引
+    ip_restriction_index.update_template(
+        policy_template.connector_id, policy_template.id, policy_template.rules
+    )
+
     return policy_template
 
 
@@ -110,32 +157,47 @@ async def list_policy_templates(
     return templates
 
 
-@router.get("/{template_id}", response_model=PolicyTemplateOut)
-async def get_policy_template(
-    template_id: str,
+@router.get("/ip-restrictions/match", response_model=IpRestrictionMatchOut)
+async def match_ip_restrictions(
+    connector_id: str,
+    ip: str,
     session: AsyncSession = Depends(get_session),
     current_user=Depends(get_current_user),
 ):
-    """获取策略模板详情"""
-    result = await session.execute(
-        select(PolicyTemplate)
-        .options(selectinload(PolicyTemplate.rules))
-        .where(PolicyTemplate.id == template_id)
+    """查询连接器下哪些策略模板的 ip_restriction 允许该地址（基于内存 CIDR 索引）"""
+    resolved = await resolve_owned(session, Connector, [connector_id], current_user.id)
+    ensure_access(
+        resolved[connector_id],
+        "Connector not found or not owned by you",
+        "Connector not found or not owned by you",
+        forbidden_status=404,
     )
-    template = result.scalar_one_or_none()
 
-    if not template:
-        raise HTTPException(status_code=404, detail="Policy template not found")
+    try:
+        matched = ip_restriction_index.match(connector_id, ip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid IP address")
 
-    # 验证权限
-    result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
+    return IpRestrictionMatchOut(
+        connector_id=connector_id,
+        ip=ip,
+        restricted_policy_template_ids=sorted(ip_restriction_index.restricted_templates(connector_id)),
+        matched_policy_template_ids=sorted(matched),
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
 
-    return template
+
+@router.get("/{template_id}", response_model=PolicyTemplateOut)
+async def get_policy_template(
+    template_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    """获取策略模板详情"""
+    resolved = await resolve_owned(
+        session, PolicyTemplate, [template_id], current_user.id,
+        options=[selectinload(PolicyTemplate.rules)],
+    )
+    return ensure_access(resolved[template_id], "Policy template not found")
 
 
 @router.put("/{template_id}", response_model=PolicyTemplateOut)
@@ -146,22 +208,9 @@ async def update_policy_template(
     current_user=Depends(get_current_user),
 ):
     """更新策略模板"""
-    # 查找模板
-    result = await session.execute(
-        select(PolicyTemplate).where(PolicyTemplate.id == template_id)
-    )
-    template = result.scalar_one_or_none()
-
-    if not template:
-        raise HTTPException(status_code=404, detail="Policy template not found")
-
-    # 验证权限
-    result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
-    )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
+    # 查找模板并验证权限
+    resolved = await resolve_owned(session, PolicyTemplate, [template_id], current_user.id)
+    template = ensure_access(resolved[template_id], "Policy template not found")
 
     # 更新基本信息
     template.name = payload.name
@@ -171,31 +220,50 @@ async def update_policy_template(
     template.enforcement_type = payload.enforcement_type
     template.updated_at = datetime.now(timezone.utc)
 
-    # 删除旧规则
-    await session.execute(
-        select(PolicyRule).where(PolicyRule.policy_template_id == template_id)
-    )
-    old_rules = (await session.execute(
-        select(PolicyRule).where(PolicyRule.policy_template_id == template_id)
+    # 与现有规则做差异比较，只对变化的规则执行批量 UPDATE / INSERT / DELETE
+    existing_rules = (await session.execute(
+        select(PolicyRule)
+        .where(PolicyRule.policy_template_id == template_id)
+        .order_by(PolicyRule.created_at, PolicyRule.id)
     )).scalars().all()
-    for rule in old_rules:
-        await session.delete(rule)
-
-    # 添加新规则
-    for rule_data in payload.rules:
-        rule = PolicyRule(
-            policy_template_id=template.id,
-            type=rule_data.type,
-            name=rule_data.name,
-            description=rule_data.description,
-            value=rule_data.value,
-            unit=rule_data.unit,
-            is_active=rule_data.is_active,
+    to_update, to_insert, to_delete = _diff_rules(existing_rules, payload.rules)
+
+    if to_delete:
+        await session.execute(delete(PolicyRule).where(PolicyRule.id.in_(to_delete)))
+    if to_update:
+        await session.execute(update(PolicyRule), to_update)
+    if to_insert:
+        await session.execute(
+            insert(PolicyRule),
+            [{"policy_template_id": template.id, **values} for values in to_insert],
         )
-        session.add(rule)
+
+    # 生成新版本；引用它的合约模板随之生成新版本，已有合约仍固定在旧版本
+    await snapshot_policy_template(session, template.id)
+    dependent_ids = await snapshot_dependent_contract_templates(session, template.id)
+
+    # 为新版本增量编译 ODRL 制品
+    if dependent_ids:
+        dependents = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.id.in_(dependent_ids))
+        )).scalars().all()
+        for contract_template in dependents:
+            await ensure_odrl_artifact(session, contract_template)
 
     await session.commit()
-    await session.refresh(template)
+
+    # 重新加载策略模板及其规则，以便正确序列化
+    result = await session.execute(
+        select(PolicyTemplate)
+        .options(selectinload(PolicyTemplate.rules))
+        .where(PolicyTemplate.id == template.id)
+        .execution_options(populate_existing=True)
+    )
+    template = result.scalar_one()
+
+    # 增量更新 ip_restriction 索引
+    ip_restriction_index.update_template(template.connector_id, template.id, template.rules)
+
     return template
 
 
@@ -206,27 +274,31 @@ async def delete_policy_template(
     current_user=Depends(get_current_user),
 ):
     """删除策略模板"""
-    # 查找模板
-    result = await session.execute(
-        select(PolicyTemplate).where(PolicyTemplate.id == template_id)
-    )
-    template = result.scalar_one_or_none()
-
-    if not template:
-        raise HTTPException(status_code=404, detail="Policy template not found")
+    # 查找模板并验证权限
+    resolved = await resolve_owned(session, PolicyTemplate, [template_id], current_user.id)
+    ensure_access(resolved[template_id], "Policy template not found")
 
-    # 验证权限
+    # 条件删除：检查引用计数与删除在同一条语句中完成，并发新增的引用不会被漏掉
+    await session.execute(delete(PolicyRule).where(PolicyRule.policy_template_id == template_id))
     result = await session.execute(
-        select(Connector).where(Connector.id == template.connector_id)
+        delete(PolicyTemplate)
+        .where(PolicyTemplate.id == template_id, PolicyTemplate.reference_count == 0)
+        .execution_options(synchronize_session=False)
     )
-    connector = result.scalar_one_or_none()
-    if not connector or connector.owner_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    # 检查是否被合约模板使用
-    # TODO: 添加检查逻辑，如果被使用则不允许删除
-
-    await session.delete(template)
+    if result.rowcount == 0:
+        references = (await session.execute(
+            select(PolicyTemplate.reference_count).where(PolicyTemplate.id == template_id)
+        )).scalar_one_or_none()
+        await session.rollback()
+        if references is None:
+            # 已被并发删除
+            raise HTTPException(status_code=404, detail="Policy template not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Policy template is used by {references} contract template(s)"
+        )
     await session.commit()
 
+    ip_restriction_index.remove_template(template_id)
+
     return {"message": "Policy template deleted successfully"}
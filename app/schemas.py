@@ -199,12 +199,25 @@ class PolicyTemplateOut(BaseModel):
     enforcement_type: str
     created_at: datetime
     updated_at: datetime | None
+    version_hash: str | None = None
+    # 引用该策略模板的合约模板数
+    reference_count: int = 0
     rules: list[PolicyRuleOut]
 
     class Config:
         from_attributes = True
 
 
+class IpRestrictionMatchOut(BaseModel):
+    """ip_restriction 索引查询结果"""
+    connector_id: str
+    ip: str
+    # 该连接器下带有 ip_restriction 规则的策略模板
+    restricted_policy_template_ids: list[str]
+    # 其中允许该地址访问的策略模板
+    matched_policy_template_ids: list[str]
+
+
   # -------- Contract Template --------
 class ContractTemplateCreate(BaseModel):
     connector_id: str
@@ -225,6 +238,7 @@ class ContractTemplateOut(BaseModel):
     usage_count: int
     created_at: datetime
     updated_at: datetime | None
+    version_hash: str | None = None
     policy_templates: list[PolicyTemplateOut]
 
     class Config:
@@ -277,6 +291,24 @@ class DataRequestOut(BaseModel):
         from_attributes = True
 
 
+class DataRequestBulkDecision(BaseModel):
+    request_ids: list[str] = Field(min_length=1, max_length=1000)
+    action: Literal["approve", "reject"]
+
+
+class DataRequestDecisionOutcome(BaseModel):
+    id: str
+    outcome: Literal["approved", "rejected", "not_found", "forbidden", "not_pending"]
+    # 决定后的状态；not_pending 时为请求当前状态，not_found / forbidden 时为空
+    status: str | None = None
+
+
+class DataRequestBulkDecisionOut(BaseModel):
+    action: Literal["approve", "reject"]
+    updated: int
+    results: list[DataRequestDecisionOutcome]
+
+
   # -------- Contract --------
 class ContractCreate(BaseModel):
     name: str
@@ -302,12 +334,197 @@ class ContractOut(BaseModel):
     contract_template_id: str
     data_offering_id: str
     data_request_id: str | None
+    contract_template_version_hash: str | None = None
     contract_address: str | None
     blockchain_tx_id: str | None
     blockchain_network: str
     expires_at: datetime | None
+    activated_at: datetime | None = None
     created_at: datetime
     updated_at: datetime | None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ContractTermsOut(BaseModel):
+    """合约固定的合约模板版本（含展开的策略模板版本）"""
+    contract_id: str
+    contract_template_version_hash: str
+    document: dict
+
+
+class DeploymentJobOut(BaseModel):
+    """合约上链任务"""
+    id: str
+    contract_id: str
+    status: str
+    attempts: int
+    error: str | None
+    network: str | None
+    block_number: int | None
+    tx_id: str | None
+    created_at: datetime
+    updated_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
+class MerkleProofStep(BaseModel):
+    # 兄弟节点在左侧还是右侧
+    side: Literal["left", "right"]
+    hash: str
+
+
+class ContractAnchorProofOut(BaseModel):
+    """合约在 Merkle 锚定中的包含证明：按顺序与兄弟节点哈希即可重算 root"""
+    contract_id: str
+    digest: str
+    leaf_index: int
+    leaf_count: int
+    anchor_id: str
+    root: str
+    network: str | None
+    block_number: int | None
+    tx_id: str | None
+    proof: list[MerkleProofStep]
+
+
+class AccessCheckItem(BaseModel):
+    consumer_connector_id: str
+    data_offering_id: str
+
+
+class AccessCheckOut(BaseModel):
+    """消费者连接器对数据资源是否持有有效（active 且未到期）合约"""
+    consumer_connector_id: str
+    data_offering_id: str
+    allowed: bool
+    contract_id: str | None = None
+    # 有效窗口终点：min(expires_at, 生效时间 + access_period)
+    expires_at: datetime | None = None
+
+
+class AccessCheckBatch(BaseModel):
+    checks: list[AccessCheckItem] = Field(min_length=1, max_length=1000)
+
+
+class AccessCheckBatchOut(BaseModel):
+    results: list[AccessCheckOut]
+
+
+  # -------- Contract Usage --------
+class ContractUsageRecord(BaseModel):
+    """数据平面上报一次访问"""
+    bytes_transferred: int = Field(default=0, ge=0)
+
+
+class ContractUsageOut(BaseModel):
+    contract_id: str
+    access_count: int
+    bytes_transferred: int
+    access_count_limit: int | None
+    transfer_limit_bytes: int | None
+    access_count_exceeded: bool
+    transfer_limit_exceeded: bool
+    last_flushed_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
+  # -------- Auto Approval --------
+class AutoApprovalRuleCreate(BaseModel):
+    connector_id: str
+    data_offering_id: str | None = None
+    access_mode: Literal["api", "download"] | None = None
+    allowed_consumer_connector_ids: list[str] | None = None
+    contract_template_id: str | None = None
+    contract_validity_days: int | None = Field(default=None, gt=0)
+
+
+class AutoApprovalRuleOut(BaseModel):
+    id: str
+    connector_id: str
+    data_offering_id: str | None
+    access_mode: str | None
+    allowed_consumer_connector_ids: list[str] | None
+    contract_template_id: str | None
+    contract_validity_days: int | None
+    is_active: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AutoApprovalMetricsOut(BaseModel):
+    queue_depth: int
+    queue_capacity: int
+    # 队列已满时未入队的请求数（由定期扫描补偿处理）
+    dropped: int
+    batches: int
+    failed_batches: int
+    # 所在批次失败、单独重试仍失败而不再自动处理的请求数
+    failed_requests: int
+    approved: int
+    unmatched: int
+    contracts_created: int
+    # 从请求创建到自动批准的耗时（秒），基于最近的样本
+    decision_latency_p50: float | None
+    decision_latency_p95: float | None
+    decision_latency_max: float | None
+    last_batch_seconds: float | None
+
+
+  # -------- Dashboard --------
+class StatusCountOut(BaseModel):
+    connector_id: str
+    role: Literal["consumer", "provider"]
+    status: str
+    count: int
+
+    class Config:
+        from_attributes = True
+
+
+class DashboardSummaryOut(BaseModel):
+    data_requests: list[StatusCountOut]
+    contracts: list[StatusCountOut]
+
+
+  # -------- Outbox --------
+class OutboxSinkMetricsOut(BaseModel):
+    name: str
+    # 已投递到的事件 ID
+    offset: int
+    pending: int
+    # 最早一条未投递事件已等待的时间（秒）
+    lag_seconds: float
+    delivered: int
+    failures: int
+    last_error: str | None
+    last_delivery_lag_seconds: float | None
+
+
+class OutboxMetricsOut(BaseModel):
+    head_event_id: int
+    # 本进程启动以来删除的已投递事件数
+    pruned: int
+    sinks: list[OutboxSinkMetricsOut]
+
+
+  # -------- Data Plane --------
+class ObjectUploadOut(BaseModel):
+    etag: str
+    size: int
+    parts: int
+    sha256: str
+
+
+class TransferKeyOut(BaseModel):
+    contract_id: str
+    algorithm: str
+    # base64 编码的 AES-256 合约密钥
+    key: str
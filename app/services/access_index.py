@@ -0,0 +1,123 @@
+"""
+有效合约访问索引
+
+数据平面每次访问都要回答“消费者连接器 C 对数据资源 O 是否持有 active 合约”。
+内存中按 (consumer_connector_id, data_offering_id) 索引全部 active 合约，
+每条记录带有有效窗口的终点（与 /contracts/valid 相同：min(expires_at, 生效时间 + access_period)）
+及合约双方连接器的所有者，查询时不访问数据库：
+
+- 启动时从数据库全量加载；合约确认时加入，拒绝 / 过期时移除；
+- 查询时再比较有效期终点，过期扫描尚未执行、或 access_period 已用完时都不会放行；
+- 只有合约双方连接器的所有者能查到该合约，其他调用方一律得到“无有效合约”。
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..models import Connector, Contract
+from .interval_index import ContractValidityIndex, load_access_periods
+
+
+@dataclass(frozen=True)
+class ActiveContract:
+    contract_id: str
+    # 有效窗口终点（UTC 时间戳），无到期时间且无 access_period 为 inf
+    valid_until: float
+    # 合约双方连接器的所有者
+    party_user_ids: frozenset[str]
+
+
+class _PairEntry:
+    __slots__ = ("contracts", "best")
+
+    def __init__(self):
+        self.contracts: dict[str, ActiveContract] = {}
+        # 有效期最晚结束的合约；它已结束则该键下全部合约都已结束
+        self.best: ActiveContract | None = None
+
+    def refresh(self) -> None:
+        self.best = max(self.contracts.values(), key=lambda contract: contract.valid_until, default=None)
+
+
+class ActiveContractIndex:
+    def __init__(self):
+        self._by_pair: dict[tuple[str, str], _PairEntry] = {}
+        self._pairs: dict[str, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def _add(self, contract_id: str, key: tuple[str, str], valid_until: float, party_user_ids) -> None:
+        contract = ActiveContract(contract_id, valid_until, frozenset(party_user_ids))
+        entry = self._by_pair.get(key)
+        if entry is None:
+            entry = self._by_pair[key] = _PairEntry()
+        entry.contracts[contract_id] = contract
+        if entry.best is None or contract.valid_until >= entry.best.valid_until:
+            entry.best = contract
+        self._pairs[contract_id] = key
+
+    def upsert(self, contract: Contract, party_user_ids, access_period: timedelta | None) -> None:
+        """按合约当前状态更新：active 则加入（或更新），否则移除"""
+        self.remove(contract.id)
+        if contract.status == "active":
+            self._add(
+                contract.id,
+                (contract.consumer_connector_id, contract.data_offering_id),
+                ContractValidityIndex.window(contract, access_period)[1],
+                party_user_ids,
+            )
+
+    def remove(self, contract_id: str) -> None:
+        key = self._pairs.pop(contract_id, None)
+        if key is None:
+            return
+        entry = self._by_pair[key]
+        del entry.contracts[contract_id]
+        if not entry.contracts:
+            del self._by_pair[key]
+        elif entry.best.contract_id == contract_id:
+            entry.refresh()
+
+    def check(
+        self, consumer_connector_id: str, data_offering_id: str, user_id: str, now: float | None = None
+    ) -> ActiveContract | None:
+        """user_id 作为合约一方可见的、当前有效的合约（有多个时取有效期最晚结束的）
+
+        同一 (消费者连接器, 数据资源) 下合约的双方连接器相同（提供者即数据资源所属连接器），
+        只需检查到期最晚的一个。
+        """
+        entry = self._by_pair.get((consumer_connector_id, data_offering_id))
+        if entry is None:
+            return None
+        best = entry.best
+        if best.valid_until <= (time.time() if now is None else now) or user_id not in best.party_user_ids:
+            return None
+        return best
+
+    async def load(self, session: AsyncSession) -> None:
+        """启动时从数据库全量构建"""
+        consumer = aliased(Connector)
+        provider = aliased(Connector)
+        result = await session.execute(
+            select(Contract, consumer.owner_user_id, provider.owner_user_id)
+            .join(consumer, consumer.id == Contract.consumer_connector_id)
+            .join(provider, provider.id == Contract.provider_connector_id)
+            .where(Contract.status == "active")
+        )
+        rows = result.all()
+        periods = await load_access_periods(
+            session,
+            {c.contract_template_version_hash for c, _, _ in rows if c.contract_template_version_hash},
+        )
+        self._by_pair.clear()
+        self._pairs.clear()
+        for contract, consumer_owner, provider_owner in rows:
+            self.upsert(contract, {consumer_owner, provider_owner}, periods.get(contract.contract_template_version_hash))
+
+
+active_contract_index = ActiveContractIndex()
@@ -0,0 +1,177 @@
+"""
+合约的 Merkle 锚定
+
+定期把尚未锚定的 active 合约按其规范化摘要（见 deployments.contract_digest）构建为
+一棵 Merkle 树，只把树根写入链后端；树的全部节点按 (anchor_id, level, position)
+存储，任一合约的包含证明只需按位置读取 O(log n) 个兄弟节点，无需重建整棵树。
+
+- 叶子 = SHA-256(0x00 || 合约摘要)，内部节点 = SHA-256(0x01 || 左 || 右)，区分叶子与内部节点；
+- 某一层节点数为奇数时，最后一个节点直接提升到上一层（证明中该层没有兄弟节点）。
+"""
+import asyncio
+import hashlib
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import AnchoredContract, Contract, ContractAnchor, MerkleNode
+from .chain import ChainBackend, chain_backend
+from .deployments import contract_digest
+
+
+def leaf_hash(digest: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(digest)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_levels(digests: list[str]) -> list[list[bytes]]:
+    """自底向上构建全部层，levels[0] 为叶子，levels[-1] 为 [root]"""
+    levels = [[leaf_hash(digest) for digest in digests]]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        above = [node_hash(below[i], below[i + 1]) for i in range(0, len(below) - 1, 2)]
+        if len(below) % 2:
+            above.append(below[-1])
+        levels.append(above)
+    return levels
+
+
+def proof_positions(position: int, leaf_count: int) -> list[tuple[int, int]]:
+    """叶子到根路径上各层兄弟节点的 (level, position)；奇数层末尾节点没有兄弟"""
+    positions = []
+    level, width = 0, leaf_count
+    while width > 1:
+        sibling = position ^ 1
+        if sibling < width:
+            positions.append((level, sibling))
+        position //= 2
+        width = (width + 1) // 2
+        level += 1
+    return positions
+
+
+def verify_proof(digest: str, proof: list[dict], root: str) -> bool:
+    """按证明从叶子重算树根（供客户端参考实现）"""
+    current = leaf_hash(digest)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        current = node_hash(sibling, current) if step["side"] == "left" else node_hash(current, sibling)
+    return current.hex() == root
+
+
+async def load_proof(session: AsyncSession, contract_id: str) -> dict | None:
+    """合约的包含证明；尚未锚定时返回 None"""
+    row = (await session.execute(
+        select(AnchoredContract, ContractAnchor)
+        .join(ContractAnchor, ContractAnchor.id == AnchoredContract.anchor_id)
+        .where(AnchoredContract.contract_id == contract_id)
+    )).one_or_none()
+    if row is None:
+        return None
+    anchored, anchor = row
+
+    positions = proof_positions(anchored.position, anchor.leaf_count)
+    siblings = {}
+    if positions:
+        result = await session.execute(
+            select(MerkleNode.level, MerkleNode.position, MerkleNode.hash).where(
+                MerkleNode.anchor_id == anchor.id,
+                tuple_(MerkleNode.level, MerkleNode.position).in_(positions),
+            )
+        )
+        siblings = {(level, position): node for level, position, node in result.all()}
+
+    proof = [
+        {
+            "side": "left" if position < anchored.position >> level else "right",
+            "hash": siblings[(level, position)],
+        }
+        for level, position in positions
+    ]
+    return {
+        "contract_id": contract_id,
+        "digest": anchored.digest,
+        "leaf_index": anchored.position,
+        "leaf_count": anchor.leaf_count,
+        "anchor_id": anchor.id,
+        "root": anchor.root,
+        "network": anchor.network,
+        "block_number": anchor.block_number,
+        "tx_id": anchor.tx_id,
+        "proof": proof,
+    }
+
+
+class MerkleAnchorer:
+    def __init__(self, chain: ChainBackend, interval: float, max_leaves: int):
+        self.chain = chain
+        self.interval = interval
+        self.max_leaves = max_leaves
+        self._lock = asyncio.Lock()
+
+    async def anchor_pending(self) -> ContractAnchor | None:
+        """锚定一批尚未锚定的 active 合约，没有待锚定合约时返回 None"""
+        async with self._lock, SessionLocal() as session:
+            already = select(AnchoredContract.contract_id).where(
+                AnchoredContract.contract_id == Contract.id
+            ).exists()
+            contracts = (await session.execute(
+                select(Contract)
+                .where(Contract.status == "active", ~already)
+                .order_by(Contract.created_at, Contract.id)
+                .limit(self.max_leaves)
+            )).scalars().all()
+            if not contracts:
+                return None
+
+            digests = [contract_digest(contract) for contract in contracts]
+            levels = build_levels(digests)
+            root = levels[-1][0].hex()
+            receipt = await self.chain.anchor(root)
+
+            anchor = ContractAnchor(
+                root=root,
+                leaf_count=len(contracts),
+                network=self.chain.network,
+                block_number=receipt.block_number,
+                tx_id=receipt.tx_id,
+            )
+            session.add(anchor)
+            await session.flush()
+
+            nodes = [
+                {"anchor_id": anchor.id, "level": level, "position": position, "hash": node.hex()}
+                for level, hashes in enumerate(levels)
+                for position, node in enumerate(hashes)
+            ]
+            leaves = [
+                {"contract_id": contract.id, "anchor_id": anchor.id, "position": position, "digest": digest}
+                for position, (contract, digest) in enumerate(zip(contracts, digests))
+            ]
+            await session.execute(insert(MerkleNode), nodes)
+            await session.execute(insert(AnchoredContract), leaves)
+            await session.commit()
+            return anchor
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # 积压超过 max_leaves 时连续锚定多棵树
+                while await self.anchor_pending():
+                    pass
+            except Exception:
+                # 下一轮重试
+                pass
+
+
+merkle_anchorer = MerkleAnchorer(
+    chain=chain_backend,
+    interval=settings.anchor_interval_seconds,
+    max_leaves=settings.anchor_max_leaves,
+)
@@ -0,0 +1,393 @@
+"""
+Open 数据资源请求的自动审批
+
+新建的数据请求（数据资源 access_policy == "Open"）进入有界队列，后台任务按批取出，
+对照提供者配置的 AutoApprovalRule 评估；命中的请求在同一个事务中批准，规则指定了
+合约模板时同时创建合约（等待消费者确认），请求标记为 completed。
+
+- 背压：队列有界，入队不阻塞请求处理；队列满时丢弃入队，由定期扫描从数据库补齐；
+- 未命中任何规则的请求记录评估时间，扫描不再补入，直到提供者新增规则（规则只增删，
+  删除不会产生新的命中），避免反复评估并挤占新请求的扫描名额；
+- 整批失败时逐个重试，单独仍失败的请求记录评估时间和错误，不再被扫描补入，
+  一个出错的请求不会让同一批请求反复失败、阻塞之后的请求；
+- 状态迁移用条件 UPDATE（WHERE status = 'pending'），与人工审批并发时人工决定优先；
+- 指标：队列深度、丢弃数、批次数、从请求创建到自动批准的耗时分位数。
+"""
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import AutoApprovalRule, Connector, Contract, ContractTemplate, DataOffering, DataRequest
+from ..schemas import ContractOut, DataRequestOut
+from .events import event_bus
+from .interval_index import to_timestamp
+from .outbox import contract_record, data_request_record, outbox_relay, record
+from .status_counters import CONTRACT, DATA_REQUEST, Transition, apply_transitions
+from .template_versions import snapshot_contract_template
+
+# 耗时分位数基于最近的样本数
+_LATENCY_SAMPLES = 1000
+
+
+def match_rule(
+    rules: list[AutoApprovalRule], data_request: DataRequest, offering: DataOffering
+) -> AutoApprovalRule | None:
+    """返回命中的规则：指定数据资源的规则优先，其次按创建顺序"""
+    fallback = None
+    for rule in rules:
+        if rule.data_offering_id not in (None, offering.id):
+            continue
+        if rule.access_mode not in (None, data_request.access_mode):
+            continue
+        allowed = rule.allowed_consumer_connector_ids
+        if allowed is not None and data_request.consumer_connector_id not in allowed:
+            continue
+        if rule.data_offering_id is not None:
+            return rule
+        fallback = fallback or rule
+    return fallback
+
+
+class AutoApprovalWorker:
+    def __init__(self, batch_size: int, queue_size: int, sweep_interval: float):
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        # 已在队列中的请求 ID，避免入队与扫描重复
+        self._queued: set[str] = set()
+        self._last_sweep = 0.0
+
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.failed_requests = 0
+        self.approved = 0
+        self.unmatched = 0
+        self.contracts_created = 0
+        self.last_batch_seconds: float | None = None
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._max_latency: float | None = None
+
+    def enqueue(self, request_id: str) -> bool:
+        """非阻塞入队；队列已满时返回 False，留给定期扫描处理"""
+        if request_id in self._queued:
+            return True
+        try:
+            self._queue.put_nowait(request_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._queued.add(request_id)
+        return True
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def quantile(q: float) -> float | None:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_requests": self.failed_requests,
+            "approved": self.approved,
+            "unmatched": self.unmatched,
+            "contracts_created": self.contracts_created,
+            "decision_latency_p50": quantile(0.5),
+            "decision_latency_p95": quantile(0.95),
+            "decision_latency_max": self._max_latency,
+            "last_batch_seconds": self.last_batch_seconds,
+        }
+
+    async def sweep(self) -> int:
+        """把数据库中待处理（有生效规则的 Open 资源上的 pending 请求）补入队列，不超过剩余容量"""
+        self._last_sweep = time.monotonic()
+        capacity = self._queue.maxsize - self._queue.qsize()
+        if capacity <= 0:
+            return 0
+        has_rule = exists().where(
+            AutoApprovalRule.connector_id == DataOffering.connector_id,
+            AutoApprovalRule.is_active.is_(True),
+        )
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(DataRequest.id)
+                .join(DataOffering, DataOffering.id == DataRequest.data_offering_id)
+                .where(
+                    DataRequest.status == "pending",
+                    DataRequest.auto_approval_evaluated_at.is_(None),
+                    DataOffering.access_policy == "Open",
+                    has_rule,
+                )
+                .order_by(DataRequest.created_at)
+                .limit(capacity + len(self._queued))
+            )
+            request_ids = result.scalars().all()
+        added = 0
+        for request_id in request_ids:
+            if request_id in self._queued:
+                continue
+            if not self.enqueue(request_id):
+                break
+            added += 1
+        return added
+
+    async def process_batch(self, request_ids: list[str]) -> None:
+        """在一个事务中评估并处理一批请求，提交后推送事件"""
+        started = time.perf_counter()
+        consumer = aliased(Connector)
+        provider = aliased(Connector)
+        async with SessionLocal() as session:
+            rows = (await session.execute(
+                select(DataRequest, DataOffering, consumer.owner_user_id, provider.owner_user_id)
+                .join(DataOffering, DataOffering.id == DataRequest.data_offering_id)
+                .join(consumer, consumer.id == DataRequest.consumer_connector_id)
+                .join(provider, provider.id == DataOffering.connector_id)
+                .where(
+                    DataRequest.id.in_(request_ids),
+                    DataRequest.status == "pending",
+                    DataOffering.access_policy == "Open",
+                )
+            )).all()
+            if not rows:
+                return
+
+            rules_by_connector: dict[str, list[AutoApprovalRule]] = {}
+            result = await session.execute(
+                select(AutoApprovalRule)
+                .where(
+                    AutoApprovalRule.connector_id.in_({offering.connector_id for _, offering, _, _ in rows}),
+                    AutoApprovalRule.is_active.is_(True),
+                )
+                .order_by(AutoApprovalRule.created_at)
+            )
+            for rule in result.scalars().all():
+                rules_by_connector.setdefault(rule.connector_id, []).append(rule)
+
+            matched = {}
+            unmatched = []
+            for data_request, offering, consumer_owner, provider_owner in rows:
+                rule = match_rule(rules_by_connector.get(offering.connector_id, []), data_request, offering)
+                if rule is None:
+                    unmatched.append(data_request.id)
+                    continue
+                matched[data_request.id] = (data_request, offering, rule, {consumer_owner, provider_owner})
+
+            template_ids = {rule.contract_template_id for _, _, rule, _ in matched.values() if rule.contract_template_id}
+            templates = {}
+            if template_ids:
+                result = await session.execute(
+                    select(ContractTemplate).where(ContractTemplate.id.in_(template_ids))
+                )
+                templates = {template.id: template for template in result.scalars().all()}
+
+            def template_for(offering: DataOffering, rule: AutoApprovalRule) -> ContractTemplate | None:
+                template = templates.get(rule.contract_template_id)
+                if template is None or template.connector_id != offering.connector_id:
+                    return None
+                return template
+
+            with_contract = {
+                request_id for request_id, (_, offering, rule, _) in matched.items()
+                if template_for(offering, rule)
+            }
+            approve_only = [request_id for request_id in matched if request_id not in with_contract]
+
+            # 条件 UPDATE：期间被人工处理过的请求不会被覆盖
+            now = datetime.now(timezone.utc)
+            if unmatched:
+                await session.execute(
+                    update(DataRequest)
+                    .where(DataRequest.id.in_(unmatched), DataRequest.status == "pending")
+                    .values(auto_approval_evaluated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            decided: dict[str, str] = {}
+            for ids, new_status in ((approve_only, "approved"), (list(with_contract), "completed")):
+                if not ids:
+                    continue
+                result = await session.execute(
+                    update(DataRequest)
+                    .where(DataRequest.id.in_(ids), DataRequest.status == "pending")
+                    .values(status=new_status, updated_at=now)
+                    .returning(DataRequest.id)
+                    .execution_options(synchronize_session=False)
+                )
+                for request_id in result.scalars().all():
+                    decided[request_id] = new_status
+
+            contracts = []
+            template_uses: dict[str, int] = {}
+            for request_id in decided:
+                data_request, offering, rule, _ = matched[request_id]
+                template = template_for(offering, rule)
+                if decided[request_id] != "completed" or template is None:
+                    continue
+                version_hash = template.version_hash
+                if version_hash is None:
+                    version_hash = await snapshot_contract_template(session, template.id)
+                contracts.append(Contract(
+                    name=f"{offering.title} (auto-approved)",
+                    status="pending_consumer",
+                    provider_connector_id=offering.connector_id,
+                    consumer_connector_id=data_request.consumer_connector_id,
+                    contract_template_id=template.id,
+                    data_offering_id=offering.id,
+                    data_request_id=request_id,
+                    contract_template_version_hash=version_hash,
+                    expires_at=(
+                        now + timedelta(days=rule.contract_validity_days)
+                        if rule.contract_validity_days else None
+                    ),
+                ))
+                template_uses[template.id] = template_uses.get(template.id, 0) + 1
+            session.add_all(contracts)
+
+            # 状态计数与状态变更在同一事务中更新
+            await apply_transitions(session, DATA_REQUEST, [
+                Transition(
+                    matched[request_id][0].consumer_connector_id,
+                    matched[request_id][1].connector_id,
+                    "pending",
+                    new_status,
+                )
+                for request_id, new_status in decided.items()
+            ])
+            await apply_transitions(session, CONTRACT, [
+                Transition(contract.consumer_connector_id, contract.provider_connector_id, None, contract.status)
+                for contract in contracts
+            ])
+
+            for template_id, uses in template_uses.items():
+                await session.execute(
+                    update(ContractTemplate)
+                    .where(ContractTemplate.id == template_id)
+                    .values(
+                        usage_count=ContractTemplate.usage_count + uses,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+
+            # 合约的 ID 与创建时间在 flush 时生成，之后才能构造事件内容
+            await session.flush()
+            await record(session, [
+                data_request_record(
+                    matched[request_id][0],
+                    f"data_request.{new_status}",
+                    status=new_status,
+                    updated_at=now.isoformat(),
+                )
+                for request_id, new_status in decided.items()
+            ] + [contract_record(contract, "contract.created") for contract in contracts])
+            await session.commit()
+        outbox_relay.notify()
+
+        decided_at = to_timestamp(now)
+        for request_id, new_status in decided.items():
+            data_request, _, _, parties = matched[request_id]
+            latency = max(0.0, decided_at - to_timestamp(data_request.created_at))
+            self._latencies.append(latency)
+            self._max_latency = max(self._max_latency or 0.0, latency)
+            data = DataRequestOut.model_validate(data_request).model_dump(mode="json")
+            data.update(status=new_status, updated_at=now.isoformat())
+            event_bus.publish(parties, "data_request.updated", data)
+        for contract in contracts:
+            _, _, _, parties = matched[contract.data_request_id]
+            event_bus.publish(
+                parties, "contract.created", ContractOut.model_validate(contract).model_dump(mode="json")
+            )
+
+        self.batches += 1
+        self.unmatched += len(unmatched)
+        self.approved += len(decided)
+        self.contracts_created += len(contracts)
+        self.last_batch_seconds = time.perf_counter() - started
+
+    async def run(self) -> None:
+        """后台循环：启动时及每隔 sweep_interval 扫描一次，其余时间消费队列"""
+        while True:
+            if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                try:
+                    await self.sweep()
+                except Exception:
+                    # 下一轮重试
+                    pass
+
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.sweep_interval)
+            except asyncio.TimeoutError:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._queued.difference_update(batch)
+
+            try:
+                await self.process_batch(batch)
+            except Exception as exc:
+                # 整批回滚；逐个重试，找出出错的请求
+                self.failed_batches += 1
+                if len(batch) > 1:
+                    await self._retry_individually(batch)
+                else:
+                    await self._mark_failed(batch[0], exc)
+
+    async def _retry_individually(self, request_ids: list[str]) -> None:
+        for request_id in request_ids:
+            try:
+                await self.process_batch([request_id])
+            except Exception as exc:
+                await self._mark_failed(request_id, exc)
+
+    async def _mark_failed(self, request_id: str, exc: Exception) -> None:
+        """记录评估时间和错误，扫描不再补入；提供者新增规则时与未命中的请求一样重新评估"""
+        error = str(exc) or type(exc).__name__
+        try:
+            async with SessionLocal() as session:
+                await session.execute(
+                    update(DataRequest)
+                    .where(DataRequest.id == request_id, DataRequest.status == "pending")
+                    .values(auto_approval_evaluated_at=datetime.now(timezone.utc), auto_approval_error=error[:1000])
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception:
+            # 未能记录时请求仍为 pending，由下一次扫描重试
+            return
+        self.failed_requests += 1
+
+
+async def reset_evaluations(session: AsyncSession, connector_id: str) -> None:
+    """提供者新增规则后，清空其数据资源上 pending 请求的评估记录，由扫描重新评估"""
+    await session.execute(
+        update(DataRequest)
+        .where(
+            DataRequest.status == "pending",
+            DataRequest.auto_approval_evaluated_at.is_not(None),
+            DataRequest.data_offering_id.in_(
+                select(DataOffering.id).where(DataOffering.connector_id == connector_id)
+            ),
+        )
+        .values(auto_approval_evaluated_at=None, auto_approval_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+auto_approval_worker = AutoApprovalWorker(
+    batch_size=settings.auto_approval_batch_size,
+    queue_size=settings.auto_approval_queue_size,
+    sweep_interval=settings.auto_approval_sweep_interval_seconds,
+)
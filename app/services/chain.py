@@ -0,0 +1,100 @@
+"""
+链后端
+
+合约上链通过 ChainBackend 接口完成，一次调用提交一批合约（一个区块 / 一笔批量交易）。
+默认后端为本地确定性模拟链：相同的输入总是得到相同的合约地址，区块哈希由上一个
+区块哈希与区块内容决定；可配置出块与每笔交易的耗时来模拟真实链的延迟。
+
+新后端实现 ChainBackend 并在 _BACKENDS 中注册，通过 settings.chain_backend 选择。
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Protocol
+
+from ..config import settings
+
+
+@dataclass(frozen=True)
+class ChainPayload:
+    """提交上链的合约内容"""
+    contract_id: str
+    # 合约内容摘要（规范化 JSON 的 SHA-256）
+    digest: str
+
+
+@dataclass(frozen=True)
+class ChainReceipt:
+    contract_id: str
+    contract_address: str
+    tx_id: str
+    block_number: int
+
+
+class ChainBackend(Protocol):
+    network: str
+
+    async def deploy_batch(self, payloads: list[ChainPayload]) -> list[ChainReceipt]:
+        """把一批合约打包进一个区块 / 一笔交易，按输入顺序返回回执"""
+        ...
+
+    async def anchor(self, digest: str) -> ChainReceipt:
+        """把一个摘要（如 Merkle 根）写入链上，回执的 contract_id / contract_address 为空"""
+        ...
+
+
+def _sha256(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class SimulatedChain:
+    network = "Simulated"
+
+    def __init__(self, block_time: float = 0.0, tx_time: float = 0.0):
+        self.block_time = block_time
+        self.tx_time = tx_time
+        self.height = 0
+        self.head = "0" * 64
+        self._lock = asyncio.Lock()
+
+    async def _mine(self, entries: list[str]) -> tuple[int, str]:
+        async with self._lock:
+            delay = self.block_time + self.tx_time * len(entries)
+            if delay:
+                await asyncio.sleep(delay)
+            self.height += 1
+            self.head = _sha256(self.head, str(self.height), *entries)
+            return self.height, "0x" + self.head
+
+    async def deploy_batch(self, payloads: list[ChainPayload]) -> list[ChainReceipt]:
+        addresses = [
+            "0x" + _sha256(self.network, payload.contract_id, payload.digest)[:40]
+            for payload in payloads
+        ]
+        block_number, tx_id = await self._mine(addresses)
+        return [
+            ChainReceipt(payload.contract_id, address, tx_id, block_number)
+            for payload, address in zip(payloads, addresses)
+        ]
+
+    async def anchor(self, digest: str) -> ChainReceipt:
+        block_number, tx_id = await self._mine([digest])
+        return ChainReceipt("", "", tx_id, block_number)
+
+
+_BACKENDS = {
+    "simulated": lambda: SimulatedChain(
+        block_time=settings.chain_block_time_seconds,
+        tx_time=settings.chain_tx_time_seconds,
+    ),
+}
+
+
+def create_chain_backend(name: str) -> ChainBackend:
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown chain backend: {name}") from None
+
+
+chain_backend = create_chain_backend(settings.chain_backend)
@@ -0,0 +1,213 @@
+"""
+合约上链任务队列
+
+部署请求只写入一条 deployment_jobs 记录（持久化队列）并立即返回任务 ID；后台任务
+按创建顺序领取最多 deployment_batch_size 个任务，整批通过链后端提交（一个区块 /
+一笔批量交易），再在一个事务中回写合约地址、交易哈希与任务状态。
+
+- 领取任务先查询 queued 任务，有任务时再用条件 UPDATE（WHERE status = 'queued'）标记为 running；
+- 回写链上地址不修改合约的 updated_at；
+- 提交失败时整批退回 queued 并累计尝试次数，超过 deployment_max_attempts 标记为 failed；
+- 进程崩溃遗留的 running 任务在启动时退回 queued（模拟链按内容确定地址，重复提交幂等）。
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import aliased
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Connector, Contract, DeploymentJob
+from ..schemas import ContractOut
+from .chain import ChainBackend, ChainPayload, chain_backend
+from .events import event_bus
+from .template_versions import canonical_json
+
+
+def contract_document(contract: Contract) -> dict:
+    """合约上链内容：不随状态变化的字段"""
+    return {
+        "id": contract.id,
+        "name": contract.name,
+        "provider_connector_id": contract.provider_connector_id,
+        "consumer_connector_id": contract.consumer_connector_id,
+        "contract_template_id": contract.contract_template_id,
+        "contract_template_version_hash": contract.contract_template_version_hash,
+        "data_offering_id": contract.data_offering_id,
+        "data_request_id": contract.data_request_id,
+        "created_at": contract.created_at.isoformat() if contract.created_at else None,
+        "expires_at": contract.expires_at.isoformat() if contract.expires_at else None,
+    }
+
+
+def contract_digest(contract: Contract) -> str:
+    return hashlib.sha256(canonical_json(contract_document(contract)).encode("utf-8")).hexdigest()
+
+
+class DeploymentWorker:
+    def __init__(self, chain: ChainBackend, batch_size: int, poll_interval: float, max_attempts: int):
+        self.chain = chain
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """有新任务入队时唤醒工作循环"""
+        self._wakeup.set()
+
+    async def recover(self) -> None:
+        """启动时把上次进程遗留的 running 任务退回队列"""
+        async with SessionLocal() as session:
+            await session.execute(
+                update(DeploymentJob)
+                .where(DeploymentJob.status == "running")
+                .values(status="queued", updated_at=datetime.now(timezone.utc))
+            )
+            await session.commit()
+
+    async def _claim(self) -> list[tuple[str, str]]:
+        """领取一批 queued 任务，返回 [(job_id, contract_id)]"""
+        async with SessionLocal() as session:
+            # 先只读地查找候选任务，队列为空时不获取写锁
+            job_ids = (await session.execute(
+                select(DeploymentJob.id)
+                .where(DeploymentJob.status == "queued")
+                .order_by(DeploymentJob.created_at)
+                .limit(self.batch_size)
+            )).scalars().all()
+            if not job_ids:
+                return []
+            # 结束读事务，领取在新的写事务中进行（SQLite 不会为读事务升级等待写锁）
+            await session.commit()
+            result = await session.execute(
+                update(DeploymentJob)
+                .where(DeploymentJob.id.in_(job_ids), DeploymentJob.status == "queued")
+                .values(
+                    status="running",
+                    attempts=DeploymentJob.attempts + 1,
+                    updated_at=datetime.now(timezone.utc),
+                )
+                .returning(DeploymentJob.id, DeploymentJob.contract_id)
+            )
+            claimed = [tuple(row) for row in result.all()]
+            await session.commit()
+            return claimed
+
+    async def process_batch(self) -> int:
+        """领取并提交一批任务，返回处理的任务数"""
+        claimed = await self._claim()
+        if not claimed:
+            return 0
+        job_ids = [job_id for job_id, _ in claimed]
+
+        consumer = aliased(Connector)
+        provider = aliased(Connector)
+        async with SessionLocal() as session:
+            rows = (await session.execute(
+                select(Contract, consumer.owner_user_id, provider.owner_user_id)
+                .join(consumer, consumer.id == Contract.consumer_connector_id)
+                .join(provider, provider.id == Contract.provider_connector_id)
+                .where(Contract.id.in_({contract_id for _, contract_id in claimed}))
+            )).all()
+        contracts = {contract.id: (contract, {c_owner, p_owner}) for contract, c_owner, p_owner in rows}
+        payloads = [
+            ChainPayload(contract_id, contract_digest(contracts[contract_id][0]))
+            for _, contract_id in claimed
+            if contract_id in contracts
+        ]
+
+        try:
+            receipts = await self.chain.deploy_batch(payloads) if payloads else []
+        except Exception as exc:
+            await self._release(job_ids, str(exc))
+            return len(job_ids)
+
+        now = datetime.now(timezone.utc)
+        by_contract = {receipt.contract_id: receipt for receipt in receipts}
+        async with SessionLocal() as session:
+            if receipts:
+                await session.execute(update(Contract), [
+                    {
+                        "id": receipt.contract_id,
+                        "contract_address": receipt.contract_address,
+                        "blockchain_tx_id": receipt.tx_id,
+                        "blockchain_network": self.chain.network,
+                    }
+                    for receipt in receipts
+                ])
+            job_rows = []
+            for job_id, contract_id in claimed:
+                receipt = by_contract.get(contract_id)
+                if receipt is None:
+                    job_rows.append({
+                        "id": job_id, "status": "failed", "error": "Contract not found", "updated_at": now,
+                    })
+                else:
+                    job_rows.append({
+                        "id": job_id,
+                        "status": "succeeded",
+                        "network": self.chain.network,
+                        "block_number": receipt.block_number,
+                        "tx_id": receipt.tx_id,
+                        "updated_at": now,
+                    })
+            await session.execute(update(DeploymentJob), job_rows)
+            await session.commit()
+
+        for receipt in receipts:
+            contract, parties = contracts[receipt.contract_id]
+            contract.contract_address = receipt.contract_address
+            contract.blockchain_tx_id = receipt.tx_id
+            contract.blockchain_network = self.chain.network
+            event_bus.publish(
+                parties, "contract.updated", ContractOut.model_validate(contract).model_dump(mode="json")
+            )
+        return len(job_ids)
+
+    async def _release(self, job_ids: list[str], error: str) -> None:
+        """提交失败：未超过最大尝试次数的任务退回队列，其余标记为 failed"""
+        now = datetime.now(timezone.utc)
+        async with SessionLocal() as session:
+            await session.execute(
+                update(DeploymentJob)
+                .where(DeploymentJob.id.in_(job_ids), DeploymentJob.attempts >= self.max_attempts)
+                .values(status="failed", error=error, updated_at=now)
+            )
+            await session.execute(
+                update(DeploymentJob)
+                .where(DeploymentJob.id.in_(job_ids), DeploymentJob.status == "running")
+                .values(status="queued", error=error, updated_at=now)
+            )
+            await session.commit()
+
+    async def drain(self) -> int:
+        """处理队列直到为空，返回处理的任务数"""
+        total = 0
+        while processed := await self.process_batch():
+            total += processed
+        return total
+
+    async def run(self) -> None:
+        await self.recover()
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception:
+                # 下一轮重试
+                pass
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+deployment_worker = DeploymentWorker(
+    chain=chain_backend,
+    batch_size=settings.deployment_batch_size,
+    poll_interval=settings.deployment_poll_interval_seconds,
+    max_attempts=settings.deployment_max_attempts,
+)
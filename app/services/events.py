@@ -0,0 +1,117 @@
+"""
+进程内事件总线（SSE 推送）
+
+数据请求 / 合约状态变化时由路由在提交事务后发布事件，投递给相关双方用户的
+所有在线连接，替代客户端轮询列表接口。
+
+- 每个连接只有一个有界队列，不占用数据库会话，空闲连接只有定时心跳的开销；
+- 最近 event_replay_buffer_size 条事件保存在环形缓冲区中，客户端断线重连时
+  按 Last-Event-ID 补发；缺口超出缓冲区时先发送 reset 事件，提示客户端重新拉取列表；
+- 连接积压超过 event_queue_size 时断开该连接，由客户端重连后从缓冲区补发。
+
+事件 ID 以进程启动时刻（毫秒）为起点单调递增，重启后不会与旧 ID 混淆。
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable
+
+from ..config import settings
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: dict
+
+    def encode(self) -> str:
+        data = json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))
+        return f"id: {self.id}\nevent: {self.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    __slots__ = ("user_id", "queue", "overflowed")
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def deliver(self, event: Event) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    @property
+    def closed(self) -> bool:
+        """积压溢出且已发送完队列中的事件"""
+        return self.overflowed and self.queue.empty()
+
+
+class EventBus:
+    def __init__(self, replay_size: int, queue_size: int):
+        self.queue_size = queue_size
+        self._next_id = int(time.time() * 1000)
+        # (接收者用户 ID 集合, 事件)，按事件 ID 递增
+        self._history: deque[tuple[frozenset[str], Event]] = deque(maxlen=replay_size)
+        # user_id -> 该用户的在线连接
+        self._subscribers: dict[str, set[Subscription]] = {}
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def publish(self, user_ids: Iterable[str], event_type: str, data: dict) -> Event:
+        recipients = frozenset(user_id for user_id in user_ids if user_id)
+        event = Event(self._next_id, event_type, data)
+        self._next_id += 1
+        self._history.append((recipients, event))
+        for user_id in recipients:
+            for subscription in self._subscribers.get(user_id, ()):
+                subscription.deliver(event)
+        return event
+
+    def subscribe(
+        self, user_id: str, last_event_id: int | None = None
+    ) -> tuple[Subscription, list[Event], bool]:
+        """
+        注册连接，返回 (订阅, 需补发的事件, 是否存在无法补发的缺口)。
+
+        注册与读取缓冲区之间没有 await，之后发布的事件一定进入队列，不会重复或遗漏。
+        """
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        if last_event_id is None:
+            return subscription, [], False
+
+        replay = []
+        for recipients, event in reversed(self._history):
+            if event.id <= last_event_id:
+                break
+            if user_id in recipients:
+                replay.append(event)
+        replay.reverse()
+        # 缓冲区中最早的事件之前还有客户端没收到的事件
+        oldest = self._history[0][1].id if self._history else self._next_id
+        gap = last_event_id < oldest - 1
+        return subscription, replay, gap
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscribers[subscription.user_id]
+
+
+event_bus = EventBus(
+    replay_size=settings.event_replay_buffer_size,
+    queue_size=settings.event_queue_size,
+)
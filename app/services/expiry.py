@@ -0,0 +1,106 @@
+"""
+合约过期扫描
+
+后台定期把 expires_at 已过的 active 合约置为 expired。借助 (status, expires_at) 索引，
+每批只按到期顺序读取最多 expiry_batch_size 个到期合约，用一条条件 UPDATE ... RETURNING
+完成状态迁移及状态计数更新，每批一个短事务；批与批之间让出事件循环，不会长时间持有
+SQLite 写锁，合约总量再大也只处理实际到期的行。
+
+提交后从有效期区间索引、有效合约访问索引中移除并推送 contract.updated 事件。
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Contract
+from ..schemas import ContractOut
+from .events import event_bus
+from .access_index import active_contract_index
+from .interval_index import contract_validity_index
+from .outbox import contract_record, outbox_relay, record
+from .ownership import connector_owners
+from .status_counters import CONTRACT, Transition, apply_transitions
+
+
+class ExpirySweeper:
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.expired = 0
+
+    async def expire_batch(self, now: datetime) -> int:
+        """过期一批到期合约，返回本批数量"""
+        due = (
+            select(Contract.id)
+            .where(Contract.status == "active", Contract.expires_at <= now)
+            .order_by(Contract.expires_at)
+            .limit(self.batch_size)
+            .scalar_subquery()
+        )
+        async with SessionLocal() as session:
+            result = await session.execute(
+                update(Contract)
+                # 到期条件只放在子查询中（单条语句内原子），外层按主键定位；外层若再加
+                # status 条件，SQLite 会改走 status 索引逐行检查全部 active 合约
+                .where(Contract.id.in_(due))
+                .values(status="expired", updated_at=now)
+                .returning(Contract)
+                .execution_options(synchronize_session=False)
+            )
+            contracts = result.scalars().all()
+            if not contracts:
+                return 0
+            await apply_transitions(session, CONTRACT, [
+                Transition(contract.consumer_connector_id, contract.provider_connector_id, "active", "expired")
+                for contract in contracts
+            ])
+            await record(session, [contract_record(contract, "contract.expired") for contract in contracts])
+            await session.commit()
+
+            owners = await connector_owners(
+                session,
+                {c.consumer_connector_id for c in contracts} | {c.provider_connector_id for c in contracts},
+            )
+        outbox_relay.notify()
+
+        for contract in contracts:
+            contract_validity_index.remove(contract.id)
+            active_contract_index.remove(contract.id)
+            event_bus.publish(
+                {owners.get(contract.consumer_connector_id), owners.get(contract.provider_connector_id)},
+                "contract.updated",
+                ContractOut.model_validate(contract).model_dump(mode="json"),
+            )
+        self.expired += len(contracts)
+        return len(contracts)
+
+    async def sweep(self) -> int:
+        """处理全部到期合约，返回过期数量"""
+        # 数据库中的时间按 UTC naive 存储
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        total = 0
+        while True:
+            expired = await self.expire_batch(now)
+            total += expired
+            if expired < self.batch_size:
+                return total
+            # 批之间让出事件循环，其他请求的写事务可以插入
+            await asyncio.sleep(0)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                # 下一轮重试
+                pass
+            await asyncio.sleep(self.interval)
+
+
+expiry_sweeper = ExpirySweeper(
+    interval=settings.expiry_sweep_interval_seconds,
+    batch_size=settings.expiry_batch_size,
+)
@@ -0,0 +1,236 @@
+"""
+Idempotency-Key 支持
+
+客户端在创建请求上携带 Idempotency-Key 头，超时重试时服务端不会重复创建：
+
+- 键按 (用户, 方法, 路径, Idempotency-Key) 区分，不同用户的相同键互不影响；
+- 第一次执行成功（2xx）后保存响应（状态码、Content-Type、响应体），在 TTL 内重复请求
+  直接返回保存的响应，并带上 Idempotent-Replayed: true；
+- 同一个键的请求正在执行时，并发的重复请求等待其结束（single-flight），不会再次执行；
+  第一次执行失败时不保存，等待者中的一个重新执行；
+- 同一个键携带不同的请求体返回 422；
+- 过期的键由最小堆按到期时间清理，每次清理只触及真正到期的键；键数超过上限时
+  提前淘汰最早到期的键。
+
+只保存在进程内存中（与事件推送等一致，单进程部署）。
+"""
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import json
+import re
+import time
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+
+from ..config import settings
+from ..deps import decode_token_subject
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+_BOUNDARY = re.compile(rb"boundary=\"?([^\";]+)\"?")
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    content_type: bytes | None
+    body: bytes
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    # 执行结束（成功或失败）时置位
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    response: StoredResponse | None = None
+    expires_at: float = 0.0
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: dict[tuple, _Entry] = {}
+        # (到期时间, 键)；键被重新写入或删除后，堆中旧的条目在弹出时按到期时间识别并忽略
+        self._expiry: list[tuple[float, tuple]] = []
+        self.replayed = 0
+        self.waited = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def begin(self, key: tuple, fingerprint: str) -> StoredResponse | None:
+        """返回保存的响应；返回 None 表示调用方获得执行权，之后必须调用 complete 或 fail"""
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None and entry.response is not None and entry.expires_at <= time.time():
+                self._entries.pop(key)
+                entry = None
+            if entry is None:
+                self.sweep()
+                self._entries[key] = _Entry(fingerprint)
+                return None
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was already used with a different request"
+                )
+            if entry.response is not None:
+                self.replayed += 1
+                return entry.response
+            # 正在执行：等待其结束后重新检查（失败时条目已被移除，由某个等待者重新执行）
+            self.waited += 1
+            await entry.done.wait()
+
+    def complete(self, key: tuple, response: StoredResponse) -> None:
+        entry = self._entries[key]
+        entry.response = response
+        entry.expires_at = time.time() + self.ttl
+        heapq.heappush(self._expiry, (entry.expires_at, key))
+        entry.done.set()
+
+    def fail(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        entry.done.set()
+
+    def sweep(self, now: float | None = None) -> int:
+        """移除已到期的键；键数超过上限时淘汰最早到期的键，返回移除数量"""
+        if now is None:
+            now = time.time()
+        removed = 0
+        while self._expiry and (self._expiry[0][0] <= now or len(self._entries) >= self.max_keys):
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            # 正在执行的键不在堆中；只移除与堆条目到期时间一致的已完成键
+            if entry is not None and entry.response is not None and entry.expires_at == expires_at:
+                del self._entries[key]
+                removed += 1
+        return removed
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+
+def _fingerprint(method: str, path: str, content_type: bytes | None, body: bytes) -> str:
+    """请求指纹；multipart 的 boundary 每次请求都不同，计算前替换为固定值"""
+    if content_type and content_type.startswith(b"multipart/"):
+        match = _BOUNDARY.search(content_type)
+        if match:
+            body = body.replace(match.group(1), b"boundary")
+            content_type = content_type.replace(match.group(1), b"boundary")
+    digest = hashlib.sha256()
+    digest.update(f"{method} {path}\n".encode("utf-8"))
+    digest.update((content_type or b"") + b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def _send_json(send, status: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """对指定路径的 POST 请求处理 Idempotency-Key 头（纯 ASGI 中间件，缓冲请求体与响应体）"""
+
+    def __init__(self, app, store: IdempotencyStore, paths: set[str]):
+        self.app = app
+        self.store = store
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(HEADER.encode())
+        if idempotency_key is None:
+            return await self.app(scope, receive, send)
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        # 键按用户区分；未认证的请求不做幂等处理，交给接口返回 401 / 403
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        user_id = None
+        if scheme.lower() == "bearer":
+            with contextlib.suppress(HTTPException):
+                user_id = decode_token_subject(token)
+        if user_id is None:
+            return await self.app(scope, receive, send)
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        key = (user_id, scope["method"], scope["path"], idempotency_key)
+        content_type = headers.get(b"content-type")
+        try:
+            stored = await self.store.begin(
+                key, _fingerprint(scope["method"], scope["path"], content_type, body)
+            )
+        except HTTPException as exc:
+            return await _send_json(send, exc.status_code, exc.detail)
+        if stored is not None:
+            response_headers = [
+                (b"content-length", str(len(stored.body)).encode()),
+                (b"idempotent-replayed", b"true"),
+            ]
+            if stored.content_type:
+                response_headers.append((b"content-type", stored.content_type))
+            await send({"type": "http.response.start", "status": stored.status, "headers": response_headers})
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status = 500
+        response_content_type = None
+        response_chunks = []
+
+        async def capture_send(message):
+            nonlocal status, response_content_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_content_type = dict(message.get("headers", [])).get(b"content-type")
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            self.store.fail(key)
+            raise
+        if 200 <= status < 300:
+            self.store.complete(key, StoredResponse(status, response_content_type, b"".join(response_chunks)))
+        else:
+            self.store.fail(key)
+
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.idempotency_ttl_seconds,
+    max_keys=settings.idempotency_max_keys,
+)
@@ -0,0 +1,231 @@
+"""
+合约有效期区间索引
+
+合约的有效窗口 = [生效时间, min(expires_at, 生效时间 + access_period))。
+每个消费者连接器维护一棵以区间起点为键、按子树最大终点增强的区间树（treap），
+用于回答“某时刻/某时间段内该消费者有哪些有效合约”，无需全表扫描。
+
+只索引 status == "active" 的合约；合约确认、拒绝、过期时增量更新。
+"""
+import math
+import random
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Contract
+from .template_versions import load_version_rules
+
+_PERIOD_UNITS = {
+    "minute": timedelta(minutes=1),
+    "minutes": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "hours": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "days": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "weeks": timedelta(weeks=1),
+    "month": timedelta(days=30),
+    "months": timedelta(days=30),
+    "year": timedelta(days=365),
+    "years": timedelta(days=365),
+}
+
+
+def parse_access_period(value: str, unit: str | None) -> timedelta | None:
+    """解析 access_period 规则，如 value="30", unit="days"（默认单位为天）"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", value or "")
+    if not match:
+        return None
+    number, inline_unit = match.groups()
+    step = _PERIOD_UNITS.get((inline_unit or unit or "days").lower())
+    if step is None:
+        return None
+    return step * float(number)
+
+
+def to_timestamp(value: datetime | None) -> float:
+    """数据库中的时间按 UTC naive 存储；None 视为无穷远"""
+    if value is None:
+        return math.inf
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class _Node:
+    __slots__ = ("key", "end", "max_end", "priority", "left", "right")
+
+    def __init__(self, key: tuple[float, str], end: float):
+        self.key = key
+        self.end = end
+        self.max_end = end
+        self.priority = random.random()
+        self.left: "_Node | None" = None
+        self.right: "_Node | None" = None
+
+
+def _update(node: _Node) -> None:
+    node.max_end = max(
+        node.end,
+        node.left.max_end if node.left else -math.inf,
+        node.right.max_end if node.right else -math.inf,
+    )
+
+
+def _split(node: _Node | None, key) -> tuple[_Node | None, _Node | None]:
+    """拆分为 (< key, >= key) 两部分"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left: _Node | None, right: _Node | None) -> _Node | None:
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _delete(node: _Node | None, key) -> _Node | None:
+    if node is None:
+        return None
+    if node.key == key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    _update(node)
+    return node
+
+
+class IntervalTree:
+    """半开区间 [start, end) 的增强 treap"""
+
+    def __init__(self):
+        self.root: _Node | None = None
+        self._intervals: dict[str, tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def insert(self, item_id: str, start: float, end: float) -> None:
+        self.remove(item_id)
+        left, right = _split(self.root, (start, item_id))
+        self.root = _merge(_merge(left, _Node((start, item_id), end)), right)
+        self._intervals[item_id] = (start, end)
+
+    def remove(self, item_id: str) -> None:
+        interval = self._intervals.pop(item_id, None)
+        if interval is not None:
+            self.root = _delete(self.root, (interval[0], item_id))
+
+    def overlapping(self, start: float, end: float) -> list[str]:
+        """与 [start, end) 相交的区间；start == end 时为包含该时刻的区间"""
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            node_start = node.key[0]
+            if node_start < end or (start == end and node_start <= start):
+                if node.end > start:
+                    found.append(node.key[1])
+                stack.append(node.right)
+        return found
+
+
+class ContractValidityIndex:
+    def __init__(self):
+        # consumer_connector_id -> IntervalTree
+        self._trees: dict[str, IntervalTree] = {}
+        # contract_id -> consumer_connector_id
+        self._owners: dict[str, str] = {}
+
+    @staticmethod
+    def window(contract: Contract, access_period: timedelta | None) -> tuple[float, float]:
+        # 生效时间：确认时写入 activated_at，未经确认直接创建为 active 的合约取创建时间
+        activated_at = contract.activated_at or contract.created_at
+        start = to_timestamp(activated_at)
+        end = to_timestamp(contract.expires_at)
+        if access_period is not None:
+            end = min(end, start + access_period.total_seconds())
+        return start, end
+
+    def upsert(self, contract: Contract, access_period: timedelta | None) -> None:
+        if contract.status != "active":
+            self.remove(contract.id)
+            return
+        self.remove(contract.id)
+        start, end = self.window(contract, access_period)
+        tree = self._trees.setdefault(contract.consumer_connector_id, IntervalTree())
+        tree.insert(contract.id, start, end)
+        self._owners[contract.id] = contract.consumer_connector_id
+
+    def remove(self, contract_id: str) -> None:
+        consumer_id = self._owners.pop(contract_id, None)
+        if consumer_id is not None:
+            self._trees[consumer_id].remove(contract_id)
+
+    def valid_at(self, consumer_connector_id: str, at: datetime) -> list[str]:
+        point = to_timestamp(at)
+        return self.valid_between(consumer_connector_id, point, point)
+
+    def valid_between(self, consumer_connector_id: str, start: float, end: float) -> list[str]:
+        tree = self._trees.get(consumer_connector_id)
+        return tree.overlapping(start, end) if tree else []
+
+    async def load(self, session: AsyncSession) -> None:
+        """启动时从数据库全量构建"""
+        result = await session.execute(select(Contract).where(Contract.status == "active"))
+        contracts = result.scalars().all()
+        periods = await load_access_periods(
+            session,
+            {c.contract_template_version_hash for c in contracts if c.contract_template_version_hash},
+        )
+        self._trees.clear()
+        self._owners.clear()
+        for contract in contracts:
+            self.upsert(contract, periods.get(contract.contract_template_version_hash))
+
+
+async def load_access_periods(
+    session: AsyncSession, version_hashes: set[str]
+) -> dict[str, timedelta]:
+    """按合约模板版本读取生效的 access_period 规则，多条时取最短的"""
+    rules_by_version = await load_version_rules(session, version_hashes)
+    periods: dict[str, timedelta] = {}
+    for version_hash, rules in rules_by_version.items():
+        for rule in rules:
+            if rule["type"] != "access_period" or not rule["is_active"]:
+                continue
+            period = parse_access_period(rule["value"], rule["unit"])
+            if period is not None and (version_hash not in periods or period < periods[version_hash]):
+                periods[version_hash] = period
+    return periods
+
+
+async def load_window(session: AsyncSession, contract: Contract) -> tuple[float, float]:
+    """单个合约的有效窗口（读取其固定版本中的 access_period，与区间索引一致）"""
+    version_hash = contract.contract_template_version_hash
+    periods = await load_access_periods(session, {version_hash} if version_hash else set())
+    return ContractValidityIndex.window(contract, periods.get(version_hash))
+
+
+contract_validity_index = ContractValidityIndex()
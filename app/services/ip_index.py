@@ -0,0 +1,214 @@
+"""
+ip_restriction 规则的 CIDR 索引
+
+每个连接器维护 IPv4 / IPv6 两棵路径压缩的二进制基数树（Patricia trie），
+节点上记录哪些策略模板的 ip_restriction 覆盖该网段。查询一个地址只需沿树
+走一条路径，代价与地址位数相关，与网段数量无关。
+
+策略模板增删改时按模板增量更新：先移除该模板旧的网段，再插入新的网段。
+"""
+import ipaddress
+import json
+import re
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import PolicyRule, PolicyTemplate
+
+
+class _Node:
+    __slots__ = ("bits", "length", "children", "owners")
+
+    def __init__(self, bits: int, length: int):
+        # 前缀的高 length 位
+        self.bits = bits
+        self.length = length
+        self.children: list["_Node | None"] = [None, None]
+        self.owners: set[str] = set()
+
+
+def _common_length(node: _Node, bits: int, length: int) -> int:
+    """node 前缀与 (bits, length) 的公共前缀长度"""
+    m = min(node.length, length)
+    diff = (node.bits >> (node.length - m)) ^ (bits >> (length - m))
+    return m if diff == 0 else m - diff.bit_length()
+
+
+class CidrTrie:
+    """单一地址族的路径压缩基数树"""
+
+    def __init__(self, width: int):
+        self.width = width
+        self.root = _Node(0, 0)
+
+    def insert(self, bits: int, length: int, owner: str) -> None:
+        node = self.root
+        while True:
+            if node.length == length:
+                node.owners.add(owner)
+                return
+            branch = (bits >> (length - node.length - 1)) & 1
+            child = node.children[branch]
+            if child is None:
+                leaf = _Node(bits, length)
+                leaf.owners.add(owner)
+                node.children[branch] = leaf
+                return
+            common = _common_length(child, bits, length)
+            if common == child.length:
+                node = child
+                continue
+            # 分裂：插入公共前缀节点
+            mid = _Node(bits >> (length - common), common)
+            mid.children[(child.bits >> (child.length - common - 1)) & 1] = child
+            node.children[branch] = mid
+            if common == length:
+                mid.owners.add(owner)
+            else:
+                leaf = _Node(bits, length)
+                leaf.owners.add(owner)
+                mid.children[(bits >> (length - common - 1)) & 1] = leaf
+            return
+
+    def remove(self, bits: int, length: int, owner: str) -> None:
+        path: list[tuple[_Node, int]] = []
+        node = self.root
+        while node.length < length:
+            branch = (bits >> (length - node.length - 1)) & 1
+            child = node.children[branch]
+            if child is None or _common_length(child, bits, length) < child.length:
+                return
+            path.append((node, branch))
+            node = child
+        if node.length != length:
+            return
+        node.owners.discard(owner)
+
+        # 自底向上裁剪空节点，并合并只剩单个子节点的中间节点
+        while path and not node.owners:
+            parent, branch = path.pop()
+            children = [c for c in node.children if c is not None]
+            if not children:
+                parent.children[branch] = None
+            elif len(children) == 1:
+                parent.children[branch] = children[0]
+            else:
+                break
+            node = parent
+
+    def match(self, address: int) -> set[str]:
+        """返回所有包含该地址的网段的 owner"""
+        matched = set(self.root.owners)
+        node = self.root
+        while node.length < self.width:
+            child = node.children[(address >> (self.width - node.length - 1)) & 1]
+            if child is None or (address >> (self.width - child.length)) != child.bits:
+                break
+            matched |= child.owners
+            node = child
+        return matched
+
+
+def parse_networks(value: str) -> list[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+    """解析 ip_restriction 规则的 value：JSON 数组，或以逗号/分号/空白分隔的 CIDR 列表"""
+    value = (value or "").strip()
+    if value.startswith("["):
+        try:
+            items = [str(item) for item in json.loads(value)]
+        except ValueError:
+            items = []
+    else:
+        items = [item for item in re.split(r"[,;\s]+", value) if item]
+
+    networks = []
+    for item in items:
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            # 非法网段忽略
+            continue
+    return networks
+
+
+def _key(network) -> tuple[int, int, int]:
+    return (
+        network.version,
+        int(network.network_address) >> (network.max_prefixlen - network.prefixlen),
+        network.prefixlen,
+    )
+
+
+class IpRestrictionIndex:
+    def __init__(self):
+        # connector_id -> {4: CidrTrie, 6: CidrTrie}
+        self._tries: dict[str, dict[int, CidrTrie]] = {}
+        # policy_template_id -> (connector_id, 已插入的网段 key 列表)
+        self._entries: dict[str, tuple[str, list[tuple[int, int, int]]]] = {}
+        # connector_id -> 带 ip_restriction 的策略模板 ID
+        self._restricted: dict[str, set[str]] = {}
+
+    def _tries_for(self, connector_id: str) -> dict[int, CidrTrie]:
+        tries = self._tries.get(connector_id)
+        if tries is None:
+            tries = {4: CidrTrie(32), 6: CidrTrie(128)}
+            self._tries[connector_id] = tries
+        return tries
+
+    def remove_template(self, policy_template_id: str) -> None:
+        entry = self._entries.pop(policy_template_id, None)
+        if not entry:
+            return
+        connector_id, keys = entry
+        self._restricted.get(connector_id, set()).discard(policy_template_id)
+        tries = self._tries_for(connector_id)
+        for version, bits, length in keys:
+            tries[version].remove(bits, length, policy_template_id)
+
+    def update_template(self, connector_id: str, policy_template_id: str, rules) -> None:
+        """按模板增量更新：rules 为该模板当前的全部规则"""
+        self.remove_template(policy_template_id)
+        keys = []
+        for rule in rules:
+            if rule.type != "ip_restriction" or not rule.is_active:
+                continue
+            keys.extend(_key(network) for network in parse_networks(rule.value))
+        if not keys:
+            return
+        tries = self._tries_for(connector_id)
+        for version, bits, length in keys:
+            tries[version].insert(bits, length, policy_template_id)
+        self._entries[policy_template_id] = (connector_id, keys)
+        self._restricted.setdefault(connector_id, set()).add(policy_template_id)
+
+    def restricted_templates(self, connector_id: str) -> set[str]:
+        """该连接器下带有 ip_restriction 规则的策略模板"""
+        return set(self._restricted.get(connector_id, ()))
+
+    def match(self, connector_id: str, ip: str) -> set[str]:
+        """返回该连接器下 ip_restriction 允许此地址的策略模板 ID"""
+        tries = self._tries.get(connector_id)
+        if not tries:
+            return set()
+        address = ipaddress.ip_address(ip)
+        return tries[address.version].match(int(address))
+
+    async def load(self, session: AsyncSession) -> None:
+        """启动时从数据库全量构建"""
+        result = await session.execute(
+            select(PolicyTemplate.connector_id, PolicyRule)
+            .join(PolicyRule, PolicyRule.policy_template_id == PolicyTemplate.id)
+            .where(PolicyRule.type == "ip_restriction", PolicyRule.is_active.is_(True))
+        )
+        grouped: dict[str, tuple[str, list[PolicyRule]]] = {}
+        for connector_id, rule in result.all():
+            grouped.setdefault(rule.policy_template_id, (connector_id, []))[1].append(rule)
+
+        self._tries.clear()
+        self._entries.clear()
+        self._restricted.clear()
+        for template_id, (connector_id, rules) in grouped.items():
+            self.update_template(connector_id, template_id, rules)
+
+
+ip_restriction_index = IpRestrictionIndex()
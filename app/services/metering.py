@@ -0,0 +1,264 @@
+"""
+合约用量计量（write-behind）
+
+每次数据访问只在内存中累加 (访问次数, 传输字节)，由后台任务定期把增量
+以一个批量 UPSERT 事务刷入 contract_usage 表，避免热点行上的逐次 UPDATE。
+
+崩溃时最多丢失的用量有界：
+- 时间上不超过 metering_flush_interval_seconds；
+- 数量上不超过 metering_max_pending_accesses 次访问（达到后立即刷盘）。
+
+上限检查用 reserve()：读取已落库用量之后，检查与计入内存增量之间没有 await，
+并发请求不会同时通过检查而超出 access_count 上限。读取已落库用量与刷盘交错时重读，
+合计“已落库 + 正在刷盘 + 未刷盘”时既不漏算也不重算。
+"""
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Contract, ContractUsage
+from .template_versions import load_version_rules
+
+_BYTE_UNITS = {
+    "b": 1,
+    "kb": 1024,
+    "mb": 1024 ** 2,
+    "gb": 1024 ** 3,
+    "tb": 1024 ** 4,
+}
+
+
+def parse_byte_limit(value: str, unit: str | None) -> int | None:
+    """解析 transfer_limit 规则，如 value="10", unit="GB" 或 value="10GB"。"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", value or "")
+    if not match:
+        return None
+    number, inline_unit = match.groups()
+    factor = _BYTE_UNITS.get((inline_unit or unit or "b").lower())
+    if factor is None:
+        return None
+    return int(float(number) * factor)
+
+
+def parse_count_limit(value: str) -> int | None:
+    """解析 access_count 规则的次数上限"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class UsageLimitExceeded(Exception):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+@dataclass
+class UsageReport:
+    contract_id: str
+    access_count: int
+    bytes_transferred: int
+    access_count_limit: int | None
+    transfer_limit_bytes: int | None
+    last_flushed_at: datetime | None
+
+    @property
+    def access_count_exceeded(self) -> bool:
+        return self.access_count_limit is not None and self.access_count >= self.access_count_limit
+
+    @property
+    def transfer_limit_exceeded(self) -> bool:
+        return (
+            self.transfer_limit_bytes is not None
+            and self.bytes_transferred >= self.transfer_limit_bytes
+        )
+
+
+class UsageMeter:
+    def __init__(self, flush_interval: float, max_pending_accesses: int):
+        self.flush_interval = flush_interval
+        self.max_pending_accesses = max_pending_accesses
+        # contract_id -> [access_count, bytes_transferred]，尚未落库的增量
+        self._pending: dict[str, list[int]] = {}
+        # 正在写入数据库、尚未提交的一批增量
+        self._flushing: dict[str, list[int]] = {}
+        # 刷盘开始和结束时各加一，奇数表示正在刷盘
+        self._flush_generation = 0
+        self._pending_accesses = 0
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, contract_id: str, accesses: int = 1, bytes_transferred: int = 0) -> None:
+        """记录一次访问（纯内存操作，不访问数据库）"""
+        delta = self._pending.setdefault(contract_id, [0, 0])
+        delta[0] += accesses
+        delta[1] += bytes_transferred
+        self._pending_accesses += accesses
+        if self._pending_accesses >= self.max_pending_accesses:
+            self._flush_requested.set()
+
+    def release(self, contract_id: str, accesses: int = 1, bytes_transferred: int = 0) -> None:
+        """退还 reserve() 预占、最终没有发生的访问（及未传输的字节）"""
+        self.record(contract_id, -accesses, -bytes_transferred)
+
+    def pending_usage(self, contract_id: str) -> tuple[int, int]:
+        """尚未提交到数据库的用量（未刷盘 + 正在刷盘）"""
+        count, size = 0, 0
+        for deltas in (self._pending, self._flushing):
+            delta = deltas.get(contract_id)
+            if delta:
+                count += delta[0]
+                size += delta[1]
+        return count, size
+
+    async def flush(self) -> int:
+        """把内存增量在一个事务中批量写入 contract_usage，返回涉及的合约数"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+            self._flush_generation += 1
+            self._pending_accesses = 0
+            self._flush_requested.clear()
+
+            now = datetime.now(timezone.utc)
+            rows = [
+                {
+                    "contract_id": contract_id,
+                    "access_count": count,
+                    "bytes_transferred": size,
+                    "updated_at": now,
+                }
+                for contract_id, (count, size) in batch.items()
+            ]
+            stmt = insert(ContractUsage).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ContractUsage.contract_id],
+                set_={
+                    "access_count": ContractUsage.access_count + stmt.excluded.access_count,
+                    "bytes_transferred": ContractUsage.bytes_transferred + stmt.excluded.bytes_transferred,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+            try:
+                async with SessionLocal() as session:
+                    await session.execute(stmt)
+                    await session.commit()
+            except Exception:
+                # 写入失败时把增量合并回内存，等待下一次刷盘
+                for contract_id, (count, size) in batch.items():
+                    self.record(contract_id, count, size)
+                raise
+            finally:
+                # 与合并回内存之间没有 await：读者看到的总量不会缺少或重复这批增量
+                self._flushing = {}
+                self._flush_generation += 1
+            return len(rows)
+
+    async def run(self) -> None:
+        """后台刷盘循环：按间隔或积压量触发"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                # 增量已保留在内存中，下一轮重试
+                await asyncio.sleep(self.flush_interval)
+
+    async def _stored_usage(self, contract_id: str) -> tuple[int, int, datetime | None]:
+        """已落库用量 (访问次数, 字节数, 最近刷盘时间)
+
+        使用独立会话（新的读快照），读取期间有刷盘开始或结束时重读，返回后调用方不经
+        await 即与 pending_usage() 合计。
+        """
+        while True:
+            generation = self._flush_generation
+            if generation % 2:
+                # 正在刷盘，等待提交完成
+                async with self._flush_lock:
+                    continue
+            async with SessionLocal() as session:
+                row = (await session.execute(
+                    select(
+                        ContractUsage.access_count, ContractUsage.bytes_transferred, ContractUsage.updated_at
+                    ).where(ContractUsage.contract_id == contract_id)
+                )).first()
+            if self._flush_generation == generation:
+                return tuple(row) if row else (0, 0, None)
+
+    async def get_usage(self, session: AsyncSession, contract_id: str) -> UsageReport:
+        """当前用量 = 已落库用量 + 内存中未落库的增量，并附带合约规则中的上限"""
+        access_limit, transfer_limit = await load_usage_limits(session, contract_id)
+        stored_count, stored_bytes, flushed_at = await self._stored_usage(contract_id)
+        pending_count, pending_bytes = self.pending_usage(contract_id)
+        return UsageReport(
+            contract_id=contract_id,
+            access_count=stored_count + pending_count,
+            bytes_transferred=stored_bytes + pending_bytes,
+            access_count_limit=access_limit,
+            transfer_limit_bytes=transfer_limit,
+            last_flushed_at=flushed_at,
+        )
+
+    async def reserve(self, session: AsyncSession, contract_id: str, bytes_transferred: int = 0) -> UsageReport:
+        """检查上限并计入一次访问及 bytes_transferred，返回计入后的用量；
+        已达上限、或计入后超过传输上限时抛出 UsageLimitExceeded，不计入"""
+        usage = await self.get_usage(session, contract_id)
+        # 以下到 record() 之间没有 await
+        if usage.access_count_exceeded:
+            raise UsageLimitExceeded("Access count limit exceeded")
+        if usage.transfer_limit_exceeded or (
+            usage.transfer_limit_bytes is not None
+            and usage.bytes_transferred + bytes_transferred > usage.transfer_limit_bytes
+        ):
+            raise UsageLimitExceeded("Transfer limit exceeded")
+        self.record(contract_id, bytes_transferred=bytes_transferred)
+        usage.access_count += 1
+        usage.bytes_transferred += bytes_transferred
+        return usage
+
+
+async def load_usage_limits(session: AsyncSession, contract_id: str) -> tuple[int | None, int | None]:
+    """读取合约固定版本中生效的 access_count / transfer_limit 规则，多条时取最严格的"""
+    version_hash = (await session.execute(
+        select(Contract.contract_template_version_hash).where(Contract.id == contract_id)
+    )).scalar_one_or_none()
+    if not version_hash:
+        return None, None
+    rules = (await load_version_rules(session, {version_hash})).get(version_hash, [])
+
+    access_limits = []
+    transfer_limits = []
+    for rule in rules:
+        if not rule["is_active"]:
+            continue
+        if rule["type"] == "access_count":
+            limit = parse_count_limit(rule["value"])
+            if limit is not None:
+                access_limits.append(limit)
+        elif rule["type"] == "transfer_limit":
+            limit = parse_byte_limit(rule["value"], rule["unit"])
+            if limit is not None:
+                transfer_limits.append(limit)
+    return (
+        min(access_limits) if access_limits else None,
+        min(transfer_limits) if transfer_limits else None,
+    )
+
+
+usage_meter = UsageMeter(
+    flush_interval=settings.metering_flush_interval_seconds,
+    max_pending_accesses=settings.metering_max_pending_accesses,
+)
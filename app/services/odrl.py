@@ -0,0 +1,202 @@
+"""
+合约模板 → ODRL（JSON-LD）策略文档
+
+按合约模板版本（content hash）编译为规范化的 ODRL Offer 文档并作为制品存储，
+键为 (contract_template_id, version_hash)。版本不可变，因此制品只在模板产生
+新版本时（创建、更新合约模板或其策略模板）增量生成一次，读取时直接按存储的字节返回，
+摘要作为 ETag；启动时为缺少制品的历史模板补齐。
+"""
+import hashlib
+from datetime import timedelta
+
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Connector, ContractTemplate, ContractTemplateArtifact
+from .interval_index import parse_access_period
+from .ip_index import parse_networks
+from .metering import parse_byte_limit, parse_count_limit
+from .template_versions import canonical_json, load_contract_terms
+
+ODRL_FORMAT = "odrl"
+
+_CONTEXT = [
+    "http://www.w3.org/ns/odrl.jsonld",
+    {"tds": "https://w3id.org/tds/policy#", "xsd": "http://www.w3.org/2001/XMLSchema#"},
+]
+
+
+def _iso_duration(period: timedelta) -> str:
+    seconds = int(period.total_seconds())
+    if seconds % 86400 == 0:
+        return f"P{seconds // 86400}D"
+    return f"PT{seconds}S"
+
+
+def _numeric(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def _compile_rule(rule: dict) -> tuple[str, dict] | None:
+    """单条规则 → ("constraint" | "duty", ODRL 片段)"""
+    rule_type = rule["type"]
+    value = rule["value"]
+    unit = rule.get("unit")
+
+    if rule_type == "access_period":
+        period = parse_access_period(value, unit)
+        right = {"@value": _iso_duration(period), "@type": "xsd:duration"} if period else value
+        return "constraint", {"leftOperand": "elapsedTime", "operator": "lteq", "rightOperand": right}
+    if rule_type == "access_count":
+        count = parse_count_limit(value)
+        return "constraint", {
+            "leftOperand": "count",
+            "operator": "lteq",
+            "rightOperand": count if count is not None else value,
+        }
+    if rule_type == "transfer_limit":
+        limit = parse_byte_limit(value, unit)
+        return "constraint", {
+            "leftOperand": "tds:transferVolume",
+            "operator": "lteq",
+            "rightOperand": limit if limit is not None else value,
+            "unit": "tds:byte",
+        }
+    if rule_type == "qps_limit":
+        return "constraint", {
+            "leftOperand": "tds:requestRate",
+            "operator": "lteq",
+            "rightOperand": _numeric(value),
+            "unit": "tds:requestsPerSecond",
+        }
+    if rule_type == "ip_restriction":
+        return "constraint", {
+            "leftOperand": "tds:ipAddress",
+            "operator": "isAnyOf",
+            "rightOperand": [str(network) for network in parse_networks(value)],
+        }
+    if rule_type == "identity_restriction":
+        return "constraint", {
+            "leftOperand": "tds:identity",
+            "operator": "isAnyOf",
+            "rightOperand": [item.strip() for item in value.split(",") if item.strip()],
+        }
+    if rule_type == "encryption":
+        return "duty", {
+            "action": "tds:encrypt",
+            "constraint": [
+                {"leftOperand": "tds:encryptionProtocol", "operator": "eq", "rightOperand": value}
+            ],
+        }
+    return None
+
+
+def compile_odrl(contract_template_id: str, version_hash: str, assigner: str, terms: dict) -> dict:
+    """把合约模板版本文档（含展开的策略模板版本）编译为 ODRL Offer"""
+    permissions = []
+    for policy in terms["policies"]:
+        permission = {
+            "uid": f"urn:tds:policy-version:{policy['content_hash']}",
+            "action": "use",
+            "tds:policyName": policy["name"],
+            "tds:category": policy["category"],
+            "tds:severity": policy["severity"],
+            "tds:enforcementType": policy["enforcement_type"],
+        }
+        constraints, duties = [], []
+        for rule in policy["rules"]:
+            if not rule["is_active"]:
+                continue
+            compiled = _compile_rule(rule)
+            if compiled is None:
+                continue
+            kind, fragment = compiled
+            (constraints if kind == "constraint" else duties).append(fragment)
+        if constraints:
+            permission["constraint"] = constraints
+        if duties:
+            permission["duty"] = duties
+        permissions.append(permission)
+
+    return {
+        "@context": _CONTEXT,
+        "@type": "Offer",
+        "uid": f"urn:tds:contract-template:{contract_template_id}:{version_hash}",
+        "profile": "https://w3id.org/tds/policy",
+        "assigner": assigner,
+        "tds:name": terms["name"],
+        "tds:description": terms["description"],
+        "tds:contractType": terms["contract_type"],
+        "tds:versionHash": version_hash,
+        "permission": permissions,
+    }
+
+
+async def load_odrl_artifact(
+    session: AsyncSession, contract_template: ContractTemplate
+) -> ContractTemplateArtifact | None:
+    """只读：合约模板当前版本已生成的 ODRL 制品"""
+    if contract_template.version_hash is None:
+        return None
+    return await session.get(
+        ContractTemplateArtifact, (contract_template.id, contract_template.version_hash, ODRL_FORMAT)
+    )
+
+
+async def ensure_odrl_artifact(
+    session: AsyncSession, contract_template: ContractTemplate
+) -> ContractTemplateArtifact | None:
+    """返回合约模板当前版本的 ODRL 制品，不存在时编译并存储"""
+    version_hash = contract_template.version_hash
+    if version_hash is None:
+        return None
+
+    key = (contract_template.id, version_hash, ODRL_FORMAT)
+    artifact = await session.get(ContractTemplateArtifact, key)
+    if artifact:
+        return artifact
+
+    terms = await load_contract_terms(session, version_hash)
+    if terms is None:
+        return None
+    assigner = (await session.execute(
+        select(Connector.did).where(Connector.id == contract_template.connector_id)
+    )).scalar_one()
+
+    body = canonical_json(compile_odrl(contract_template.id, version_hash, assigner, terms))
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    await session.execute(
+        insert(ContractTemplateArtifact)
+        .values(
+            contract_template_id=contract_template.id,
+            version_hash=version_hash,
+            format=ODRL_FORMAT,
+            body=body,
+            digest=digest,
+        )
+        .on_conflict_do_nothing()
+    )
+    return await session.get(ContractTemplateArtifact, key)
+
+
+async def backfill_odrl_artifacts(session: AsyncSession) -> None:
+    """为当前版本尚无 ODRL 制品的合约模板生成制品"""
+    templates = (await session.execute(
+        select(ContractTemplate)
+        .outerjoin(ContractTemplateArtifact, and_(
+            ContractTemplateArtifact.contract_template_id == ContractTemplate.id,
+            ContractTemplateArtifact.version_hash == ContractTemplate.version_hash,
+            ContractTemplateArtifact.format == ODRL_FORMAT,
+        ))
+        .where(ContractTemplate.version_hash.is_not(None), ContractTemplateArtifact.digest.is_(None))
+    )).scalars().all()
+    for contract_template in templates:
+        await ensure_odrl_artifact(session, contract_template)
+    await session.commit()
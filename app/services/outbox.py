@@ -0,0 +1,410 @@
+"""
+事务性 outbox
+
+合约与数据请求的每次状态变更，在同一事务中向 outbox_events 追加一条生命周期事件：
+事务回滚则事件不存在，事务提交则事件必然存在。后台 relay 按事件 ID 顺序分批读取，
+投递到配置的各个 sink，每个 sink 在 outbox_sink_offsets 中独立记录已投递到的位置，
+某个 sink 失败只阻塞它自己，下一轮从原位置重试。
+
+- 事件 ID 自增，SQLite 单写者下分配顺序即提交顺序，按 ID 投递即保证每个聚合内的顺序；
+- 每个聚合（aggregate_type, aggregate_id）的事件带有从 1 开始连续的 sequence，
+  消费方丢弃 sequence 不大于已处理值的事件即可实现恰好一次；
+- log sink 从文件末尾恢复已写入的最大事件 ID，重试和重启后都跳过已写入的事件，即恰好一次；
+  bus sink 只在进程内记录该 ID，进程在投递后、位置落库前退出时，重启后会重放最后一批；
+  webhook 在失败重试时可能重复投递；这两种情况由接收方按 sequence 去重；
+- 所有启用的 sink 都已投递的事件定期分批删除，每个聚合保留最后一条（写入时据此分配 sequence）。
+
+默认只启用 log；bus 供进程内代码 outbox_bus.subscribe() 后启用。
+
+新 sink 实现 OutboxSink 并在 _SINKS 中注册，通过 settings.outbox_sinks 启用。
+"""
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Protocol
+
+import httpx
+from sqlalchemy import delete, exists, func, insert, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Contract, DataRequest, OutboxEvent, OutboxSinkOffset
+from ..schemas import ContractOut, DataRequestOut
+from .interval_index import to_timestamp
+from .status_counters import CONTRACT, DATA_REQUEST
+
+
+@dataclass(frozen=True)
+class OutboxRecord:
+    """待写入 outbox 的事件（sequence 在写入时分配）"""
+    aggregate_type: str
+    aggregate_id: str
+    event_type: str
+    payload: dict
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    """投递给 sink 的事件"""
+    id: int
+    aggregate_type: str
+    aggregate_id: str
+    sequence: int
+    event_type: str
+    payload: dict
+    created_at: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def contract_record(contract: Contract, event_type: str) -> OutboxRecord:
+    return OutboxRecord(
+        CONTRACT, contract.id, event_type, ContractOut.model_validate(contract).model_dump(mode="json")
+    )
+
+
+def data_request_record(data_request: DataRequest, event_type: str, **changes) -> OutboxRecord:
+    payload = DataRequestOut.model_validate(data_request).model_dump(mode="json")
+    payload.update(changes)
+    return OutboxRecord(DATA_REQUEST, data_request.id, event_type, payload)
+
+
+async def record(session: AsyncSession, records: list[OutboxRecord]) -> None:
+    """在调用方事务中追加事件（不提交）；须在本事务的状态变更写入之后调用，
+    此时已持有 SQLite 写锁，读取的最大 sequence 不会被并发事务改变"""
+    if not records:
+        return
+    keys = {(item.aggregate_type, item.aggregate_id) for item in records}
+    result = await session.execute(
+        select(OutboxEvent.aggregate_type, OutboxEvent.aggregate_id, func.max(OutboxEvent.sequence))
+        .where(tuple_(OutboxEvent.aggregate_type, OutboxEvent.aggregate_id).in_(keys))
+        .group_by(OutboxEvent.aggregate_type, OutboxEvent.aggregate_id)
+    )
+    sequences = {(aggregate_type, aggregate_id): sequence for aggregate_type, aggregate_id, sequence in result.all()}
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for item in records:
+        key = (item.aggregate_type, item.aggregate_id)
+        sequences[key] = sequences.get(key, 0) + 1
+        rows.append({
+            "aggregate_type": item.aggregate_type,
+            "aggregate_id": item.aggregate_id,
+            "sequence": sequences[key],
+            "event_type": item.event_type,
+            "payload": item.payload,
+            "created_at": now,
+        })
+    await session.execute(insert(OutboxEvent), rows)
+
+
+class OutboxSink(Protocol):
+    name: str
+
+    async def deliver(self, messages: list[OutboxMessage]) -> None:
+        """按顺序投递一批事件，全部成功才返回，失败抛出异常（整批稍后重试）"""
+        ...
+
+
+Handler = Callable[[OutboxMessage], Awaitable[None]]
+
+
+class InProcessSink:
+    """进程内订阅：按顺序把事件交给已注册的异步处理函数（已投递位置不跨进程保存）"""
+    name = "bus"
+
+    def __init__(self):
+        self._handlers: list[Handler] = []
+        self._last_id = 0
+
+    def subscribe(self, handler: Handler) -> None:
+        self._handlers.append(handler)
+
+    async def deliver(self, messages: list[OutboxMessage]) -> None:
+        for message in messages:
+            # 批内前面的事件已处理、后面的失败时，重试时跳过已处理的部分
+            if message.id <= self._last_id:
+                continue
+            for handler in self._handlers:
+                await handler(message)
+            self._last_id = message.id
+
+
+class LogFileSink:
+    """追加写入 JSON Lines 文件，每批 fsync 一次"""
+    name = "log"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._last_id: int | None = None
+
+    def _read_last_id(self) -> int:
+        """文件中最后一条完整事件的 ID（重启后跳过已写入的事件）"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 65536))
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        for line in reversed(lines):
+            try:
+                return int(json.loads(line)["id"])
+            except (ValueError, KeyError, TypeError):
+                # 崩溃时未写完的最后一行
+                continue
+        return 0
+
+    def _write(self, messages: list[OutboxMessage]) -> None:
+        if self._last_id is None:
+            self._last_id = self._read_last_id()
+        pending = [message for message in messages if message.id > self._last_id]
+        if not pending:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for message in pending:
+                f.write(json.dumps(message.to_dict(), ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._last_id = pending[-1].id
+
+    async def deliver(self, messages: list[OutboxMessage]) -> None:
+        await asyncio.to_thread(self._write, messages)
+
+
+class WebhookSink:
+    """一批事件作为一个 JSON 请求 POST 到 webhook，非 2xx 视为失败"""
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def deliver(self, messages: list[OutboxMessage]) -> None:
+        response = await self._client.post(
+            self.url, json={"events": [message.to_dict() for message in messages]}
+        )
+        response.raise_for_status()
+
+
+def _webhook_sink() -> WebhookSink:
+    if not settings.outbox_webhook_url:
+        raise ValueError("outbox_webhook_url is required for the webhook sink")
+    return WebhookSink(settings.outbox_webhook_url, settings.outbox_webhook_timeout_seconds)
+
+
+outbox_bus = InProcessSink()
+
+_SINKS = {
+    "bus": lambda: outbox_bus,
+    "log": lambda: LogFileSink(settings.outbox_log_path),
+    "webhook": _webhook_sink,
+}
+
+
+def create_sinks(names: str) -> list[OutboxSink]:
+    sinks = []
+    for name in (name.strip() for name in names.split(",")):
+        if not name:
+            continue
+        try:
+            sinks.append(_SINKS[name]())
+        except KeyError:
+            raise ValueError(f"Unknown outbox sink: {name}") from None
+    return sinks
+
+
+@dataclass
+class SinkStats:
+    delivered: int = 0
+    failures: int = 0
+    last_error: str | None = None
+    # 最近一批中最后一个事件从写入到投递完成的耗时
+    last_delivery_lag_seconds: float | None = None
+
+
+class OutboxRelay:
+    def __init__(
+        self,
+        sinks: list[OutboxSink],
+        batch_size: int,
+        poll_interval: float,
+        prune_interval: float,
+        prune_batch_size: int,
+    ):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval
+        self.prune_batch_size = prune_batch_size
+        self.pruned = 0
+        self._last_prune = 0.0
+        self._offsets: dict[str, int] = {}
+        self._stats: dict[str, SinkStats] = {sink.name: SinkStats() for sink in sinks}
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """写入 outbox 的事务提交后唤醒 relay"""
+        self._wakeup.set()
+
+    async def _offset(self, session: AsyncSession, sink: OutboxSink) -> int:
+        if sink.name not in self._offsets:
+            offset = await session.get(OutboxSinkOffset, sink.name)
+            self._offsets[sink.name] = offset.last_event_id if offset else 0
+        return self._offsets[sink.name]
+
+    async def relay_batch(self, sink: OutboxSink) -> int:
+        """向一个 sink 投递下一批事件，返回投递数量；失败时不推进位置并返回 0"""
+        async with SessionLocal() as session:
+            offset = await self._offset(session, sink)
+            events = (await session.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.id > offset)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+            )).scalars().all()
+        if not events:
+            return 0
+        messages = [
+            OutboxMessage(
+                id=event.id,
+                aggregate_type=event.aggregate_type,
+                aggregate_id=event.aggregate_id,
+                sequence=event.sequence,
+                event_type=event.event_type,
+                payload=event.payload,
+                created_at=event.created_at.isoformat(),
+            )
+            for event in events
+        ]
+
+        stats = self._stats[sink.name]
+        try:
+            await sink.deliver(messages)
+        except Exception as exc:
+            stats.failures += 1
+            stats.last_error = str(exc) or type(exc).__name__
+            return 0
+
+        last_id = messages[-1].id
+        async with SessionLocal() as session:
+            await session.execute(
+                sqlite_insert(OutboxSinkOffset)
+                .values(sink=sink.name, last_event_id=last_id, updated_at=datetime.now(timezone.utc))
+                .on_conflict_do_update(
+                    index_elements=[OutboxSinkOffset.sink],
+                    set_={"last_event_id": last_id, "updated_at": datetime.now(timezone.utc)},
+                )
+            )
+            await session.commit()
+        self._offsets[sink.name] = last_id
+
+        now = time.time()
+        stats.delivered += len(messages)
+        stats.last_delivery_lag_seconds = max(0.0, now - to_timestamp(events[-1].created_at))
+        return len(messages)
+
+    async def _drain_sink(self, sink: OutboxSink) -> int:
+        total = 0
+        while True:
+            delivered = await self.relay_batch(sink)
+            total += delivered
+            if delivered < self.batch_size:
+                return total
+
+    async def drain(self) -> int:
+        """各 sink 并行投递到当前末尾（失败的 sink 留到下一轮），返回投递总数"""
+        results = await asyncio.gather(*(self._drain_sink(sink) for sink in self.sinks))
+        return sum(results)
+
+    async def _prune_batch(self) -> int:
+        async with SessionLocal() as session:
+            if self.sinks:
+                delivered = min([await self._offset(session, sink) for sink in self.sinks])
+            else:
+                delivered = (await session.execute(select(func.max(OutboxEvent.id)))).scalar_one() or 0
+            newer = aliased(OutboxEvent)
+            superseded = exists().where(
+                newer.aggregate_type == OutboxEvent.aggregate_type,
+                newer.aggregate_id == OutboxEvent.aggregate_id,
+                newer.sequence > OutboxEvent.sequence,
+            )
+            ids = (await session.execute(
+                select(OutboxEvent.id)
+                .where(OutboxEvent.id <= delivered, superseded)
+                .order_by(OutboxEvent.id)
+                .limit(self.prune_batch_size)
+            )).scalars().all()
+            if not ids:
+                return 0
+            # 先结束读事务再写（SQLite 读事务升级为写事务时不会等待其他写者）
+            await session.commit()
+            await session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(ids)))
+            await session.commit()
+        return len(ids)
+
+    async def prune(self) -> int:
+        """分批删除所有 sink 都已投递、且不是所属聚合最后一条的事件，返回删除数量"""
+        self._last_prune = time.monotonic()
+        total = 0
+        while True:
+            deleted = await self._prune_batch()
+            total += deleted
+            if deleted < self.prune_batch_size:
+                break
+        self.pruned += total
+        return total
+
+    async def metrics(self, session: AsyncSession) -> dict:
+        head = (await session.execute(select(func.max(OutboxEvent.id)))).scalar_one() or 0
+        now = time.time()
+        sinks = []
+        for sink in self.sinks:
+            offset = await self._offset(session, sink)
+            pending, oldest = (await session.execute(
+                select(func.count(), func.min(OutboxEvent.created_at)).where(OutboxEvent.id > offset)
+            )).one()
+            stats = self._stats[sink.name]
+            sinks.append({
+                "name": sink.name,
+                "offset": offset,
+                "pending": pending,
+                # 最早一条未投递事件已等待的时间
+                "lag_seconds": max(0.0, now - to_timestamp(oldest)) if oldest else 0.0,
+                "delivered": stats.delivered,
+                "failures": stats.failures,
+                "last_error": stats.last_error,
+                "last_delivery_lag_seconds": stats.last_delivery_lag_seconds,
+            })
+        return {"head_event_id": head, "pruned": self.pruned, "sinks": sinks}
+
+    async def run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    await self.prune()
+            except Exception:
+                # 下一轮重试
+                pass
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_relay = OutboxRelay(
+    sinks=create_sinks(settings.outbox_sinks),
+    batch_size=settings.outbox_batch_size,
+    poll_interval=settings.outbox_poll_interval_seconds,
+    prune_interval=settings.outbox_prune_interval_seconds,
+    prune_batch_size=settings.outbox_prune_batch_size,
+)
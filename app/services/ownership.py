@@ -0,0 +1,182 @@
+"""
+资源归属 / 访问权限解析
+
+把“先查资源，再查其 Connector 比较 owner_user_id”的逐条校验合并为一次联表查询：
+一批资源 ID 一个往返，返回每个 ID 的解析结果（ok / not_found / forbidden）。
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..models import Connector, Contract, DataOffering, DataRequest
+
+
+class Access(str, Enum):
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    FORBIDDEN = "forbidden"
+
+
+@dataclass(frozen=True)
+class Resolution:
+    id: str
+    access: Access
+    row: Any = None
+    # 仅数据请求 / 合约：当前用户是否为消费者 / 提供者
+    is_consumer: bool = False
+    is_provider: bool = False
+    consumer_user_id: str | None = None
+    provider_user_id: str | None = None
+    provider_connector_id: str | None = None
+
+    @property
+    def party_user_ids(self) -> set[str]:
+        """双方连接器的所有者（用于事件推送）"""
+        return {user_id for user_id in (self.consumer_user_id, self.provider_user_id) if user_id}
+
+
+def _fill_missing(ids: list[str], found: dict[str, Resolution]) -> dict[str, Resolution]:
+    return {
+        resource_id: found.get(resource_id, Resolution(resource_id, Access.NOT_FOUND))
+        for resource_id in ids
+    }
+
+
+async def resolve_owned(
+    session: AsyncSession,
+    model,
+    ids: Iterable[str],
+    user_id: str,
+    options: Iterable = (),
+) -> dict[str, Resolution]:
+    """
+    解析归属于连接器的资源（Connector 本身，或带 connector_id 的
+    DataOffering / PolicyTemplate / ContractTemplate），资源所属连接器的
+    owner_user_id 等于 user_id 时为 OK。
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+
+    if model is Connector:
+        query = select(Connector, Connector.owner_user_id)
+    else:
+        query = select(model, Connector.owner_user_id).join(
+            Connector, Connector.id == model.connector_id
+        )
+    query = query.where(model.id.in_(ids)).options(*options)
+
+    found = {}
+    for row, owner_user_id in (await session.execute(query)).all():
+        access = Access.OK if owner_user_id == user_id else Access.FORBIDDEN
+        found[row.id] = Resolution(row.id, access, row)
+    return _fill_missing(ids, found)
+
+
+async def _resolve_parties(
+    session: AsyncSession,
+    model,
+    consumer_column,
+    provider_column,
+    ids: Iterable[str],
+    user_id: str,
+    joins: Iterable = (),
+    options: Iterable = (),
+) -> dict[str, Resolution]:
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+
+    consumer = aliased(Connector)
+    provider = aliased(Connector)
+    query = select(model, consumer.owner_user_id, provider.owner_user_id, provider.id)
+    for target, onclause in joins:
+        query = query.join(target, onclause)
+    query = (
+        query.join(consumer, consumer.id == consumer_column)
+        .join(provider, provider.id == provider_column)
+        .where(model.id.in_(ids))
+        .options(*options)
+    )
+
+    found = {}
+    for row, consumer_owner, provider_owner, provider_id in (await session.execute(query)).all():
+        is_consumer = consumer_owner == user_id
+        is_provider = provider_owner == user_id
+        access = Access.OK if is_consumer or is_provider else Access.FORBIDDEN
+        found[row.id] = Resolution(
+            row.id, access, row, is_consumer, is_provider, consumer_owner, provider_owner, provider_id
+        )
+    return _fill_missing(ids, found)
+
+
+async def resolve_data_request_parties(
+    session: AsyncSession, ids: Iterable[str], user_id: str, options: Iterable = ()
+) -> dict[str, Resolution]:
+    """解析数据请求：消费者连接器或所请求数据资源的提供者连接器属于 user_id 时为 OK"""
+    return await _resolve_parties(
+        session,
+        DataRequest,
+        DataRequest.consumer_connector_id,
+        DataOffering.connector_id,
+        ids,
+        user_id,
+        joins=[(DataOffering, DataOffering.id == DataRequest.data_offering_id)],
+        options=options,
+    )
+
+
+async def resolve_contract_parties(
+    session: AsyncSession, ids: Iterable[str], user_id: str, options: Iterable = ()
+) -> dict[str, Resolution]:
+    """解析合约：提供者或消费者连接器属于 user_id 时为 OK"""
+    return await _resolve_parties(
+        session,
+        Contract,
+        Contract.consumer_connector_id,
+        Contract.provider_connector_id,
+        ids,
+        user_id,
+        options=options,
+    )
+
+
+async def connector_owner_ids(session: AsyncSession, connector_ids: Iterable[str]) -> set[str]:
+    """连接器所有者的用户 ID"""
+    connector_ids = set(connector_ids)
+    if not connector_ids:
+        return set()
+    result = await session.execute(
+        select(Connector.owner_user_id).where(Connector.id.in_(connector_ids))
+    )
+    return set(result.scalars().all())
+
+
+async def connector_owners(session: AsyncSession, connector_ids: Iterable[str]) -> dict[str, str]:
+    """connector_id -> 所有者用户 ID"""
+    connector_ids = set(connector_ids)
+    if not connector_ids:
+        return {}
+    result = await session.execute(
+        select(Connector.id, Connector.owner_user_id).where(Connector.id.in_(connector_ids))
+    )
+    return dict(result.all())
+
+
+def ensure_access(
+    resolution: Resolution,
+    not_found_detail: str,
+    forbidden_detail: str = "Access denied",
+    forbidden_status: int = 403,
+):
+    """单个资源的解析结果转换为 HTTP 错误，OK 时返回资源行"""
+    if resolution.access is Access.NOT_FOUND:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if resolution.access is Access.FORBIDDEN:
+        raise HTTPException(status_code=forbidden_status, detail=forbidden_detail)
+    return resolution.row
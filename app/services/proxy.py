@@ -0,0 +1,164 @@
+"""
+restful 数据资源的数据平面代理
+
+消费者持有有效合约时，请求经连接器转发到数据资源的 storage_meta.api_endpoint：
+
+- 每个上游（scheme + host + port）一个长连接复用的 httpx.AsyncClient，连接数按上游
+  分别限制，一个慢上游占满连接池时不影响其他上游；
+- 请求体和响应体都以流的方式转发，不在内存中缓冲完整内容；
+- 连接 / 读 / 写 / 等待连接池分别超时；
+- 转发结束（包括客户端中途断开）时把请求与响应的字节数记入用量计量。
+"""
+import asyncio
+from collections.abc import AsyncIterator
+from urllib.parse import quote, unquote, urlsplit
+
+import httpx
+
+from ..config import settings
+
+# 逐跳头部，不转发（RFC 9110 7.6.1）
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+# 调用方发给连接器的头部，不转发给上游：Authorization 是连接器颁发的 JWT
+REQUEST_EXCLUDED_HEADERS = HOP_BY_HOP_HEADERS | {"host", "authorization", "cookie"}
+RESPONSE_EXCLUDED_HEADERS = HOP_BY_HOP_HEADERS | {"set-cookie"}
+
+
+class ByteCounter:
+    """包装异步字节流并统计经过的字节数"""
+
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self._stream = stream
+        self.bytes = 0
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self.bytes += len(chunk)
+            yield chunk
+
+
+# 子路径段中保留原样的字符（RFC 3986 pchar 中的 sub-delims 与 ":" "@"），其余字符一律百分号编码
+_SEGMENT_SAFE = "!$&'()*+,;=:@"
+
+
+def _fully_unquote(segment: str) -> str:
+    """反复解码直到不再变化，识别 %252e%252e 这类多重编码的点段"""
+    while (decoded := unquote(segment)) != segment:
+        segment = decoded
+    return segment
+
+
+def upstream_url(api_endpoint: str, path: str, query: str) -> str:
+    """api_endpoint 下的子路径；不允许用 .. 跳出 api_endpoint
+
+    path 是已解码一次的路径，每一段重新编码后拼接：段中的 %、?、# 不会在上游被解释为
+    编码、查询或片段；任意多重编码后为 . 或 .. 的段直接拒绝。
+    """
+    segments = path.split("/")
+    if any(_fully_unquote(segment) in (".", "..") for segment in segments):
+        raise ValueError("Path must not contain '.' or '..' segments")
+    url = api_endpoint.rstrip("/")
+    if path:
+        url += "/" + "/".join(quote(segment, safe=_SEGMENT_SAFE) for segment in segments)
+    if query:
+        url += "?" + query
+    return url
+
+
+def request_headers(headers: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """转发给上游的请求头（Connection 中列出的头部同样视为逐跳头部）"""
+    connection = {
+        name.strip().lower()
+        for key, value in headers if key.lower() == "connection"
+        for name in value.split(",")
+    }
+    return [
+        (key, value) for key, value in headers
+        if key.lower() not in REQUEST_EXCLUDED_HEADERS and key.lower() not in connection
+    ]
+
+
+def response_headers(headers: httpx.Headers) -> list[tuple[str, str]]:
+    return [
+        (key, value) for key, value in headers.multi_items()
+        if key.lower() not in RESPONSE_EXCLUDED_HEADERS
+    ]
+
+
+class UpstreamPool:
+    """按上游复用的 HTTP 客户端，每个客户端有独立的连接池"""
+
+    def __init__(
+        self,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        timeout: httpx.Timeout,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    @staticmethod
+    def origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        origin = self.origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                # 不跟随重定向，由调用方处理上游的 3xx
+                follow_redirects=False,
+            )
+            self._clients[origin] = client
+        return client
+
+    async def send(
+        self,
+        method: str,
+        url: str,
+        headers: list[tuple[str, str]],
+        content: AsyncIterator[bytes] | None,
+    ) -> httpx.Response:
+        """发出请求并返回尚未读取响应体的响应，调用方负责 aclose"""
+        client = self.client(url)
+        request = client.build_request(method, url, headers=headers, content=content)
+        return await client.send(request, stream=True)
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+upstream_pool = UpstreamPool(
+    max_connections=settings.proxy_max_connections_per_upstream,
+    max_keepalive_connections=settings.proxy_max_keepalive_per_upstream,
+    keepalive_expiry=settings.proxy_keepalive_expiry_seconds,
+    timeout=httpx.Timeout(
+        connect=settings.proxy_connect_timeout_seconds,
+        read=settings.proxy_read_timeout_seconds,
+        write=settings.proxy_write_timeout_seconds,
+        pool=settings.proxy_pool_timeout_seconds,
+    ),
+)
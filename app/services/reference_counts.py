@@ -0,0 +1,49 @@
+"""
+模板的反向引用计数
+
+- PolicyTemplate.reference_count：引用该策略模板的合约模板数
+- ContractTemplate.usage_count：基于该合约模板创建的合约数
+
+计数与关联关系在同一事务中以原子 UPDATE 维护，删除前的“是否仍被引用”检查为 O(1)。
+"""
+from typing import Iterable
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Contract, ContractTemplate, ContractTemplatePolicy, PolicyTemplate
+
+
+async def adjust_policy_references(
+    session: AsyncSession, policy_template_ids: Iterable[str], delta: int
+) -> None:
+    ids = list(policy_template_ids)
+    if not ids or not delta:
+        return
+    await session.execute(
+        update(PolicyTemplate)
+        .where(PolicyTemplate.id.in_(ids))
+        .values(reference_count=PolicyTemplate.reference_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def rebuild_reference_counts(session: AsyncSession) -> None:
+    """按关联表 / 合约表重新计算全部引用计数（启动时用于修正历史数据）"""
+    await session.execute(
+        update(PolicyTemplate).values(
+            reference_count=select(func.count())
+            .select_from(ContractTemplatePolicy)
+            .where(ContractTemplatePolicy.policy_template_id == PolicyTemplate.id)
+            .scalar_subquery()
+        )
+    )
+    await session.execute(
+        update(ContractTemplate).values(
+            usage_count=select(func.count())
+            .select_from(Contract)
+            .where(Contract.contract_template_id == ContractTemplate.id)
+            .scalar_subquery()
+        )
+    )
+    await session.commit()
@@ -0,0 +1,512 @@
+"""
+s3 数据资源的并行分片传输
+
+数据资源的 storage_meta 只记录 bucket_name / object_key / region，连接器用配置的凭证
+直接访问对象存储（路径风格地址 + SigV4 签名，兼容 AWS S3、MinIO 等 S3 兼容服务）。
+凭证由所有连接器共享，因此对象只能位于 settings.s3_allowed_buckets 中、键以
+"<连接器 ID>/" 开头，对象存储地址只取自配置：
+
+
+- 下载：HEAD 取得大小和 ETag 后按分片大小并行发出 Range GET，最多 concurrency 个
+  分片同时在途，按顺序输出；每个 GET 带 If-Match，传输中对象被覆盖时失败而不是拼接
+  出两个版本的内容；
+- 上传：请求体按分片大小切分，小于一个分片时单次 PUT，否则 Multipart Upload，最多
+  concurrency 个分片同时上传；失败时中止上传，不留下未完成的分片；
+- 内存：下载和上传在内存中最多保留 concurrency + 1 个分片；
+- 校验：每个分片带 Content-MD5 和签名的 x-amz-content-sha256，由服务端校验；上传完成
+  后按分片 MD5 计算期望的 ETag 与服务端返回的比对。下载时单次 PUT 的对象比对整体
+  MD5，本引擎上传的分片对象按记录在元数据中的分片大小切分 Range，逐片 MD5 后比对
+  ETag；其他分片上传的对象无法从 ETag 还原，只校验长度。
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import hmac
+import re
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+
+from ..config import settings
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+# 上传时记录分片大小的用户元数据（x-amz-meta-part-size），下载时按它对齐 Range 以校验 ETag
+PART_SIZE_METADATA = "part-size"
+_S3_NAMESPACE = re.compile(r"\{[^}]*\}")
+
+
+class S3Error(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class ChecksumError(Exception):
+    """传输内容与对象存储的 ETag / 长度不一致"""
+
+
+@dataclass(frozen=True)
+class S3Location:
+    endpoint_url: str
+    region: str
+    bucket: str
+    key: str
+
+    @property
+    def url(self) -> str:
+        return f"{self.endpoint_url.rstrip('/')}/{quote(self.bucket, safe='')}/{quote(self.key, safe='/~')}"
+
+
+def location_for(storage_meta: dict | None, connector_id: str) -> S3Location:
+    """s3 数据资源的对象位置；桶不在允许列表中、键不在连接器自己的前缀下时抛出 ValueError"""
+    storage_meta = storage_meta or {}
+    bucket, key = storage_meta.get("bucket_name"), storage_meta.get("object_key")
+    if not bucket or not key:
+        raise ValueError("storage_meta must include bucket_name and object_key")
+    if bucket not in settings.s3_allowed_buckets:
+        raise ValueError(f"Bucket {bucket} is not allowed")
+    prefix = f"{connector_id}/"
+    # 路径风格地址中的 . / .. 段会被规范化，可能越出前缀
+    if not key.startswith(prefix) or any(segment in (".", "..") for segment in key.split("/")):
+        raise ValueError(f"object_key must start with {prefix}")
+    region = storage_meta.get("region") or settings.s3_default_region
+    endpoint_url = settings.s3_endpoint_url or f"https://s3.{region}.amazonaws.com"
+    return S3Location(endpoint_url, region, bucket, key)
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    size: int
+    etag: str
+    metadata: dict[str, str]
+
+
+@dataclass(frozen=True)
+class UploadResult:
+    etag: str
+    size: int
+    parts: int
+    sha256: str
+
+
+def content_md5(digest: bytes) -> str:
+    return base64.b64encode(digest).decode("ascii")
+
+
+def multipart_etag(part_digests: list[bytes]) -> str:
+    """分片上传对象的 ETag：各分片 MD5 拼接后再取 MD5，加上分片数"""
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+async def _send_once(data: bytes) -> AsyncIterator[bytes]:
+    """请求体包装为只读一次的流：发送完即释放，不随 httpx 的 Request 留在引用环中"""
+    yield data
+
+
+def _digests(data: bytes) -> tuple[bytes, str]:
+    return hashlib.md5(data).digest(), hashlib.sha256(data).hexdigest()
+
+
+class SigV4Signer:
+    """AWS Signature Version 4（请求头签名）"""
+
+    def __init__(self, access_key_id: str, secret_access_key: str, service: str = "s3"):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.service = service
+        self._keys: dict[tuple[str, str], bytes] = {}
+
+    def _signing_key(self, date: str, region: str) -> bytes:
+        key = self._keys.get((date, region))
+        if key is None:
+            key = ("AWS4" + self.secret_access_key).encode("utf-8")
+            for part in (date, region, self.service, "aws4_request"):
+                key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+            self._keys = {(date, region): key}
+        return key
+
+    def sign(
+        self,
+        method: str,
+        url: str,
+        region: str,
+        headers: dict[str, str],
+        payload_hash: str,
+        now: datetime | None = None,
+    ) -> dict[str, str]:
+        """返回加上 host / x-amz-date / x-amz-content-sha256 / Authorization 的请求头
+
+        url 的路径和查询参数须已按 S3 规则编码（quote 时保留 /~）。
+        """
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+        parts = urlsplit(url)
+        headers = {
+            **{key.lower(): str(value).strip() for key, value in headers.items()},
+            "host": parts.netloc,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+        }
+
+        query = []
+        for item in parts.query.split("&") if parts.query else []:
+            key, _, value = item.partition("=")
+            query.append((key, value))
+        canonical_query = "&".join(f"{key}={value}" for key, value in sorted(query))
+        signed_headers = ";".join(sorted(headers))
+        canonical_headers = "".join(f"{key}:{headers[key]}\n" for key in sorted(headers))
+        canonical_request = "\n".join([
+            method, parts.path or "/", canonical_query, canonical_headers, signed_headers, payload_hash,
+        ])
+
+        scope = f"{date}/{region}/{self.service}/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(
+            self._signing_key(date, region), string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return headers
+
+
+def _query(params: dict[str, str]) -> str:
+    return "&".join(
+        f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}" for key, value in sorted(params.items())
+    )
+
+
+def _xml_find(element: ElementTree.Element, name: str) -> str | None:
+    """忽略 S3 响应的 XML 命名空间查找子元素"""
+    for child in element.iter():
+        if _S3_NAMESPACE.sub("", child.tag) == name:
+            return child.text
+    return None
+
+
+class S3Client:
+    def __init__(self, signer: SigV4Signer, max_connections: int, timeout: float):
+        self.signer = signer
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+
+    async def _send(
+        self,
+        method: str,
+        location: S3Location,
+        params: dict[str, str] | None = None,
+        headers: dict[str, str] | None = None,
+        content: bytes = b"",
+        payload_hash: str | None = None,
+    ) -> httpx.Response:
+        """发出签名请求，返回尚未读取响应体的响应（调用方负责 aclose）；出错时抛出 S3Error"""
+        url = location.url + ("?" + _query(params) if params else "")
+        headers = dict(headers or {})
+        if content:
+            headers["content-length"] = str(len(content))
+        signed = self.signer.sign(
+            method,
+            url,
+            location.region,
+            headers,
+            payload_hash or (hashlib.sha256(content).hexdigest() if content else EMPTY_SHA256),
+        )
+        request = self._http.build_request(
+            method, url, headers=signed, content=_send_once(content) if content else None
+        )
+        response = await self._http.send(request, stream=True)
+        if response.status_code >= 300:
+            try:
+                body = await response.aread()
+            finally:
+                await response.aclose()
+            code, message = "Error", response.reason_phrase
+            if body:
+                try:
+                    root = ElementTree.fromstring(body)
+                    code = _xml_find(root, "Code") or code
+                    message = _xml_find(root, "Message") or message
+                except ElementTree.ParseError:
+                    pass
+            raise S3Error(response.status_code, code, message)
+        return response
+
+    async def _request(self, method: str, location: S3Location, **kwargs) -> httpx.Response:
+        """发出签名请求并读取完整的（较小的）响应体"""
+        response = await self._send(method, location, **kwargs)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    async def head_object(self, location: S3Location) -> ObjectInfo:
+        response = await self._request("HEAD", location)
+        return ObjectInfo(
+            size=int(response.headers["content-length"]),
+            etag=response.headers.get("etag", "").strip('"'),
+            metadata={
+                key[len("x-amz-meta-"):]: value
+                for key, value in response.headers.items() if key.startswith("x-amz-meta-")
+            },
+        )
+
+    async def get_range(self, location: S3Location, start: int, end: int, etag: str) -> bytes:
+        """读取 [start, end] 闭区间；对象已不是 etag 对应的版本时服务端返回 412"""
+        response = await self._send(
+            "GET", location, headers={"range": f"bytes={start}-{end}", "if-match": f'"{etag}"'}
+        )
+        # 逐块读取而不是 response.content：httpx 的 Response 与其流互相引用，
+        # 保存在 Response 上的分片要等到下一次循环 GC 才会释放
+        try:
+            chunks = [chunk async for chunk in response.aiter_raw()]
+        finally:
+            await response.aclose()
+        data = b"".join(chunks)
+        if len(data) != end - start + 1:
+            raise ChecksumError(f"Range {start}-{end} returned {len(data)} bytes, expected {end - start + 1}")
+        return data
+
+    async def put_object(self, location: S3Location, body: bytes, md5: bytes, sha256: str) -> str:
+        response = await self._request(
+            "PUT", location, headers={"content-md5": content_md5(md5)}, content=body, payload_hash=sha256
+        )
+        return response.headers.get("etag", "").strip('"')
+
+    async def create_multipart_upload(self, location: S3Location, metadata: dict[str, str]) -> str:
+        response = await self._request(
+            "POST",
+            location,
+            params={"uploads": ""},
+            headers={f"x-amz-meta-{key}": value for key, value in metadata.items()},
+        )
+        upload_id = _xml_find(ElementTree.fromstring(response.content), "UploadId")
+        if not upload_id:
+            raise S3Error(response.status_code, "InvalidResponse", "CreateMultipartUpload returned no UploadId")
+        return upload_id
+
+    async def upload_part(
+        self, location: S3Location, upload_id: str, part_number: int, body: bytes, md5: bytes, sha256: str
+    ) -> str:
+        response = await self._request(
+            "PUT",
+            location,
+            params={"partNumber": str(part_number), "uploadId": upload_id},
+            headers={"content-md5": content_md5(md5)},
+            content=body,
+            payload_hash=sha256,
+        )
+        return response.headers.get("etag", "").strip('"')
+
+    async def complete_multipart_upload(
+        self, location: S3Location, upload_id: str, parts: list[tuple[int, str]]
+    ) -> str:
+        body = "<CompleteMultipartUpload>{}</CompleteMultipartUpload>".format("".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>\"{etag}\"</ETag></Part>" for number, etag in parts
+        )).encode("utf-8")
+        response = await self._request("POST", location, params={"uploadId": upload_id}, content=body)
+        root = ElementTree.fromstring(response.content)
+        # S3 可能在 200 响应体中返回错误
+        if _S3_NAMESPACE.sub("", root.tag) == "Error":
+            raise S3Error(response.status_code, _xml_find(root, "Code") or "Error", _xml_find(root, "Message") or "")
+        return (_xml_find(root, "ETag") or "").strip('"')
+
+    async def abort_multipart_upload(self, location: S3Location, upload_id: str) -> None:
+        await self._request("DELETE", location, params={"uploadId": upload_id})
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+class _PartReader:
+    """把任意大小的数据块切分为固定大小的分片"""
+
+    def __init__(self, chunks: AsyncIterator[bytes], part_size: int):
+        self._chunks = chunks.__aiter__()
+        self._part_size = part_size
+        self._buffer = bytearray()
+        self._exhausted = False
+
+    async def read(self) -> bytes | None:
+        while not self._exhausted and len(self._buffer) < self._part_size:
+            try:
+                self._buffer += await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._exhausted = True
+        if not self._buffer:
+            return None
+        with memoryview(self._buffer) as view:
+            part = bytes(view[:self._part_size])
+        del self._buffer[:self._part_size]
+        return part
+
+
+class TransferEngine:
+    def __init__(self, client: S3Client, part_size: int, concurrency: int):
+        self.client = client
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+    async def download(self, location: S3Location) -> tuple[ObjectInfo, AsyncIterator[bytes]]:
+        """返回对象信息和按顺序输出对象内容的异步迭代器；内容与 ETag 不一致时迭代器最后抛出 ChecksumError"""
+        info = await self.client.head_object(location)
+        part_size = self.part_size
+        verify_parts = False
+        # 本引擎上传的分片对象按上传时的分片大小读取，才能逐片校验 ETag；元数据来自对象本身，
+        # 只接受不超过配置分片大小的值，否则按配置分片读取、只校验长度，缓冲区始终有界
+        if "-" in info.etag:
+            recorded = info.metadata.get(PART_SIZE_METADATA, "")
+            if recorded.isdigit() and 0 < int(recorded) <= self.part_size:
+                part_size = int(recorded)
+                verify_parts = True
+        return info, self._download_parts(location, info, part_size, verify_parts)
+
+    async def _download_parts(
+        self, location: S3Location, info: ObjectInfo, part_size: int, verify_parts: bool
+    ) -> AsyncIterator[bytes]:
+        ranges = iter([(start, min(start + part_size, info.size) - 1) for start in range(0, info.size, part_size)])
+        multipart = "-" in info.etag
+        whole = hashlib.md5()
+        part_digests = []
+        in_flight: collections.deque[asyncio.Task] = collections.deque()
+
+        def schedule() -> None:
+            next_range = next(ranges, None)
+            if next_range is not None:
+                in_flight.append(asyncio.create_task(self.client.get_range(location, *next_range, info.etag)))
+
+        try:
+            for _ in range(self.concurrency):
+                schedule()
+            while in_flight:
+                data = await in_flight.popleft()
+                schedule()
+                if multipart:
+                    part_digests.append((await asyncio.to_thread(hashlib.md5, data)).digest())
+                else:
+                    await asyncio.to_thread(whole.update, data)
+                yield data
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        if multipart:
+            # 其他工具上传的分片对象不知道其分片大小，无法还原 ETag
+            if verify_parts and multipart_etag(part_digests) != info.etag:
+                raise ChecksumError(f"Downloaded content does not match ETag {info.etag}")
+        elif whole.hexdigest() != info.etag:
+            raise ChecksumError(f"Downloaded content does not match ETag {info.etag}")
+
+    async def upload(self, location: S3Location, chunks: AsyncIterator[bytes]) -> UploadResult:
+        reader = _PartReader(chunks, self.part_size)
+        first = await reader.read() or b""
+        second = await reader.read() if len(first) == self.part_size else None
+        if second is None:
+            md5, sha256 = await asyncio.to_thread(_digests, first)
+            etag = await self.client.put_object(location, first, md5, sha256)
+            if etag != md5.hex():
+                raise ChecksumError(f"Uploaded object ETag {etag} does not match its MD5 {md5.hex()}")
+            return UploadResult(etag=etag, size=len(first), parts=1, sha256=sha256)
+
+        upload_id = await self.client.create_multipart_upload(location, {PART_SIZE_METADATA: str(self.part_size)})
+        slots = asyncio.Semaphore(self.concurrency)
+        results: dict[int, tuple[str, bytes]] = {}
+        tasks: set[asyncio.Task] = set()
+        # 已读取、尚未提交上传的分片；不再保留 first / second 的引用，分片上传完即可释放
+        prefetched = [first, second]
+        del first, second
+        whole = hashlib.sha256()
+        size = 0
+
+        async def upload_part(number: int, body: bytes) -> None:
+            try:
+                md5, sha256 = await asyncio.to_thread(_digests, body)
+                etag = await self.client.upload_part(location, upload_id, number, body, md5, sha256)
+                results[number] = (etag, md5)
+            finally:
+                slots.release()
+
+        try:
+            number = 0
+            while True:
+                # 先占用上传名额再读取下一个分片，内存中的分片数不超过 concurrency + 1
+                await slots.acquire()
+                part = prefetched.pop(0) if prefetched else await reader.read()
+                if part is None:
+                    break
+                for task in [task for task in tasks if task.done()]:
+                    tasks.discard(task)
+                    task.result()
+                number += 1
+                size += len(part)
+                await asyncio.to_thread(whole.update, part)
+                tasks.add(asyncio.create_task(upload_part(number, part)))
+            await asyncio.gather(*tasks)
+
+            parts = sorted(results.items())
+            etag = await self.client.complete_multipart_upload(
+                location, upload_id, [(number, part_etag) for number, (part_etag, _) in parts]
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await asyncio.shield(self.client.abort_multipart_upload(location, upload_id))
+            except Exception:
+                # 中止失败时由存储桶的生命周期规则清理未完成的上传
+                pass
+            raise
+
+        expected = multipart_etag([md5 for _, (_, md5) in parts])
+        if etag != expected:
+            raise ChecksumError(f"Uploaded object ETag {etag} does not match expected {expected}")
+        return UploadResult(etag=etag, size=size, parts=len(parts), sha256=whole.hexdigest())
+
+
+class S3Transfer:
+    """按配置创建的 S3 客户端与传输引擎；未配置凭证时不可用"""
+
+    def __init__(self):
+        self._engine: TransferEngine | None = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.s3_access_key_id and settings.s3_secret_access_key)
+
+    @property
+    def engine(self) -> TransferEngine:
+        if self._engine is None:
+            client = S3Client(
+                SigV4Signer(settings.s3_access_key_id, settings.s3_secret_access_key),
+                max_connections=settings.s3_max_connections,
+                timeout=settings.s3_timeout_seconds,
+            )
+            self._engine = TransferEngine(
+                client, part_size=settings.s3_part_size_bytes, concurrency=settings.s3_transfer_concurrency
+            )
+        return self._engine
+
+    async def aclose(self) -> None:
+        if self._engine is not None:
+            await self._engine.client.aclose()
+            self._engine = None
+
+
+s3_transfer = S3Transfer()
@@ -0,0 +1,97 @@
+"""
+数据请求 / 合约的状态计数
+
+每个数据请求 / 合约按 (连接器, 角色, 状态) 计入两次：消费者连接器的 consumer 计数和
+提供者连接器的 provider 计数。状态变更时在同一事务中以一个批量 UPSERT 调整计数，
+仪表盘直接读取计数表，不扫描 data_requests / contracts。启动时按全表重新计算。
+"""
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Contract, DataOffering, DataRequest, StatusCounter
+
+DATA_REQUEST = "data_request"
+CONTRACT = "contract"
+
+
+@dataclass(frozen=True)
+class Transition:
+    consumer_connector_id: str
+    provider_connector_id: str
+    # None 表示新建 / 删除
+    old_status: str | None
+    new_status: str | None
+
+
+async def apply_transitions(session: AsyncSession, entity: str, transitions: Iterable[Transition]) -> None:
+    """在当前事务中按状态迁移调整计数（不提交）"""
+    deltas: dict[tuple[str, str, str], int] = {}
+    for transition in transitions:
+        if transition.old_status == transition.new_status:
+            continue
+        for connector_id, role in (
+            (transition.consumer_connector_id, "consumer"),
+            (transition.provider_connector_id, "provider"),
+        ):
+            if transition.old_status is not None:
+                key = (connector_id, role, transition.old_status)
+                deltas[key] = deltas.get(key, 0) - 1
+            if transition.new_status is not None:
+                key = (connector_id, role, transition.new_status)
+                deltas[key] = deltas.get(key, 0) + 1
+
+    rows = [
+        {"entity": entity, "connector_id": connector_id, "role": role, "status": status, "count": delta}
+        for (connector_id, role, status), delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = insert(StatusCounter).values(rows)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                StatusCounter.entity,
+                StatusCounter.connector_id,
+                StatusCounter.role,
+                StatusCounter.status,
+            ],
+            set_={"count": StatusCounter.count + stmt.excluded.count},
+        )
+    )
+
+
+async def rebuild_status_counters(session: AsyncSession) -> None:
+    """按 data_requests / contracts 全表重新计算计数（启动时用于修正历史数据）"""
+    await session.execute(delete(StatusCounter))
+
+    columns = ["entity", "connector_id", "role", "status", "count"]
+    sources = [
+        (DATA_REQUEST, "consumer", DataRequest.consumer_connector_id, DataRequest.status, None),
+        (DATA_REQUEST, "provider", DataOffering.connector_id, DataRequest.status, DataOffering),
+        (CONTRACT, "consumer", Contract.consumer_connector_id, Contract.status, None),
+        (CONTRACT, "provider", Contract.provider_connector_id, Contract.status, None),
+    ]
+    for entity, role, connector_column, status_column, join in sources:
+        query = select(
+            literal(entity), connector_column, literal(role), status_column, func.count()
+        ).select_from(status_column.table)
+        if join is not None:
+            query = query.join(join, DataOffering.id == DataRequest.data_offering_id)
+        query = query.group_by(connector_column, status_column)
+        await session.execute(insert(StatusCounter).from_select(columns, query))
+    await session.commit()
+
+
+async def load_status_counts(session: AsyncSession, connector_ids) -> list[StatusCounter]:
+    """读取连接器（ID 列表或子查询）的非零计数"""
+    result = await session.execute(
+        select(StatusCounter)
+        .where(StatusCounter.connector_id.in_(connector_ids), StatusCounter.count != 0)
+        .order_by(StatusCounter.entity, StatusCounter.connector_id, StatusCounter.role, StatusCounter.status)
+    )
+    return result.scalars().all()
@@ -0,0 +1,193 @@
+"""
+策略模板 / 合约模板的不可变版本
+
+每次模板修订都会生成一个规范化 JSON 文档，以其 SHA-256 作为版本标识（content hash）
+写入版本表；内容相同的修订只存一份。合约创建时固定（pin）所用合约模板的版本，
+之后模板再怎么修改都不会影响已有合约。
+
+版本内容不可变，因此按 hash 缓存的编译结果永远不需要失效。
+"""
+import hashlib
+import json
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import (
+    Contract,
+    ContractTemplate,
+    ContractTemplatePolicy,
+    ContractTemplateVersion,
+    PolicyRule,
+    PolicyTemplate,
+    PolicyTemplateVersion,
+)
+
+_RULE_FIELDS = ("type", "name", "description", "value", "unit", "is_active")
+
+# content_hash -> 合约模板版本展开后的全部规则（不可变，永不失效）
+_rules_cache: dict[str, list[dict]] = {}
+
+
+def canonical_json(document: dict) -> str:
+    return json.dumps(document, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def content_hash(document: dict) -> str:
+    return hashlib.sha256(canonical_json(document).encode("utf-8")).hexdigest()
+
+
+def policy_document(template: PolicyTemplate, rules: list[PolicyRule]) -> dict:
+    rule_docs = [{field: getattr(rule, field) for field in _RULE_FIELDS} for rule in rules]
+    rule_docs.sort(key=canonical_json)
+    return {
+        "name": template.name,
+        "description": template.description,
+        "category": template.category,
+        "severity": template.severity,
+        "enforcement_type": template.enforcement_type,
+        "rules": rule_docs,
+    }
+
+
+def contract_document(template: ContractTemplate, policy_version_hashes: list[str]) -> dict:
+    return {
+        "name": template.name,
+        "description": template.description,
+        "contract_type": template.contract_type,
+        "policy_version_hashes": sorted(policy_version_hashes),
+    }
+
+
+async def _store(session: AsyncSession, model, document: dict) -> str:
+    digest = content_hash(document)
+    await session.execute(
+        insert(model)
+        .values(content_hash=digest, document=document)
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+    return digest
+
+
+async def snapshot_policy_template(session: AsyncSession, policy_template_id: str) -> str:
+    """为策略模板当前内容生成版本（内容未变时复用已有版本），并更新 version_hash"""
+    template = (await session.execute(
+        select(PolicyTemplate).where(PolicyTemplate.id == policy_template_id)
+    )).scalar_one()
+    rules = (await session.execute(
+        select(PolicyRule)
+        .where(PolicyRule.policy_template_id == policy_template_id)
+        .execution_options(populate_existing=True)
+    )).scalars().all()
+
+    digest = await _store(session, PolicyTemplateVersion, policy_document(template, rules))
+    template.version_hash = digest
+    return digest
+
+
+async def snapshot_contract_template(session: AsyncSession, contract_template_id: str) -> str:
+    """为合约模板当前内容（含所引用策略模板的版本）生成版本，并更新 version_hash"""
+    template = (await session.execute(
+        select(ContractTemplate).where(ContractTemplate.id == contract_template_id)
+    )).scalar_one()
+    result = await session.execute(
+        select(PolicyTemplate.id, PolicyTemplate.version_hash)
+        .join(ContractTemplatePolicy, ContractTemplatePolicy.policy_template_id == PolicyTemplate.id)
+        .where(ContractTemplatePolicy.contract_template_id == contract_template_id)
+    )
+    policy_hashes = []
+    for policy_template_id, version_hash in result.all():
+        if version_hash is None:
+            version_hash = await snapshot_policy_template(session, policy_template_id)
+        policy_hashes.append(version_hash)
+
+    digest = await _store(session, ContractTemplateVersion, contract_document(template, policy_hashes))
+    template.version_hash = digest
+    return digest
+
+
+async def snapshot_dependent_contract_templates(
+    session: AsyncSession, policy_template_id: str
+) -> list[str]:
+    """策略模板修订后，为引用它的合约模板生成新版本（已有合约仍固定在旧版本），返回这些合约模板 ID"""
+    result = await session.execute(
+        select(ContractTemplatePolicy.contract_template_id).where(
+            ContractTemplatePolicy.policy_template_id == policy_template_id
+        )
+    )
+    contract_template_ids = result.scalars().all()
+    for contract_template_id in contract_template_ids:
+        await snapshot_contract_template(session, contract_template_id)
+    return contract_template_ids
+
+
+async def load_contract_terms(session: AsyncSession, version_hash: str) -> dict | None:
+    """合约模板版本文档，展开其引用的策略模板版本"""
+    version = (await session.execute(
+        select(ContractTemplateVersion).where(ContractTemplateVersion.content_hash == version_hash)
+    )).scalar_one_or_none()
+    if not version:
+        return None
+    policy_hashes = version.document["policy_version_hashes"]
+    result = await session.execute(
+        select(PolicyTemplateVersion).where(PolicyTemplateVersion.content_hash.in_(policy_hashes))
+    )
+    policies = {policy.content_hash: policy.document for policy in result.scalars().all()}
+    return {
+        **version.document,
+        "policies": [
+            {"content_hash": policy_hash, **policies[policy_hash]}
+            for policy_hash in policy_hashes
+            if policy_hash in policies
+        ],
+    }
+
+
+async def load_version_rules(session: AsyncSession, version_hashes: set[str]) -> dict[str, list[dict]]:
+    """按合约模板版本读取展开后的全部规则，结果按 hash 永久缓存"""
+    missing = {h for h in version_hashes if h and h not in _rules_cache}
+    if missing:
+        versions = (await session.execute(
+            select(ContractTemplateVersion).where(ContractTemplateVersion.content_hash.in_(missing))
+        )).scalars().all()
+        policy_hashes = {h for v in versions for h in v.document["policy_version_hashes"]}
+        policies = {}
+        if policy_hashes:
+            result = await session.execute(
+                select(PolicyTemplateVersion).where(PolicyTemplateVersion.content_hash.in_(policy_hashes))
+            )
+            policies = {p.content_hash: p.document for p in result.scalars().all()}
+        for version in versions:
+            _rules_cache[version.content_hash] = [
+                rule
+                for policy_hash in version.document["policy_version_hashes"]
+                for rule in policies.get(policy_hash, {}).get("rules", [])
+            ]
+    return {h: _rules_cache[h] for h in version_hashes if h in _rules_cache}
+
+
+async def backfill_versions(session: AsyncSession) -> None:
+    """为尚无版本的历史模板生成版本，并把未固定版本的历史合约固定到当前版本"""
+    policy_ids = (await session.execute(
+        select(PolicyTemplate.id).where(PolicyTemplate.version_hash.is_(None))
+    )).scalars().all()
+    for policy_template_id in policy_ids:
+        await snapshot_policy_template(session, policy_template_id)
+
+    contract_template_ids = (await session.execute(
+        select(ContractTemplate.id).where(ContractTemplate.version_hash.is_(None))
+    )).scalars().all()
+    for contract_template_id in contract_template_ids:
+        await snapshot_contract_template(session, contract_template_id)
+
+    await session.execute(
+        update(Contract)
+        .where(Contract.contract_template_version_hash.is_(None))
+        .values(
+            contract_template_version_hash=select(ContractTemplate.version_hash)
+            .where(ContractTemplate.id == Contract.contract_template_id)
+            .scalar_subquery()
+        )
+    )
+    await session.commit()
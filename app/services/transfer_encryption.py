@@ -0,0 +1,188 @@
+"""
+传输加密（合约带 encryption 策略规则时）
+
+合约固定的模板版本中有生效的 encryption 规则时，连接器在数据平面下载流上再做一层
+端到端加密（与 TLS 无关，经过代理、缓存时内容同样不可读、不可篡改）。
+
+密钥：每个合约一把 AES-256 密钥，由主密钥经 HKDF-SHA256 按合约 ID 派生，消费者通过
+GET /api/v1/data-plane/contracts/{contract_id}/transfer-key 获取；每个下载流再用随机
+salt 派生一次性的流密钥。
+
+格式（tds-aes256gcm-v1），参考客户端见 decrypt_client.py：
+
+    头部 32 字节：b"TDSE" | 版本 1（1 字节）| 分块大小（4 字节，大端）| salt（16 字节）| nonce 前缀（7 字节）
+    之后每帧：密文长度（4 字节，大端）| AES-256-GCM 密文（明文 + 16 字节 tag）
+
+- 流密钥 = HKDF-SHA256(合约密钥, salt, info=b"tds-stream:v1")；
+- 第 i 帧的 nonce = nonce 前缀 | i（4 字节，大端）| 是否最后一帧（1 字节），头部作为关联数据，
+  帧被重排、截断、拼接到其他流中都无法通过校验；
+- 明文按分块大小切分，最后一帧可以更短（明文为空时仍输出一个空的最后一帧）。
+
+加密在线程池中并行执行（AES-GCM 计算时释放 GIL），同时在途的分块数有上限，按顺序输出。
+"""
+import asyncio
+import base64
+import collections
+import os
+import struct
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import Contract
+from .template_versions import load_version_rules
+
+ALGORITHM = "tds-aes256gcm-v1"
+MAGIC = b"TDSE"
+VERSION = 1
+HEADER = struct.Struct(">4sBI16s7s")
+FRAME_LENGTH = struct.Struct(">I")
+TAG_SIZE = 16
+ENCRYPTED_CONTENT_TYPE = "application/vnd.tds.encrypted-stream"
+# 描述明文表示的头部，对密文流不再成立
+_PLAINTEXT_ONLY_HEADERS = frozenset({"etag", "content-md5", "digest", "accept-ranges", "last-modified"})
+
+
+def _hkdf(key: bytes, salt: bytes | None, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info).derive(key)
+
+
+def contract_key(contract_id: str) -> bytes:
+    """合约的传输密钥；未配置主密钥时由 secret_key 派生（info 不同，与 JWT 签名互不影响）"""
+    master = settings.transfer_encryption_master_key
+    master_key = base64.b64decode(master) if master else settings.secret_key.encode("utf-8")
+    return _hkdf(master_key, None, b"tds-transfer-key:v1:" + contract_id.encode("utf-8"))
+
+
+def encrypted_length(plaintext_length: int, chunk_size: int) -> int:
+    """密文流的总长度，用于 Content-Length"""
+    frames = max(1, -(-plaintext_length // chunk_size))
+    return HEADER.size + frames * (FRAME_LENGTH.size + TAG_SIZE) + plaintext_length
+
+
+def encrypted_headers(headers: list[tuple[str, str]], chunk_size: int) -> list[tuple[str, str]]:
+    """加密后的响应头：原 Content-Type / Content-Encoding 移到 X-Payload-*，Content-Length 换算为密文长度"""
+    result = [("content-type", ENCRYPTED_CONTENT_TYPE), ("x-transfer-encryption", ALGORITHM)]
+    for key, value in headers:
+        name = key.lower()
+        if name == "content-length":
+            result.append((key, str(encrypted_length(int(value), chunk_size))))
+        elif name in ("content-type", "content-encoding"):
+            result.append(("x-payload-" + name, value))
+        elif name not in _PLAINTEXT_ONLY_HEADERS:
+            result.append((key, value))
+    return result
+
+
+async def requires_encryption(session: AsyncSession, contract: Contract) -> bool:
+    """合约固定的模板版本中是否有生效的 encryption 规则"""
+    version_hash = contract.contract_template_version_hash
+    if not version_hash:
+        return False
+    rules = (await load_version_rules(session, {version_hash})).get(version_hash, [])
+    return any(rule["type"] == "encryption" and rule["is_active"] for rule in rules)
+
+
+class StreamEncryptor:
+    def __init__(self, executor: ThreadPoolExecutor, chunk_size: int, window: int):
+        self.executor = executor
+        self.chunk_size = chunk_size
+        # 同时在途（已提交加密、尚未输出）的分块数上限
+        self.window = window
+
+    async def encrypt(self, key: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """把任意大小的明文块加密为 tds-aes256gcm-v1 密文流"""
+        salt, nonce_prefix = os.urandom(16), os.urandom(7)
+        header = HEADER.pack(MAGIC, VERSION, self.chunk_size, salt, nonce_prefix)
+        aead = AESGCM(_hkdf(key, salt, b"tds-stream:v1"))
+        loop = asyncio.get_running_loop()
+
+        def seal(index: int, last: bool, plaintext) -> bytes:
+            nonce = nonce_prefix + struct.pack(">IB", index, last)
+            return aead.encrypt(nonce, plaintext, header)
+
+        def submit(index: int, last: bool, plaintext) -> None:
+            in_flight.append(loop.run_in_executor(self.executor, seal, index, last, plaintext))
+
+        yield header
+        in_flight: collections.deque[asyncio.Future] = collections.deque()
+        # 尚未加密的明文片段（输入块的只读切片，不复制）
+        pending: collections.deque[memoryview] = collections.deque()
+        pending_size = 0
+        index = 0
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                pending.append(memoryview(chunk).toreadonly())
+                pending_size += len(chunk)
+                # 保留至少一个字节，直到输入结束才能确定哪一帧是最后一帧
+                while pending_size > self.chunk_size:
+                    submit(index, False, _take(pending, self.chunk_size))
+                    pending_size -= self.chunk_size
+                    index += 1
+                    while len(in_flight) >= self.window:
+                        # 长度前缀单独输出，避免为拼接复制密文
+                        ciphertext = await in_flight.popleft()
+                        yield FRAME_LENGTH.pack(len(ciphertext))
+                        yield ciphertext
+            submit(index, True, _take(pending, pending_size))
+            while in_flight:
+                ciphertext = await in_flight.popleft()
+                yield FRAME_LENGTH.pack(len(ciphertext))
+                yield ciphertext
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+def _take(pending: collections.deque[memoryview], size: int):
+    """从片段队列头部取出 size 字节；落在同一片段内时返回切片，否则拼接"""
+    if size == 0:
+        return b""
+    head = pending[0]
+    if len(head) >= size:
+        if len(head) == size:
+            pending.popleft()
+        else:
+            pending[0] = head[size:]
+        return head[:size]
+    pieces = []
+    while size > 0:
+        head = pending.popleft()
+        if len(head) > size:
+            pending.appendleft(head[size:])
+            head = head[:size]
+        pieces.append(head)
+        size -= len(head)
+    return b"".join(pieces)
+
+
+class TransferEncryption:
+    """按配置创建的加密线程池"""
+
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def workers(self) -> int:
+        return settings.transfer_encryption_workers or os.cpu_count() or 1
+
+    @property
+    def encryptor(self) -> StreamEncryptor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="transfer-encryption")
+        return StreamEncryptor(self._executor, settings.transfer_encryption_chunk_size, window=self.workers * 2)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+transfer_encryption = TransferEncryption()
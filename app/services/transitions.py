@@ -0,0 +1,31 @@
+"""
+状态迁移的条件更新（compare-and-set）
+
+接口先读取数据请求 / 合约并在 Python 中检查状态，再写入新状态；两个并发请求可能
+同时通过检查。写入改为 UPDATE ... WHERE id = ? AND status = <读取到的状态>，
+只有一个请求能更新成功，其余请求得到 409，无需锁表或加悲观锁。
+"""
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def compare_and_set_status(
+    session: AsyncSession, model, row_id: str, expected: str, new: str, now: datetime, **values
+) -> None:
+    """在当前事务中把 status 从 expected 改为 new（不提交）；状态已被并发修改时返回 409
+
+    values 为随状态一起写入的其他列。会话中已加载的对象同步更新为新状态。
+    """
+    result = await session.execute(
+        update(model)
+        .where(model.id == row_id, model.status == expected)
+        .values(status=new, updated_at=now, **values)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{model.__name__} status was changed by a concurrent request, please reload and retry",
+        )
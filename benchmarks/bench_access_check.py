@@ -0,0 +1,159 @@
+"""
+基准测试：有效合约访问检查（检查次数/秒）
+
+使用临时 SQLite 数据库写入 N 个 active 合约（分布在多个数据资源上），启动应用加载
+内存索引后分别统计：
+- 直接查询内存索引；
+- GET /api/v1/contracts/access-check（进程内 ASGI 调用），并以 GET / 作为框架本身的开销参照；
+- POST /api/v1/contracts/access-check（每次 1000 个检查）。
+同时统计检查期间执行的 SQL 语句数，确认检查路径不访问数据库。
+
+运行: python -m benchmarks.bench_access_check [合约数] [数据资源数]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert, select  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, User  # noqa: E402
+from app.services.access_index import active_contract_index  # noqa: E402
+
+CHUNK = 50000
+INDEX_CHECKS = 1000000
+HTTP_REQUESTS = 5000
+BATCH = 1000
+BATCH_REQUESTS = 100
+
+
+async def populate(contracts: int, offerings: int) -> tuple[str, list[str], User]:
+    """返回 (消费者连接器 ID, 数据资源 ID 列表, 提供者用户)"""
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+
+        offering_ids = [str(uuid.uuid4()) for _ in range(offerings)]
+        await session.execute(insert(DataOffering), [
+            {
+                "id": offering_id,
+                "title": f"offering {i}",
+                "description": "bench",
+                "data_type": "file",
+                "access_policy": "Restricted",
+                "storage_meta": {},
+                "connector_id": provider.id,
+            }
+            for i, offering_id in enumerate(offering_ids)
+        ])
+        for start in range(0, contracts, CHUNK):
+            await session.execute(insert(Contract), [
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": f"bench {i}",
+                    "status": "active",
+                    "provider_connector_id": provider.id,
+                    "consumer_connector_id": consumer.id,
+                    "contract_template_id": template.id,
+                    "data_offering_id": offering_ids[i % offerings],
+                }
+                for i in range(start, min(start + CHUNK, contracts))
+            ])
+        await session.commit()
+        return consumer.id, offering_ids, alice
+
+
+async def main(contracts: int, offerings: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+    consumer_id, offering_ids, provider = await populate(contracts, offerings)
+    # 一半检查命中已有合约，一半是不存在的数据资源
+    candidates = offering_ids + [str(uuid.uuid4()) for _ in range(len(offering_ids))]
+
+    statements = 0
+
+    def count_statement(*args):
+        nonlocal statements
+        statements += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        print(f"contracts: {contracts}, offerings: {offerings}, indexed: {len(active_contract_index)}")
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            login = await client.post("/api/v1/auth/login", json={"did": provider.did, "signature": "x"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+
+            pairs = [(consumer_id, random.choice(candidates)) for _ in range(INDEX_CHECKS)]
+            now = time.time()
+            started = time.perf_counter()
+            allowed = sum(
+                1 for consumer, offering in pairs
+                if active_contract_index.check(consumer, offering, provider.id, now)
+            )
+            elapsed = time.perf_counter() - started
+            print(f"index:      {INDEX_CHECKS / elapsed:>12,.0f} checks/s (allowed {allowed / INDEX_CHECKS:.0%})")
+
+            started = time.perf_counter()
+            for _ in range(HTTP_REQUESTS):
+                response = await client.get("/", headers=headers)
+            elapsed = time.perf_counter() - started
+            print(f"GET /:      {HTTP_REQUESTS / elapsed:>12,.0f} requests/s (framework baseline)")
+
+            params = [
+                {"consumer_connector_id": consumer_id, "data_offering_id": random.choice(candidates)}
+                for _ in range(HTTP_REQUESTS)
+            ]
+            started = time.perf_counter()
+            for query in params:
+                response = await client.get("/api/v1/contracts/access-check", params=query, headers=headers)
+                response.raise_for_status()
+            elapsed = time.perf_counter() - started
+            print(f"GET:        {HTTP_REQUESTS / elapsed:>12,.0f} checks/s")
+
+            bodies = [
+                {"checks": [
+                    {"consumer_connector_id": consumer_id, "data_offering_id": random.choice(candidates)}
+                    for _ in range(BATCH)
+                ]}
+                for _ in range(BATCH_REQUESTS)
+            ]
+            started = time.perf_counter()
+            for body in bodies:
+                response = await client.post("/api/v1/contracts/access-check", json=body, headers=headers)
+                response.raise_for_status()
+            elapsed = time.perf_counter() - started
+            print(f"POST batch: {BATCH * BATCH_REQUESTS / elapsed:>12,.0f} checks/s ({BATCH} per request)")
+
+            event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+            print(f"SQL statements during checks: {statements}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+    ))
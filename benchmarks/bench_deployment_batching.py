@@ -0,0 +1,101 @@
+"""
+基准测试：合约上链吞吐量（合约/秒）随批大小的变化
+
+使用临时 SQLite 数据库写入 N 个 active 合约及其上链任务，用模拟链
+（每个区块固定耗时 + 每笔交易耗时）按不同批大小清空队列，统计吞吐量。
+
+运行: python -m benchmarks.bench_deployment_batching [合约数] [批大小 ...]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+from sqlalchemy import delete, insert, select, update  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, DeploymentJob, User  # noqa: E402
+from app.services.chain import SimulatedChain  # noqa: E402
+from app.services.deployments import DeploymentWorker  # noqa: E402
+
+BLOCK_TIME = 0.05
+TX_TIME = 0.0005
+
+
+async def populate(contracts: int) -> None:
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+        offering = (await session.execute(
+            select(DataOffering).where(DataOffering.connector_id == provider.id)
+        )).scalars().first()
+
+        contract_ids = [str(uuid.uuid4()) for _ in range(contracts)]
+        await session.execute(insert(Contract), [
+            {
+                "id": contract_id,
+                "name": f"bench {i}",
+                "status": "active",
+                "provider_connector_id": provider.id,
+                "consumer_connector_id": consumer.id,
+                "contract_template_id": template.id,
+                "data_offering_id": offering.id,
+            }
+            for i, contract_id in enumerate(contract_ids)
+        ])
+        await session.execute(insert(DeploymentJob), [
+            {"id": str(uuid.uuid4()), "contract_id": contract_id, "status": "queued"}
+            for contract_id in contract_ids
+        ])
+        await session.commit()
+
+
+async def reset() -> None:
+    """清除上一轮的部署结果，任务重新排队"""
+    async with SessionLocal() as session:
+        await session.execute(update(Contract).values(contract_address=None, blockchain_tx_id=None))
+        await session.execute(update(DeploymentJob).values(status="queued", attempts=0))
+        await session.commit()
+
+
+async def main(contracts: int, batch_sizes: list[int]) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+    async with SessionLocal() as session:
+        await session.execute(delete(DeploymentJob))
+        await session.commit()
+    await populate(contracts)
+
+    print(f"contracts: {contracts}, block time: {BLOCK_TIME * 1000:.0f} ms, tx time: {TX_TIME * 1000:.1f} ms")
+    print(f"{'batch':>6} {'blocks':>7} {'seconds':>8} {'contracts/s':>12}")
+    for batch_size in batch_sizes:
+        await reset()
+        chain = SimulatedChain(block_time=BLOCK_TIME, tx_time=TX_TIME)
+        worker = DeploymentWorker(chain, batch_size=batch_size, poll_interval=1.0, max_attempts=3)
+        started = time.perf_counter()
+        processed = await worker.drain()
+        elapsed = time.perf_counter() - started
+        print(f"{batch_size:>6} {chain.height:>7} {elapsed:>8.2f} {processed / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(args[0] if args else 1000, args[1:] or [1, 10, 50, 200, 1000]))
@@ -0,0 +1,116 @@
+"""
+基准测试：合约过期扫描
+
+使用临时 SQLite 数据库写入 N 个 active 合约（其中一部分已到期），分批过期，统计
+总耗时及单批耗时（即单个写事务持有写锁的时间），并打印到期查询的执行计划以确认
+走 (status, expires_at) 索引。
+
+运行: python -m benchmarks.bench_expiry_sweep [合约数] [到期比例]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, User  # noqa: E402
+from app.services.expiry import ExpirySweeper  # noqa: E402
+
+CHUNK = 50000
+
+
+async def populate(contracts: int, expired_ratio: float, now: datetime) -> None:
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+        offering = (await session.execute(
+            select(DataOffering).where(DataOffering.connector_id == provider.id)
+        )).scalars().first()
+
+        expired = int(contracts * expired_ratio)
+        for start in range(0, contracts, CHUNK):
+            await session.execute(insert(Contract), [
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": f"bench {i}",
+                    "status": "active",
+                    "provider_connector_id": provider.id,
+                    "consumer_connector_id": consumer.id,
+                    "contract_template_id": template.id,
+                    "data_offering_id": offering.id,
+                    # 前 expired 个已到期，其余在未来到期
+                    "expires_at": now + timedelta(seconds=(i - expired + 1) * (1 if i >= expired else 10)),
+                }
+                for i in range(start, min(start + CHUNK, contracts))
+            ])
+        await session.commit()
+
+
+async def main(contracts: int, expired_ratio: float) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    started = time.perf_counter()
+    await populate(contracts, expired_ratio, now)
+    print(f"contracts: {contracts}, populated in {time.perf_counter() - started:.1f}s")
+
+    async with SessionLocal() as session:
+        plan = await session.execute(
+            text("EXPLAIN QUERY PLAN SELECT id FROM contracts "
+                 "WHERE status = 'active' AND expires_at <= :now ORDER BY expires_at LIMIT 500"),
+            {"now": now},
+        )
+        print("plan:", "; ".join(row[-1] for row in plan.all()))
+
+    sweeper = ExpirySweeper(interval=60.0, batch_size=500)
+    batch_ms = []
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        expired = await sweeper.expire_batch(now)
+        batch_ms.append((time.perf_counter() - batch_started) * 1000)
+        if expired < sweeper.batch_size:
+            break
+    elapsed = time.perf_counter() - started
+
+    async with SessionLocal() as session:
+        remaining = (await session.execute(
+            select(func.count()).select_from(Contract).where(
+                Contract.status == "active", Contract.expires_at <= now
+            )
+        )).scalar_one()
+
+    print(f"expired: {sweeper.expired} in {elapsed:.2f}s ({sweeper.expired / elapsed:.0f}/s), "
+          f"batches: {len(batch_ms)}")
+    print(f"batch ms: median {statistics.median(batch_ms):.1f}, max {max(batch_ms):.1f}")
+    print(f"due contracts still active: {remaining}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.1,
+    ))
@@ -0,0 +1,85 @@
+"""
+ip_restriction CIDR 索引基准测试：基数树查询 vs 线性逐条匹配
+
+运行: python -m benchmarks.bench_ip_index [网段数量]
+"""
+import ipaddress
+import random
+import sys
+import time
+
+from app.services.ip_index import IpRestrictionIndex
+
+
+class _Rule:
+    type = "ip_restriction"
+    is_active = True
+
+    def __init__(self, value: str):
+        self.value = value
+
+
+def build_networks(count: int) -> list[tuple[str, ipaddress.IPv4Network | ipaddress.IPv6Network]]:
+    networks = []
+    for i in range(count):
+        if i % 4 == 0:
+            network = ipaddress.ip_network(
+                (random.getrandbits(128), random.randint(16, 64)), strict=False
+            )
+        else:
+            network = ipaddress.ip_network(
+                (random.getrandbits(32), random.randint(8, 30)), strict=False
+            )
+        # 每 10 个网段归属一个策略模板
+        networks.append((f"template-{i // 10}", network))
+    return networks
+
+
+def main(count: int = 20000, lookups: int = 20000) -> None:
+    random.seed(42)
+    networks = build_networks(count)
+
+    index = IpRestrictionIndex()
+    by_template: dict[str, list[str]] = {}
+    for template_id, network in networks:
+        by_template.setdefault(template_id, []).append(str(network))
+    start = time.perf_counter()
+    for template_id, values in by_template.items():
+        index.update_template("connector", template_id, [_Rule(",".join(values))])
+    build_seconds = time.perf_counter() - start
+
+    addresses = [
+        str(ipaddress.ip_address(random.getrandbits(32) if i % 4 else random.getrandbits(128)))
+        for i in range(lookups)
+    ]
+
+    start = time.perf_counter()
+    trie_results = [index.match("connector", address) for address in addresses]
+    trie_seconds = time.perf_counter() - start
+
+    # 线性匹配只测一部分，否则耗时过长
+    sample = addresses[: max(1, lookups // 20)]
+    start = time.perf_counter()
+    linear_results = []
+    for address in sample:
+        ip = ipaddress.ip_address(address)
+        linear_results.append({
+            template_id
+            for template_id, network in networks
+            if network.version == ip.version and ip in network
+        })
+    linear_seconds = time.perf_counter() - start
+
+    assert linear_results == trie_results[: len(sample)], "trie and linear results differ"
+
+    trie_per_lookup = trie_seconds / lookups * 1e6
+    linear_per_lookup = linear_seconds / len(sample) * 1e6
+    print(f"networks: {count}, templates: {len(by_template)}")
+    print(f"build: {build_seconds * 1000:.1f} ms")
+    print(f"trie:   {trie_per_lookup:10.2f} us/lookup ({lookups / trie_seconds:,.0f} lookups/s)")
+    print(f"linear: {linear_per_lookup:10.2f} us/lookup ({len(sample) / linear_seconds:,.0f} lookups/s)")
+    print(f"speedup: {linear_per_lookup / trie_per_lookup:.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,105 @@
+"""
+基准测试：GET /api/v1/data-requests?role=provider 随提供者数据资源数量的延迟
+
+使用临时 SQLite 数据库，为提供者批量写入 N 个数据资源，其中固定 100 个
+资源各有一条数据请求，在进程内通过 ASGI 调用列表接口并统计延迟。授权过滤以
+联表 / 子查询完成，不再把提供者的全部数据资源 ID 物化为 IN 参数回传数据库，
+返回行数不变时延迟不再随 N 线性增长。
+
+运行: python -m benchmarks.bench_list_data_requests [资源数 ...]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import delete, insert, select  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, DataOffering, DataRequest, User  # noqa: E402
+
+ROUNDS = 5
+REQUESTS = 100
+
+
+async def populate(provider_id: str, consumer_id: str, offerings: int) -> None:
+    """替换提供者的数据资源为 N 个，其中前 REQUESTS 个各有一条请求"""
+    async with SessionLocal() as session:
+        await session.execute(delete(DataRequest))
+        await session.execute(delete(DataOffering).where(DataOffering.connector_id == provider_id))
+        offering_ids = [str(uuid.uuid4()) for _ in range(offerings)]
+        await session.execute(insert(DataOffering), [
+            {
+                "id": offering_id,
+                "title": f"offering {i}",
+                "description": "bench",
+                "data_type": "file",
+                "access_policy": "Restricted",
+                "storage_meta": {},
+                "connector_id": provider_id,
+            }
+            for i, offering_id in enumerate(offering_ids)
+        ])
+        await session.execute(insert(DataRequest), [
+            {
+                "id": str(uuid.uuid4()),
+                "purpose": "bench",
+                "access_mode": "download",
+                "status": "pending",
+                "data_offering_id": offering_id,
+                "consumer_connector_id": consumer_id,
+            }
+            for offering_id in offering_ids[:REQUESTS]
+        ])
+        await session.commit()
+
+
+async def main(sizes: list[int]) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            login = await client.post("/api/v1/auth/login", json={"did": alice.did, "signature": "x"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            print(f"{'offerings':>10} {'rows':>8} {'median ms':>10} {'max ms':>10}")
+            for size in sizes:
+                await populate(provider.id, consumer.id, size)
+                timings = []
+                for _ in range(ROUNDS):
+                    started = time.perf_counter()
+                    response = await client.get(
+                        "/api/v1/data-requests", params={"role": "provider"}, headers=headers
+                    )
+                    timings.append((time.perf_counter() - started) * 1000)
+                    response.raise_for_status()
+                rows = len(response.json())
+                print(f"{size:>10} {rows:>8} {statistics.median(timings):>10.1f} {max(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]))
@@ -0,0 +1,274 @@
+"""
+基准测试：restful 数据资源代理（吞吐量、连接复用、流式转发、超时、用量计量）
+
+使用临时 SQLite 数据库和本地替身上游（独立进程中由 uvicorn 运行的最小 ASGI 应用），
+连接器本身也用 uvicorn 监听本地端口，客户端经真实 TCP 调用：
+
+- 下载：并发下载若干个响应体，统计吞吐量（以客户端直接访问上游作为参照）和上游实际建立的 TCP 连接数（复用长连接时
+  远小于请求数）；
+- 上传：流式上传一个大请求体，上游返回收到内容的 SHA-256 并与发送的内容比对；
+- 超时：上游迟迟不返回响应头时得到 504；
+- 计量：刷盘后合约记录的字节数与实际转发的请求 + 响应字节数一致。
+同时记录进程常驻内存的峰值，确认大响应体不会被整体缓冲。
+
+运行: python -m benchmarks.bench_proxy [下载请求数] [并发数] [每个响应的字节数]
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+os.environ.setdefault("PROXY_READ_TIMEOUT_SECONDS", "1")
+os.environ.setdefault("PROXY_MAX_CONNECTIONS_PER_UPSTREAM", "16")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from sqlalchemy import insert, select, update  # noqa: E402
+
+import init_db  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, User  # noqa: E402
+from app.services.metering import usage_meter  # noqa: E402
+
+CHUNK = 64 * 1024
+UPLOAD_BYTES = 64 * 1024 * 1024
+
+
+class Upstream:
+    """替身上游：/blob/{n} 返回 n 字节，/upload 返回请求体的 SHA-256，/slow 延迟返回响应头"""
+
+    def __init__(self):
+        self.connections: set[tuple] = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.connections.add(tuple(scope["client"]))
+        path = scope["path"]
+        if path.startswith("/api/blob/"):
+            size = int(path.rsplit("/", 1)[1])
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/octet-stream"), (b"content-length", str(size).encode())],
+            })
+            block = b"x" * CHUNK
+            while size > 0:
+                await send({"type": "http.response.body", "body": block[:size], "more_body": True})
+                size -= CHUNK
+            await send({"type": "http.response.body", "body": b""})
+        elif path == "/api/upload":
+            digest = hashlib.sha256()
+            while True:
+                message = await receive()
+                digest.update(message.get("body", b""))
+                if not message.get("more_body", False):
+                    break
+            body = digest.hexdigest().encode()
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+        elif path == "/api/stats":
+            body = str(len(self.connections)).encode()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": body})
+        elif path == "/api/slow":
+            await asyncio.sleep(settings.proxy_read_timeout_seconds * 3)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"late"})
+        else:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_upstream(port: int) -> None:
+    uvicorn.run(Upstream(), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_upstream(port: int) -> multiprocessing.Process:
+    """替身上游在独立进程中运行，不与连接器争用事件循环"""
+    process = multiprocessing.Process(target=run_upstream, args=(port,), daemon=True)
+    process.start()
+    while True:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port)):
+            return process
+        time.sleep(0.05)
+
+
+async def serve(asgi_app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def populate(upstream_port: int) -> tuple[str, User]:
+    """返回 (active 合约 ID, 消费者用户)"""
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+
+        offering_id = str(uuid.uuid4())
+        await session.execute(insert(DataOffering).values(
+            id=offering_id,
+            title="bench api",
+            description="bench",
+            data_type="restful",
+            access_policy="Restricted",
+            storage_meta={"api_endpoint": f"http://127.0.0.1:{upstream_port}/api"},
+            connector_id=provider.id,
+        ))
+        contract_id = str(uuid.uuid4())
+        await session.execute(insert(Contract).values(
+            id=contract_id,
+            name="bench",
+            status="active",
+            provider_connector_id=provider.id,
+            consumer_connector_id=consumer.id,
+            contract_template_id=template.id,
+            data_offering_id=offering_id,
+        ))
+        await session.commit()
+        return contract_id, bob
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main(requests: int, concurrency: int, size: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    upstream_port, connector_port = free_port(), free_port()
+    upstream = start_upstream(upstream_port)
+    contract_id, consumer = await populate(upstream_port)
+    connector_server, connector_task = await serve(app, connector_port)
+    # 启动时会为合约补齐固定的模板版本；清空后合约不受种子模板中用量上限的约束
+    async with SessionLocal() as session:
+        await session.execute(
+            update(Contract).where(Contract.id == contract_id).values(contract_template_version_hash=None)
+        )
+        await session.commit()
+
+    # 客户端到连接器同样限制连接数，避免客户端一侧成为瓶颈
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{connector_port}", limits=limits, timeout=60
+    ) as client:
+        login = await client.post("/api/v1/auth/login", json={"did": consumer.did, "signature": "x"})
+        headers = {"Authorization": f"Bearer {login.json()['token']}"}
+        proxy = f"/api/v1/data-plane/contracts/{contract_id}/proxy"
+        print(f"requests: {requests}, concurrency: {concurrency}, response size: {size:,} bytes, "
+              f"upstream connection limit: {settings.proxy_max_connections_per_upstream}")
+        print(f"peak RSS before: {peak_rss_mb():.0f} MB")
+
+        semaphore = asyncio.Semaphore(concurrency)
+        received = 0
+
+        async def download(url: str, request_headers: dict) -> None:
+            nonlocal received
+            async with semaphore:
+                async with client.stream("GET", url, headers=request_headers) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_raw():
+                        received += len(chunk)
+
+        # 参照：客户端直接访问上游
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            download(f"http://127.0.0.1:{upstream_port}/api/blob/{size}", {}) for _ in range(requests)
+        ))
+        elapsed = time.perf_counter() - started
+        print(f"direct:     {requests / elapsed:>8,.0f} req/s, {received / elapsed / 2 ** 20:>8,.1f} MB/s (baseline)")
+
+        stats_url = f"http://127.0.0.1:{upstream_port}/api/stats"
+        connections_before = int((await client.get(stats_url)).text)
+        received = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(download(f"{proxy}/blob/{size}", headers) for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        assert received == requests * size, received
+        print(f"proxied:    {requests / elapsed:>8,.0f} req/s, {received / elapsed / 2 ** 20:>8,.1f} MB/s")
+        connections = int((await client.get(stats_url)).text) - connections_before
+        print(f"  upstream TCP connections opened by the connector: {connections} for {requests} requests")
+
+        block = os.urandom(CHUNK)
+
+        async def upload_body():
+            for _ in range(UPLOAD_BYTES // CHUNK):
+                yield block
+
+        expected = hashlib.sha256()
+        async for block in upload_body():
+            expected.update(block)
+        started = time.perf_counter()
+        response = await client.post(
+            f"{proxy}/upload", headers={**headers, "Content-Length": str(UPLOAD_BYTES)}, content=upload_body()
+        )
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        upload_response_bytes = len(response.content)
+        print(f"upload:     {UPLOAD_BYTES / elapsed / 2 ** 20:>8,.1f} MB/s, "
+              f"checksum {'ok' if response.text == expected.hexdigest() else 'MISMATCH'}")
+        print(f"peak RSS after transfers: {peak_rss_mb():.0f} MB")
+
+        started = time.perf_counter()
+        response = await client.get(f"{proxy}/slow", headers=headers)
+        print(f"slow upstream: {response.status_code} after {time.perf_counter() - started:.1f}s "
+              f"(read timeout {settings.proxy_read_timeout_seconds}s)")
+        response = await client.get(f"{proxy}/%2E%2E/secret", headers=headers)
+        double_encoded = await client.get(f"{proxy}/a/%252e%252E/secret", headers=headers)
+        print(f"path traversal: {response.status_code}, double-encoded: {double_encoded.status_code}")
+
+        await usage_meter.flush()
+        async with SessionLocal() as session:
+            usage = await usage_meter.get_usage(session, contract_id)
+        # 下载的响应体 + 上传的请求体与其响应体；超时的请求没有响应，不计量
+        expected_bytes = requests * size + UPLOAD_BYTES + upload_response_bytes
+        print(f"metered: {usage.access_count} accesses, {usage.bytes_transferred:,} bytes "
+              f"({'ok' if usage.bytes_transferred == expected_bytes else f'expected {expected_bytes:,}'})")
+
+    connector_server.should_exit = True
+    await connector_task
+    upstream.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 256 * 1024,
+    ))
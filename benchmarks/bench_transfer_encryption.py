@@ -0,0 +1,297 @@
+"""
+基准测试：数据平面传输加密（tds-aes256gcm-v1）
+
+- 文件：从临时文件读取的吞吐量作为参照，对比单线程 AES-GCM 与 StreamEncryptor 在不同
+  线程数下加密同一文件的吞吐量（多核机器上随线程数增长，接近读取速度；单核机器上线程数
+  不会带来提升）；
+- 参考客户端（decrypt_client.py）解密后 SHA-256 与原文一致，篡改、截断、重排帧和追加数据
+  都会被拒绝；
+- 端到端：替身上游（独立进程）返回文件内容，合约固定的模板版本带 encryption 规则，经连接器
+  （uvicorn）代理下载，参考客户端解密后比对 SHA-256，Content-Length 与密文长度一致，合约记录
+  的是明文字节数。
+
+运行: python -m benchmarks.bench_transfer_encryption [文件 MiB] [分块 KiB]
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+if len(sys.argv) > 2:
+    os.environ["TRANSFER_ENCRYPTION_CHUNK_SIZE"] = str(int(sys.argv[2]) * 1024)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+import decrypt_client  # noqa: E402
+import init_db  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, User  # noqa: E402
+from app.services.metering import usage_meter  # noqa: E402
+from app.services.transfer_encryption import (  # noqa: E402
+    FRAME_LENGTH,
+    HEADER,
+    StreamEncryptor,
+    contract_key,
+    encrypted_length,
+)
+
+READ_SIZE = 1024 * 1024
+
+
+async def read_file(path: str):
+    with open(path, "rb") as file:
+        while chunk := file.read(READ_SIZE):
+            yield chunk
+
+
+def frames(ciphertext: bytes) -> tuple[bytes, list[bytes]]:
+    """把密文流拆成 (头部, 帧列表)，用于篡改测试"""
+    header, offset, result = ciphertext[:HEADER.size], HEADER.size, []
+    while offset < len(ciphertext):
+        (length,) = FRAME_LENGTH.unpack_from(ciphertext, offset)
+        end = offset + FRAME_LENGTH.size + length
+        result.append(ciphertext[offset:end])
+        offset = end
+    return header, result
+
+
+def rejected(key: bytes, ciphertext: bytes) -> bool:
+    try:
+        decrypt_client.decrypt(key, ciphertext)
+    except decrypt_client.DecryptionError:
+        return True
+    return False
+
+
+class Upstream:
+    """替身上游：/api/file 返回文件内容"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] != "/api/file":
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/x-ndjson"),
+                (b"content-length", str(os.path.getsize(self.path)).encode()),
+            ],
+        })
+        async for chunk in read_file(self.path):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_upstream(port: int, path: str) -> None:
+    uvicorn.run(Upstream(path), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_upstream(port: int, path: str) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_upstream, args=(port, path), daemon=True)
+    process.start()
+    while True:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port)):
+            return process
+        time.sleep(0.05)
+
+
+async def populate(upstream_port: int) -> tuple[str, User]:
+    """返回 (active 合约 ID, 消费者用户)；合约模板为种子模板，带 encryption 规则"""
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+
+        offering_id = str(uuid.uuid4())
+        await session.execute(insert(DataOffering).values(
+            id=offering_id,
+            title="bench encrypted api",
+            description="bench",
+            data_type="restful",
+            access_policy="Restricted",
+            storage_meta={"api_endpoint": f"http://127.0.0.1:{upstream_port}/api"},
+            connector_id=provider.id,
+        ))
+        contract_id = str(uuid.uuid4())
+        await session.execute(insert(Contract).values(
+            id=contract_id,
+            name="bench",
+            status="active",
+            provider_connector_id=provider.id,
+            consumer_connector_id=consumer.id,
+            contract_template_id=template.id,
+            data_offering_id=offering_id,
+        ))
+        await session.commit()
+        return contract_id, bob
+
+
+async def bench_file(path: str, size: int, chunk_size: int) -> None:
+    mib = size / 2 ** 20
+    print(f"file: {mib:,.0f} MiB, chunk size: {chunk_size // 1024} KiB, CPUs: {os.cpu_count()}")
+
+    started = time.perf_counter()
+    async for _ in read_file(path):
+        pass
+    print(f"read only:            {mib / (time.perf_counter() - started):>8,.0f} MiB/s (baseline)")
+
+    aead, nonce = AESGCM(os.urandom(32)), os.urandom(12)
+    block = os.urandom(chunk_size)
+    started = time.perf_counter()
+    for _ in range(size // chunk_size):
+        aead.encrypt(nonce, block, None)
+    print(f"AES-GCM, 1 thread:    {mib / (time.perf_counter() - started):>8,.0f} MiB/s (no I/O)")
+
+    key = contract_key("bench")
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with ThreadPoolExecutor(workers) as executor:
+            encryptor = StreamEncryptor(executor, chunk_size, window=workers * 2)
+            total = 0
+            started = time.perf_counter()
+            async for chunk in encryptor.encrypt(key, read_file(path)):
+                total += len(chunk)
+            elapsed = time.perf_counter() - started
+        assert total == encrypted_length(size, chunk_size), total
+        print(f"read + encrypt, {workers:>2} workers: {mib / elapsed:>8,.0f} MiB/s")
+
+    # 参考客户端解密与篡改检测用较小的样本，完整密文放在内存中
+    sample = os.urandom(chunk_size * 5 + 123)
+    with ThreadPoolExecutor(2) as executor:
+        encryptor = StreamEncryptor(executor, chunk_size, window=4)
+
+        async def one_shot(data: bytes):
+            for start in range(0, len(data), 7000):
+                yield data[start:start + 7000]
+
+        ciphertext = b"".join([chunk async for chunk in encryptor.encrypt(key, one_shot(sample))])
+        exact = b"".join([chunk async for chunk in encryptor.encrypt(key, one_shot(sample[:chunk_size * 2]))])
+        empty = b"".join([chunk async for chunk in encryptor.encrypt(key, one_shot(b""))])
+    print(f"reference client: decrypt {'ok' if decrypt_client.decrypt(key, ciphertext) == sample else 'MISMATCH'}, "
+          f"exact multiple of chunk size "
+          f"{'ok' if decrypt_client.decrypt(key, exact) == sample[:chunk_size * 2] else 'MISMATCH'}, "
+          f"empty {'ok' if decrypt_client.decrypt(key, empty) == b'' else 'MISMATCH'}")
+
+    header, parts = frames(ciphertext)
+    tampered = bytearray(ciphertext)
+    tampered[HEADER.size + FRAME_LENGTH.size + chunk_size + 10] ^= 1
+    checks = {
+        "flipped bit": bytes(tampered),
+        "truncated after a frame": header + b"".join(parts[:-1]),
+        "reordered frames": header + parts[1] + parts[0] + b"".join(parts[2:]),
+        "trailing data": ciphertext + parts[-1],
+        "wrong key": None,
+    }
+    results = []
+    for name, data in checks.items():
+        if data is None:
+            ok = rejected(contract_key("other"), ciphertext)
+        else:
+            ok = rejected(key, data)
+        results.append(f"{name} {'rejected' if ok else 'ACCEPTED'}")
+    print("tampering: " + ", ".join(results))
+
+
+async def bench_end_to_end(path: str, size: int, expected_sha256: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    upstream_port, connector_port = free_port(), free_port()
+    upstream = start_upstream(upstream_port, path)
+    contract_id, consumer = await populate(upstream_port)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=connector_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{connector_port}", timeout=120) as client:
+        login = await client.post("/api/v1/auth/login", json={"did": consumer.did, "signature": "x"})
+        client.headers["Authorization"] = f"Bearer {login.json()['token']}"
+        proxy = f"/api/v1/data-plane/contracts/{contract_id}/proxy/file"
+
+        async with client.stream("GET", proxy) as response:
+            headers = response.headers
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+        print(f"end to end: {headers.get('x-transfer-encryption')}, "
+              f"payload content-type {headers.get('x-payload-content-type')}, "
+              f"content-length {'ok' if int(headers['content-length']) == received else 'MISMATCH'}")
+
+        digest = hashlib.sha256()
+
+        class Sink:
+            def write(self, data: bytes) -> None:
+                digest.update(data)
+
+        started = time.perf_counter()
+        written = await decrypt_client.download(client, contract_id, "proxy/file", Sink())
+        elapsed = time.perf_counter() - started
+        print(f"proxied + encrypted + decrypted: {written / elapsed / 2 ** 20:>8,.0f} MiB/s, "
+              f"sha256 {'ok' if digest.hexdigest() == expected_sha256 else 'MISMATCH'}")
+
+        await usage_meter.flush()
+        async with SessionLocal() as session:
+            usage = await usage_meter.get_usage(session, contract_id)
+        print(f"metered: {usage.bytes_transferred:,} bytes "
+              f"({'ok, plaintext' if usage.bytes_transferred == 2 * size else f'expected {2 * size:,}'})")
+
+    server.should_exit = True
+    await server_task
+    upstream.terminate()
+
+
+async def main(mib: int) -> None:
+    chunk_size = settings.transfer_encryption_chunk_size
+    size = mib * 2 ** 20
+    # 每 MiB 内容不同，重排或重复帧都会改变 SHA-256
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(dir=_db_dir)
+    with os.fdopen(fd, "wb") as file:
+        block = os.urandom(READ_SIZE)
+        for index in range(mib):
+            data = index.to_bytes(8, "big") + block[8:]
+            file.write(data)
+            digest.update(data)
+    await bench_file(path, size, chunk_size)
+    await bench_end_to_end(path, size, digest.hexdigest())
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 256))
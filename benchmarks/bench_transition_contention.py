@@ -0,0 +1,194 @@
+"""
+基准测试：并发状态迁移（同意 / 拒绝数据请求、确认 / 拒绝合约）
+
+使用临时 SQLite 数据库写入 N 个 pending 数据请求和 N 个 pending_consumer 合约，
+对每个对象同时发起 K 个相互冲突的请求（同意与拒绝混合），通过 ASGI 进程内调用。
+条件更新保证每个对象只有一个请求成功，其余得到 409（或读取时已不是 pending 的 400）。
+
+统计吞吐量、各状态码数量、成功次数不为 1 的对象数，以及写事务持有写锁的时间
+（从第一条写语句到提交 / 回滚）。
+
+运行: python -m benchmarks.bench_transition_contention [对象数] [每个对象的并发请求数]
+"""
+import asyncio
+import collections
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert, select  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, Contract, ContractTemplate, DataOffering, DataRequest, User  # noqa: E402
+
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+class LockTimer:
+    """按连接记录第一条写语句到提交 / 回滚的耗时"""
+
+    def __init__(self):
+        self.started: dict[int, float] = {}
+        self.holds: list[float] = []
+
+    def before_execute(self, conn, cursor, statement, *args):
+        key = id(conn.connection.dbapi_connection)
+        if key not in self.started and statement.lstrip().upper().startswith(WRITES):
+            self.started[key] = time.perf_counter()
+
+    def end(self, conn):
+        started = self.started.pop(id(conn.connection.dbapi_connection), None)
+        if started is not None:
+            self.holds.append((time.perf_counter() - started) * 1000)
+
+    def attach(self) -> None:
+        event.listen(engine.sync_engine, "before_cursor_execute", self.before_execute)
+        event.listen(engine.sync_engine, "commit", self.end)
+        event.listen(engine.sync_engine, "rollback", self.end)
+
+    def detach(self) -> None:
+        event.remove(engine.sync_engine, "before_cursor_execute", self.before_execute)
+        event.remove(engine.sync_engine, "commit", self.end)
+        event.remove(engine.sync_engine, "rollback", self.end)
+
+
+async def populate(objects: int) -> tuple[list[str], list[str], User, User]:
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+
+        offering_ids = [str(uuid.uuid4()) for _ in range(objects)]
+        await session.execute(insert(DataOffering), [
+            {
+                "id": offering_id,
+                "title": f"offering {i}",
+                "description": "bench",
+                "data_type": "file",
+                "access_policy": "Restricted",
+                "storage_meta": {},
+                "connector_id": provider.id,
+            }
+            for i, offering_id in enumerate(offering_ids)
+        ])
+        request_ids = [str(uuid.uuid4()) for _ in range(objects)]
+        await session.execute(insert(DataRequest), [
+            {
+                "id": request_id,
+                "purpose": "bench",
+                "access_mode": "download",
+                "status": "pending",
+                "data_offering_id": offering_id,
+                "consumer_connector_id": consumer.id,
+            }
+            for request_id, offering_id in zip(request_ids, offering_ids)
+        ])
+        contract_ids = [str(uuid.uuid4()) for _ in range(objects)]
+        await session.execute(insert(Contract), [
+            {
+                "id": contract_id,
+                "name": f"bench {i}",
+                "status": "pending_consumer",
+                "provider_connector_id": provider.id,
+                "consumer_connector_id": consumer.id,
+                "contract_template_id": template.id,
+                "data_offering_id": offering_ids[i],
+            }
+            for i, contract_id in enumerate(contract_ids)
+        ])
+        await session.commit()
+        return request_ids, contract_ids, alice, bob
+
+
+async def contend(client: httpx.AsyncClient, name: str, calls: list, concurrency: int) -> None:
+    """calls: [(对象 ID, 发起请求的协程函数)]，每个对象的请求同时发出"""
+    timer = LockTimer()
+    statuses = collections.Counter()
+    successes = collections.Counter()
+    latencies = []
+
+    async def call(object_id, request):
+        started = time.perf_counter()
+        response = await request()
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            successes[object_id] += 1
+
+    timer.attach()
+    started = time.perf_counter()
+    # 按对象分组，每组 concurrency 个冲突请求一起发出
+    for i in range(0, len(calls), concurrency):
+        await asyncio.gather(*(call(object_id, request) for object_id, request in calls[i:i + concurrency]))
+    elapsed = time.perf_counter() - started
+    timer.detach()
+
+    objects = {object_id for object_id, _ in calls}
+    wrong = sum(1 for object_id in objects if successes[object_id] != 1)
+    holds = sorted(timer.holds)
+    print(f"{name}: {len(calls)} requests in {elapsed:.2f}s ({len(calls) / elapsed:.0f} req/s, "
+          f"{sum(successes.values()) / elapsed:.0f} transitions/s)")
+    print(f"  status codes: {dict(sorted(statuses.items()))}, objects without exactly one success: {wrong}")
+    print(f"  latency ms: median {statistics.median(latencies):.1f}, max {max(latencies):.1f}")
+    print(f"  write lock hold ms: median {statistics.median(holds):.2f}, "
+          f"p95 {holds[int(len(holds) * 0.95)]:.2f}, max {holds[-1]:.2f} ({len(holds)} write transactions)")
+
+
+async def main(objects: int, contenders: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+    request_ids, contract_ids, alice, bob = await populate(objects)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def login(user: User) -> dict:
+                response = await client.post("/api/v1/auth/login", json={"did": user.did, "signature": "x"})
+                return {"Authorization": f"Bearer {response.json()['token']}"}
+
+            provider_headers = await login(alice)
+            consumer_headers = await login(bob)
+            print(f"objects: {objects}, concurrent conflicting requests per object: {contenders}")
+
+            await contend(client, "data requests", [
+                (request_id, lambda request_id=request_id, action=("approve", "reject")[i % 2]: client.put(
+                    f"/api/v1/data-requests/{request_id}/{action}", headers=provider_headers
+                ))
+                for request_id in request_ids
+                for i in range(contenders)
+            ], contenders)
+
+            await contend(client, "contracts", [
+                (contract_id, lambda contract_id=contract_id, action=("confirm", "reject")[i % 2]: client.put(
+                    f"/api/v1/contracts/{contract_id}/confirm", json={"action": action}, headers=consumer_headers
+                ))
+                for contract_id in contract_ids
+                for i in range(contenders)
+            ], contenders)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+    ))
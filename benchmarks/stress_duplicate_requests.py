@@ -0,0 +1,92 @@
+"""
+并发压测：同一消费者对同一数据资源重复提交 POST /api/v1/data-requests
+
+使用临时 SQLite 数据库，在进程内通过 ASGI 并发提交相同的数据请求，
+校验最终只有一个 pending 请求，且所有成功响应返回的都是该请求。
+
+运行: python -m benchmarks.stress_duplicate_requests [并发请求数]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/stress.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, DataOffering, DataRequest, User  # noqa: E402
+
+
+async def main(requests: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        offering = (await session.execute(
+            select(DataOffering).where(DataOffering.connector_id == provider.id)
+        )).scalars().first()
+        # 从没有请求的状态开始
+        await session.execute(delete(DataRequest).where(
+            DataRequest.consumer_connector_id == consumer.id,
+            DataRequest.data_offering_id == offering.id,
+        ))
+        await session.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+            login = await client.post("/api/v1/auth/login", json={"did": bob.did, "signature": "x"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+            body = {
+                "data_offering_id": offering.id,
+                "consumer_connector_id": consumer.id,
+                "purpose": "stress",
+                "access_mode": "api",
+            }
+            responses = await asyncio.gather(*[
+                client.post("/api/v1/data-requests", json=body, headers=headers)
+                for _ in range(requests)
+            ])
+
+    ok = [response for response in responses if response.status_code == 200]
+    returned_ids = {response.json()["id"] for response in ok}
+    async with SessionLocal() as session:
+        pending = (await session.execute(
+            select(func.count()).select_from(DataRequest).where(
+                DataRequest.consumer_connector_id == consumer.id,
+                DataRequest.data_offering_id == offering.id,
+                DataRequest.status == "pending",
+            )
+        )).scalar_one()
+
+    print(f"requests: {requests}, succeeded: {len(ok)}, distinct ids returned: {len(returned_ids)}")
+    print(f"pending rows: {pending} (expected 1)")
+    if len(ok) != requests:
+        statuses = sorted({response.status_code for response in responses})
+        print(f"FAILED: {requests - len(ok)} requests did not succeed (statuses {statuses})")
+        sys.exit(1)
+    if pending != 1 or len(returned_ids) != 1:
+        print("FAILED: duplicate pending requests")
+        sys.exit(1)
+    print("OK: exactly one pending request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
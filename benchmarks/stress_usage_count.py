@@ -0,0 +1,144 @@
+"""
+并发压测：ContractTemplate.usage_count 在并发创建合约时不丢失计数
+
+使用临时 SQLite 数据库：
+
+- 对照：并发任务分别用读-改-写（读取在独立的事务中完成，与写入之间有其他任务提交）和
+  原子 UPDATE 增加计数，前者丢失计数，后者不丢失；SQLite 在同一事务内读后写时会因
+  其他写者已提交而报 "database is locked"，而不是丢失计数，因此对照中读取单独提交；
+- 在进程内通过 ASGI 并发调用 POST /api/v1/contracts，要求全部返回 200，
+  且 usage_count 的增量等于请求数。
+
+运行: python -m benchmarks.stress_usage_count [并发请求数]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from collections import Counter
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/stress.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import select, update  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, ContractTemplate, DataOffering, User  # noqa: E402
+
+# 对照只需说明丢失计数，不需要与接口压测同样的并发
+COMPARE_TASKS = 50
+
+
+async def read_modify_write(template_id: str) -> None:
+    async with SessionLocal() as session:
+        template = await session.get(ContractTemplate, template_id)
+        await session.commit()
+        # 其他任务在读取与写入之间提交
+        await asyncio.sleep(0)
+        template.usage_count += 1
+        session.add(template)
+        await session.commit()
+
+
+async def atomic_update(template_id: str) -> None:
+    async with SessionLocal() as session:
+        await session.execute(
+            update(ContractTemplate)
+            .where(ContractTemplate.id == template_id)
+            .values(usage_count=ContractTemplate.usage_count + 1)
+        )
+        await session.commit()
+
+
+async def compare(template_id: str, requests: int) -> bool:
+    """两种写法各由 requests 个并发任务增加一次，返回原子 UPDATE 是否不丢失计数"""
+    ok = True
+    for name, increment in (("read-modify-write", read_modify_write), ("atomic UPDATE", atomic_update)):
+        async with SessionLocal() as session:
+            before = (await session.get(ContractTemplate, template_id)).usage_count
+        await asyncio.gather(*[increment(template_id) for _ in range(requests)])
+        async with SessionLocal() as session:
+            after = (await session.execute(
+                select(ContractTemplate.usage_count).where(ContractTemplate.id == template_id)
+            )).scalar_one()
+        print(f"{name + ':':<19} {after - before} of {requests} increments kept")
+        if increment is atomic_update:
+            ok = after - before == requests
+    return ok
+
+
+async def main(requests: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    async with SessionLocal() as session:
+        alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+        bob = (await session.execute(select(User).where(User.username == "Bob"))).scalar_one()
+        provider = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == alice.id)
+        )).scalars().first()
+        consumer = (await session.execute(
+            select(Connector).where(Connector.owner_user_id == bob.id)
+        )).scalars().first()
+        template = (await session.execute(
+            select(ContractTemplate).where(ContractTemplate.connector_id == provider.id)
+        )).scalars().first()
+        offering = (await session.execute(
+            select(DataOffering).where(DataOffering.connector_id == provider.id)
+        )).scalars().first()
+
+    compared = await compare(template.id, COMPARE_TASKS)
+
+    # 未处理的异常按 500 计入失败，而不是中断压测
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        # 启动时按合约数重建 usage_count（对照中的自增被覆盖），之后再读取初始值
+        async with SessionLocal() as session:
+            initial = (await session.get(ContractTemplate, template.id)).usage_count
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+            login = await client.post("/api/v1/auth/login", json={"did": alice.did, "signature": "x"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+            body = {
+                "name": "stress",
+                "provider_connector_id": provider.id,
+                "consumer_connector_id": consumer.id,
+                "contract_template_id": template.id,
+                "data_offering_id": offering.id,
+            }
+            responses = await asyncio.gather(*[
+                client.post("/api/v1/contracts", json=body, headers=headers)
+                for _ in range(requests)
+            ])
+
+    created = sum(1 for response in responses if response.status_code == 200)
+    failures = Counter(
+        f"{response.status_code} {response.text[:120]}" for response in responses if response.status_code != 200
+    )
+    async with SessionLocal() as session:
+        final = (await session.execute(
+            select(ContractTemplate.usage_count).where(ContractTemplate.id == template.id)
+        )).scalar_one()
+
+    print(f"requests: {requests}, created: {created}")
+    for failure, count in failures.most_common():
+        print(f"  {count} x {failure}")
+    print(f"usage_count: {initial} -> {final} (expected {initial + requests})")
+    if not compared:
+        print("FAILED: atomic UPDATE lost increments")
+        sys.exit(1)
+    if created != requests:
+        print("FAILED: not every contract was created")
+        sys.exit(1)
+    if final != initial + requests:
+        print("FAILED: increments were lost")
+        sys.exit(1)
+    print("OK: every contract created, no increments lost")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
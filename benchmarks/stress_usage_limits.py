@@ -0,0 +1,76 @@
+"""
+并发压测：POST /api/v1/contracts/{id}/usage 在并发上报时不超出 access_count 上限
+
+使用临时 SQLite 数据库，种子合约固定的模板版本带 access_count 规则（上限 N）。
+在进程内通过 ASGI 并发上报多于 N 次访问，同时以很短的间隔后台刷盘，使检查与刷盘交错；
+校验恰好 N 次上报成功、其余返回 429，且刷盘后落库的访问次数等于 N。
+
+运行: python -m benchmarks.stress_usage_limits [并发请求数]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/stress.db"
+os.environ["METERING_FLUSH_INTERVAL_SECONDS"] = "0.01"
+
+import httpx  # noqa: E402
+from sqlalchemy import select, update  # noqa: E402
+
+import init_db  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Connector, Contract, User  # noqa: E402
+from app.services.metering import load_usage_limits, usage_meter  # noqa: E402
+
+
+async def main(requests: int) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db.init_database()
+        await init_db.seed_data()
+
+    transport = httpx.ASGITransport(app=app)
+    # 启动时合约被固定到种子模板的当前版本，带 access_count 规则
+    async with app.router.lifespan_context(app):
+        async with SessionLocal() as session:
+            alice = (await session.execute(select(User).where(User.username == "Alice"))).scalar_one()
+            contract = (await session.execute(
+                select(Contract)
+                .join(Connector, Connector.id == Contract.provider_connector_id)
+                .where(Connector.owner_user_id == alice.id)
+            )).scalars().first()
+            await session.execute(update(Contract).where(Contract.id == contract.id).values(status="active"))
+            await session.commit()
+            limit, _ = await load_usage_limits(session, contract.id)
+        if limit is None or requests <= limit:
+            print(f"FAILED: need an access_count limit below {requests} requests (limit: {limit})")
+            sys.exit(1)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+            login = await client.post("/api/v1/auth/login", json={"did": alice.did, "signature": "x"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+            responses = await asyncio.gather(*[
+                client.post(f"/api/v1/contracts/{contract.id}/usage", json={"bytes_transferred": 1}, headers=headers)
+                for _ in range(requests)
+            ])
+        await usage_meter.flush()
+        async with SessionLocal() as session:
+            usage = await usage_meter.get_usage(session, contract.id)
+
+    accepted = sum(response.status_code == 200 for response in responses)
+    rejected = sum(response.status_code == 429 for response in responses)
+    print(f"requests: {requests}, access_count limit: {limit}")
+    print(f"accepted: {accepted}, rejected (429): {rejected}, other: {requests - accepted - rejected}")
+    print(f"stored: {usage.access_count} accesses, {usage.bytes_transferred} bytes")
+    if accepted != limit or rejected != requests - limit or usage.access_count != limit:
+        print("FAILED: usage limit overshot or undercounted")
+        sys.exit(1)
+    print("OK: exactly the limit was accepted")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1500))
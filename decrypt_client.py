@@ -0,0 +1,148 @@
+"""
+传输加密参考客户端（tds-aes256gcm-v1）
+合约带 encryption 规则时，数据平面的下载流由连接器加密；本脚本获取合约密钥、下载并解密，
+只依赖 httpx 与 cryptography，格式说明见 app/services/transfer_encryption.py。
+
+运行:
+    python decrypt_client.py <token> <contract_id> object <输出文件>
+    python decrypt_client.py <token> <contract_id> proxy/<path> <输出文件>
+"""
+import asyncio
+import base64
+import struct
+import sys
+
+import httpx
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+BASE_URL = "http://localhost:8085"
+API_PREFIX = "/api/v1"
+
+ALGORITHM = "tds-aes256gcm-v1"
+MAGIC = b"TDSE"
+VERSION = 1
+HEADER = struct.Struct(">4sBI16s7s")
+FRAME_LENGTH = struct.Struct(">I")
+TAG_SIZE = 16
+
+
+class DecryptionError(Exception):
+    pass
+
+
+class StreamDecryptor:
+    """增量解密：feed() 传入任意切分的密文，返回已校验的明文；finish() 确认流完整结束"""
+
+    def __init__(self, key: bytes):
+        self.key = key
+        self.buffer = bytearray()
+        self.header: bytes | None = None
+        self.aead: AESGCM | None = None
+        self.nonce_prefix = b""
+        self.chunk_size = 0
+        self.index = 0
+        self.finished = False
+
+    def _open_header(self) -> None:
+        self.header = bytes(self.buffer[:HEADER.size])
+        del self.buffer[:HEADER.size]
+        magic, version, self.chunk_size, salt, self.nonce_prefix = HEADER.unpack(self.header)
+        if magic != MAGIC or version != VERSION:
+            raise DecryptionError("Not a tds-aes256gcm-v1 stream")
+        stream_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"tds-stream:v1").derive(self.key)
+        self.aead = AESGCM(stream_key)
+
+    def _open_frame(self, ciphertext: bytes, last: bool) -> bytes:
+        nonce = self.nonce_prefix + struct.pack(">IB", self.index, last)
+        try:
+            return self.aead.decrypt(nonce, ciphertext, self.header)
+        except Exception:
+            raise DecryptionError(f"Frame {self.index} failed authentication")
+
+    def feed(self, data: bytes) -> bytes:
+        if self.finished and data:
+            raise DecryptionError("Trailing data after the last frame")
+        self.buffer += data
+        if self.header is None:
+            if len(self.buffer) < HEADER.size:
+                return b""
+            self._open_header()
+        plaintext = bytearray()
+        while not self.finished and len(self.buffer) >= FRAME_LENGTH.size:
+            (length,) = FRAME_LENGTH.unpack_from(self.buffer)
+            if length < TAG_SIZE or length > self.chunk_size + TAG_SIZE:
+                raise DecryptionError(f"Invalid frame length {length}")
+            end = FRAME_LENGTH.size + length
+            if len(self.buffer) < end:
+                break
+            ciphertext = bytes(self.buffer[FRAME_LENGTH.size:end])
+            del self.buffer[:end]
+            # 满长度的帧只能是中间帧，更短的帧只能是最后一帧；最后一帧恰好满长度时按中间帧校验失败再试一次
+            if length == self.chunk_size + TAG_SIZE:
+                try:
+                    plaintext += self._open_frame(ciphertext, last=False)
+                except DecryptionError:
+                    plaintext += self._open_frame(ciphertext, last=True)
+                    self.finished = True
+            else:
+                plaintext += self._open_frame(ciphertext, last=True)
+                self.finished = True
+            self.index += 1
+        if self.finished and self.buffer:
+            raise DecryptionError("Trailing data after the last frame")
+        return bytes(plaintext)
+
+    def finish(self) -> None:
+        if not self.finished:
+            raise DecryptionError("Stream truncated before the last frame")
+
+
+def decrypt(key: bytes, data: bytes) -> bytes:
+    decryptor = StreamDecryptor(key)
+    plaintext = decryptor.feed(data)
+    decryptor.finish()
+    return plaintext
+
+
+async def fetch_key(client: httpx.AsyncClient, contract_id: str) -> bytes:
+    response = await client.get(f"{API_PREFIX}/data-plane/contracts/{contract_id}/transfer-key")
+    response.raise_for_status()
+    body = response.json()
+    if body["algorithm"] != ALGORITHM:
+        raise DecryptionError(f"Unsupported algorithm {body['algorithm']}")
+    return base64.b64decode(body["key"])
+
+
+async def download(client: httpx.AsyncClient, contract_id: str, resource: str, output) -> int:
+    """下载 object 或 proxy/<path> 并写入 output，返回明文字节数；未加密的响应原样写入"""
+    url = f"{API_PREFIX}/data-plane/contracts/{contract_id}/{resource}"
+    written = 0
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        decryptor = None
+        if response.headers.get("x-transfer-encryption") == ALGORITHM:
+            decryptor = StreamDecryptor(await fetch_key(client, contract_id))
+        async for chunk in response.aiter_bytes():
+            plaintext = decryptor.feed(chunk) if decryptor else chunk
+            output.write(plaintext)
+            written += len(plaintext)
+        if decryptor:
+            decryptor.finish()
+    return written
+
+
+async def main(token: str, contract_id: str, resource: str, path: str) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=BASE_URL, headers=headers, timeout=60) as client:
+        with open(path, "wb") as output:
+            written = await download(client, contract_id, resource, output)
+    print(f"{written:,} bytes written to {path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(*sys.argv[1:]))